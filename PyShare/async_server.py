@@ -0,0 +1,160 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import asyncio
+import logging
+import multiprocessing
+
+# Project imports
+from server import CryptoServer
+from utils.stockings.aio import AsyncServerStocking
+from utils.crypto.rsa_aes import RSA_AES
+from utils.crypto.offload import CryptoPool
+
+
+class AsyncCryptoServer(CryptoServer):
+    """
+    CryptoServer which serves every connection from a single asyncio event loop, rather than a thread per connection.
+
+    Each connection is an AsyncServerStocking whose handshake and message dispatch run as coroutines on the loop.
+    """
+
+    # asyncio event loop the server runs on
+    eventLoop = None
+    # asyncio.Server accepting connections
+    asyncServer = None
+    # asyncio.TimerHandle which will advance our timer wheel at its next deadline
+    timerHandle = None
+    # utils.crypto.offload.CryptoPool which handshake cryptography is handed off to
+    cryptoPool = None
+
+    # Number of unaccepted connections the listening socket will queue
+    BACKLOG = 1024
+
+    def initLoop(self):
+        self.eventLoop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.eventLoop)
+
+        # Workers of a Supervisor are daemonic and cannot start processes of their own, but already spread handshakes
+        # over several processes
+        if self.config.handshake_workers > 0 and not multiprocessing.current_process().daemon:
+            self.cryptoPool = CryptoPool(self.config.handshake_workers, self.config.handshake_queue_length)
+        self.asyncServer = self.eventLoop.run_until_complete(self.eventLoop.create_server(
+            self.newSession, self.addr[0], self.addr[1], reuse_address=True, reuse_port=self.shard is not None,
+            backlog=self.BACKLOG
+        ))
+
+        if self.shard is not None:
+            self.eventLoop.add_reader(self.shard.fileno(), self.shardReadable)
+        logging.info("Server starting on %s:%s using asyncio" % self.addr)
+
+    def stopListening(self):
+        self.asyncServer.close()
+
+    def closeLoop(self):
+        self.eventLoop.run_until_complete(self.asyncServer.wait_closed())
+        self.eventLoop.close()
+
+        if self.cryptoPool is not None:
+            self.cryptoPool.close()
+
+    def newSession(self):
+        """ Protocol factory creating an AsyncServerStocking for each accepted connection. """
+
+        return AsyncServerStocking(self, self._getUniqueID(), RSA_AES())
+
+    def sessionConnected(self, session):
+        """ Called by a session once its connection has been established. """
+
+        self.cache.newUser(session)
+        session.handshakeTimer = self.timers.schedule(
+            self.config.inactive_disconnect_period, self.expireHandshake, session
+        )
+        logging.info("%s:%s Has connected." % session.addr[:2])
+
+        self.settle()
+
+    def sessionFailed(self, session):
+        """ Called by a session whose handshake failed. """
+
+        if session.userID in self.cache.unauthenticated:
+            self.dropSession(session)
+
+        self.settle()
+
+    def sessionLost(self, session):
+        """ Called by a session whose connection has been lost. """
+
+        if session.userID in self.cache.authenticated:
+            self.disconnect(session)
+
+        elif session.userID in self.cache.unauthenticated:
+            self.dropSession(session)
+
+        self.settle()
+
+    def sessionCongestionChanged(self, session):
+        """ Called by a session which has fallen behind in receiving what we send it, or has caught back up. """
+
+        if session.congested:
+            logging.debug("%s:%s Is congested; holding back presence updates." % session.addr[:2])
+
+        # Send the session the presence updates it missed while congested
+        elif session.userID in self.cache.authenticated and session.cacheVersion != self.cache.version:
+            self.cacheChanged = True
+            self.settle()
+
+    def shardReadable(self):
+        """ Called by the event loop when the other workers have relayed something to us. """
+
+        self.handleShardMessages()
+        self.settle()
+
+    def watchSession(self, session):
+        # Our sessions are watched by the event loop for as long as they are connected
+        pass
+
+    def unwatchSession(self, session):
+        pass
+
+    def settle(self):
+        super(AsyncCryptoServer, self).settle()
+
+        # Wake up again at the next deadline on our timer wheel
+        if self.timerHandle is not None:
+            self.timerHandle.cancel()
+            self.timerHandle = None
+
+        timeout = self.timers.nextTimeout()
+        if timeout is not None:
+            self.timerHandle = self.eventLoop.call_later(timeout, self.settle)
+
+    def loop(self):
+        """ Main handler. """
+
+        try:
+            self.eventLoop.run_forever()
+
+        except KeyboardInterrupt:
+            logging.info("Interrupt caught. Exiting...")
+
+        finally:
+            self.close()
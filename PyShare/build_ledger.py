@@ -0,0 +1,64 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import sys
+
+# Project imports
+from utils import config
+from utils.ledger import Ledger
+from utils.indexer import LedgerIndexer
+from utils.transfer import CHUNK_SIZE, PART_SUFFIX, SIDECAR_SUFFIX
+from utils.transfer.merkle import TreeCache
+from utils.transfer.bulk_hash import hashLedger, consoleReport
+
+
+def main():
+    """
+    Builds or brings up to date the ledger of the files in a client's share_dir, hashing every new or changed file.
+    The client then has nothing left to hash when it next shares its files.
+    """
+
+    clientConfig = config.client()
+    if not clientConfig.file_ledger_path or not clientConfig.share_dir:
+        sys.stderr.write("Both file_ledger_path and share_dir must be given.\n")
+        return 1
+
+    ledger = Ledger(clientConfig.file_ledger_path)
+    trees = TreeCache(clientConfig.file_ledger_path + '.trees')
+
+    indexer = LedgerIndexer(ledger, clientConfig.share_dir, (PART_SUFFIX, SIDECAR_SUFFIX), follow=False)
+    changed, removed = indexer.scan()
+    print("Indexed %s: %d files, %d new or changed, %d removed." % (
+        indexer.root, len(ledger), len(changed), len(removed)
+    ))
+
+    for name in removed:
+        trees.remove(name)
+
+    hasher = hashLedger(ledger, trees, CHUNK_SIZE, clientConfig.hash_processes, consoleReport)
+    print("Hashed %d files (%.1f MB) in %.1f seconds." % (hasher.files, hasher.bytes / 1e6, hasher.elapsed))
+
+    ledger.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,7 +20,11 @@
 
 # Standard imports
 import Tkinter
+import os
+import glob
 import time
+import struct
+from multiprocessing.pool import ThreadPool
 import socket
 import traceback
 import logging
@@ -29,26 +33,124 @@ import logging
 from utils.gui.loginFrame import LoginFrame
 from utils.gui.chatFrame import ChatFrame
 from utils.cache import ClientCache
+from utils.server_uid import ServerUID
+from utils.state_cache import StateCache, ServerState
 from utils import config
 from utils import constants
 from utils.stockings.client import ClientStocking
 from utils.crypto.rsa_aes import RSA_AES
+from utils.message import CryptoMessage
+from utils.ledger import Ledger
+from utils.indexer import LedgerIndexer
+from utils.transfer import CHUNK_SIZE, WINDOW, PART_SUFFIX, SIDECAR_SUFFIX
+from utils.transfer.receiver import FileReceiver
+from utils.transfer.sender import FileSender, LocalFile
+from utils.transfer.upload import hashFile
+from utils.transfer.sidecar import Sidecar
+from utils.transfer.merkle import TreeCache
+from utils.transfer.bulk_hash import hashLedger
+from utils.transfer.swarm import SwarmScheduler
 
 class ServerComm(object):
     """ Manages communication with the server. """
 
+    # Number of the files we share to describe to the server in each message
+    PUBLISH_BATCH_SIZE = 1000
+    # Minimum number of seconds between saves of our copies of the server's state
+    STATE_SAVE_INTERVAL = 30
+
     # A stocking to use to communicate with the server
     conn = None
     crypto = None
     handlers = None
     fMgr = None
     authenticating = False
+    # Tuple of the resumption ticket and secret the server last gave us, which lets us reconnect without a key exchange
+    resumptionTicket = None
+    # Dictionary mapping transferIDs to the destination path of each download we've requested, until the server offers
+    # it to us, after which they map to the utils.transfer.receiver.FileReceiver receiving it
+    downloads = None
+    # Dictionary mapping transferIDs to the (path, name, password, visible) tuple of each upload we've begun, and a
+    # dictionary mapping transferIDs to the utils.transfer.sender.FileSender sending each upload once the server has
+    # told us which chunks it needs
+    uploads = None
+    uploadSenders = None
+    # Counter used to identify our downloads and uploads
+    transferIDIncrementor = 1
+    # Dictionary mapping the queryIDs of our searches of the server's ledger to their results, once they arrive, and
+    # the counter used to identify our searches
+    searchResults = None
+    # Dictionary mapping the queryIDs of our searches of the files our peers share to (total, pages) tuples, where total
+    # is the number of files found and pages maps the numbers of the pages of results we've received to their contents
+    networkResults = None
+    # Dictionary mapping the (userID, prefix, after) tuple identifying each page of a ledger listing we've fetched to an
+    # (etag, entries, next) tuple holding the page, and a dictionary mapping the queryIDs of the pages we've asked for
+    # to the tuples identifying them.  See listLedger.
+    ledgerPages = None
+    listingQueries = None
+    queryIDIncrementor = 1
+    # List of the (senderID, transferID, index, chunk, proof) tuples of the chunks received since we last polled the
+    # server, and the multiprocessing.pool.ThreadPool they're verified on
+    receivedChunks = None
+    verifier = None
+    # Dictionary mapping the Merkle roots of the files we share with our peers to (MerkleTree, dict) tuples, where each
+    # dict maps the names of the files in our ledger with those contents to their FileMetadata
+    shares = None
+    # Dictionary mapping the names of the files we share to their Merkle roots
+    sharedRoots = None
+    # The utils.indexer.LedgerIndexer keeping our ledger in step with our share_dir, if we have one, and the
+    # utils.transfer.merkle.TreeCache of the files we share
+    indexer = None
+    shareTrees = None
+    # Dictionary mapping transferIDs to the (root, destination) tuple of each swarm download we've asked the server for
+    # the sources of, and a dictionary mapping transferIDs to the utils.transfer.swarm.SwarmScheduler of each swarm
+    # download once it has begun.  The FileReceivers of swarm downloads are kept in downloads.
+    swarmQueries = None
+    swarms = None
+    # utils.server_uid.ServerUID of the server, and the utils.state_cache.StateCache keeping our copies of its state
+    # between runs if we have a state_dir
+    serverUID = None
+    stateCache = None
+    # The (uid, version) stamp of the server's ledger when our pages of its listing were last revalidated
+    ledgerStamp = None
+    # Whether our pages of the server's ledger have changed since we last saved them, the epoch and version of our copy
+    # of the server's cache when we last saved it, and the time we last saved them at
+    stateChanged = False
+    savedCacheVersion = None
+    stateSaveTime = 0
 
     def __init__(self, fMgr):
         self.crypto = RSA_AES()
         self.handlers = dict()
+        self.downloads = dict()
+        self.uploads = dict()
+        self.uploadSenders = dict()
+        self.receivedChunks = []
+        self.searchResults = dict()
+        self.networkResults = dict()
+        self.ledgerPages = dict()
+        self.listingQueries = dict()
+        self.shares = dict()
+        self.sharedRoots = dict()
+        self.swarmQueries = dict()
+        self.swarms = dict()
         self.fMgr = fMgr
 
+        self.registerHandler(CryptoMessage.ROOM_KEY, self.registerRoomKey)
+        self.registerHandler(CryptoMessage.RESUMPTION_TICKET, self.registerResumptionTicket)
+        self.registerHandler(CryptoMessage.FILE_OFFER, self.beginDownload)
+        self.registerHandler(CryptoMessage.FILE_CHUNK, self.receiveChunk)
+        self.registerHandler(CryptoMessage.FILE_CANCEL, self.cancelTransfer)
+        self.registerHandler(CryptoMessage.UPLOAD_MISSING, self.beginUpload)
+        self.registerHandler(CryptoMessage.FILE_ACK, self.acknowledgeUploadChunk)
+        self.registerHandler(CryptoMessage.UPLOAD_COMPLETE, self.finishUpload)
+        self.registerHandler(CryptoMessage.LEDGER_RESULTS, self.receiveSearchResults)
+        self.registerHandler(CryptoMessage.NETWORK_RESULTS, self.receiveNetworkResults)
+        self.registerHandler(CryptoMessage.LEDGER_PAGE, self.receiveLedgerPage)
+        self.registerHandler(CryptoMessage.CACHE_RESUME, self.receiveResumedState)
+        self.registerHandler(CryptoMessage.FILE_SOURCES, self.beginSwarm)
+        self.registerHandler(CryptoMessage.PEER_CHUNK_REQUEST, self.servePeerChunks)
+
     def sendServerMessage(self, **kwargs):
         """
         Sends the server a message.
@@ -71,6 +173,846 @@ class ServerComm(object):
         else:
             logging.debug("Message with unknown action received: %s" % message.action)
 
+    def registerRoomKey(self, message):
+        """
+        Registers the key messages to a room we're in are encrypted with, as sent to us by the server.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the exported room key.
+        """
+
+        self.crypto.registerGroupKey(*message.data)
+
+    def registerResumptionTicket(self, message):
+        """
+        Stores the resumption ticket sent to us by the server, to present when we next connect.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the ticket and its secret.
+        """
+
+        self.resumptionTicket = tuple(message.data)
+
+    def download(self, name, password=None, destination=None):
+        """
+        Requests a file from the server's ledger.  If we've already received part of the file, only the chunks we're
+        missing are requested.
+
+        Inputs: name        - The name the file is shared under.
+                password    - The password of the file, if it has one.
+                destination - The path to save the file to.  Defaults to the file's name, in our download_dir.
+
+        Outputs: The transferID identifying the download.
+        """
+
+        transferID = self.transferIDIncrementor
+        self.transferIDIncrementor += 1
+
+        if destination is None:
+            destination = os.path.join(self.fMgr.config.download_dir, os.path.basename(name))
+
+        resume = None
+        sidecar = Sidecar.load(destination + PART_SUFFIX + SIDECAR_SUFFIX)
+        if sidecar is not None:
+            resume = (sidecar.chunkSize, sidecar.version, sidecar.missing())
+
+        self.downloads[transferID] = (destination, name, password)
+        self.sendServerMessage(action=CryptoMessage.FILE_REQUEST, data=(transferID, name, password, resume), flags=0)
+
+        return transferID
+
+    def searchLedger(self, text):
+        """
+        Searches the names of the files in the server's ledger.
+
+        Inputs: text - The words to search for.
+
+        Outputs: The queryID identifying the search.
+        """
+
+        queryID = self.queryIDIncrementor
+        self.queryIDIncrementor += 1
+
+        self.sendServerMessage(action=CryptoMessage.LEDGER_SEARCH, data=(queryID, text), flags=0)
+
+        return queryID
+
+    def receiveSearchResults(self, message):
+        """
+        Stores the results of a search of the server's ledger.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the queryID of the search, and
+                          a list of (name, size, protected) tuples describing the files found.
+        """
+
+        queryID, results = message.data
+        self.searchResults[queryID] = [tuple(result) for result in results]
+
+    def searchNetwork(self, text, prefix=False, page=0, queryID=None):
+        """
+        Searches the names of the files our peers share.  Files found can be downloaded with swarmDownload.
+
+        Inputs: text    - The text to search for.
+                prefix  - Whether the names found must begin with the text, rather than merely contain it.
+                page    - The number of the page of results to fetch, counting from 0.
+                queryID - The queryID of an earlier search to fetch another page of.  If not given, a new search is
+                          made.
+
+        Outputs: The queryID identifying the search.
+        """
+
+        if queryID is None:
+            queryID = self.queryIDIncrementor
+            self.queryIDIncrementor += 1
+
+        self.sendServerMessage(action=CryptoMessage.NETWORK_SEARCH, data=(queryID, text, prefix, page), flags=0)
+
+        return queryID
+
+    def receiveNetworkResults(self, message):
+        """
+        Stores a page of the results of a search of the files our peers share.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the queryID of the search, the
+                          total number of files found, the number of the page, and a list of (name, size, chunkSize,
+                          root, sources) tuples describing the files on the page.
+        """
+
+        queryID, total, page, results = message.data
+
+        # A page of results from a later moment than the others may overlap them, so a new total resets the pages
+        known = self.networkResults.get(queryID, None)
+        if known is None or known[0] != total:
+            known = (total, dict())
+            self.networkResults[queryID] = known
+
+        known[1][page] = [tuple(result) for result in results]
+
+    def listLedger(self, userID=None, after=None, prefix=''):
+        """
+        Fetches a page of a listing of the server's ledger, or of the files one of our peers shares, in order of name.
+        Pages are fetched one at a time as they're needed: the page following this one begins after the name given in
+        this page's next.  If we already have the page, the server only sends it again if it has changed.
+
+        Once it arrives, the page is stored in ledgerPages under (userID, prefix, after), as an (etag, entries, next)
+        tuple.  See CryptoServer.listLedger for the entries of each kind of listing.
+
+        Inputs: userID - The userID of the peer whose files to list.  The server's ledger is listed if not given.
+                after  - The name after which the page begins.  The page begins with the first file if not given.
+                prefix - If given, only files whose names begin with it are listed.
+
+        Outputs: The queryID identifying the request.
+        """
+
+        queryID = self.queryIDIncrementor
+        self.queryIDIncrementor += 1
+
+        key = (userID, prefix, after)
+        cached = self.ledgerPages.get(key, None)
+
+        self.listingQueries[queryID] = key
+        self.sendServerMessage(
+            action = CryptoMessage.LEDGER_LIST,
+            data = (queryID, userID, after, prefix, None if cached is None else cached[0]),
+            flags = 0
+        )
+
+        return queryID
+
+    def receiveLedgerPage(self, message):
+        """
+        Stores a page of a ledger listing.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the queryID of the request,
+                          the page's ETag, its entries, or None if our copy of the page is current, and the name after
+                          which the next page begins, or None if this is the last page.
+        """
+
+        queryID, etag, entries, following = message.data
+
+        key = self.listingQueries.pop(queryID, None)
+        if key is None or entries is None:
+            return
+
+        self.ledgerPages[key] = (etag, [tuple(entry) for entry in entries], following)
+        self.stateChanged = self.stateChanged or key[0] is None
+
+    def loadState(self):
+        """
+        Restores our copies of the server's cache and of the pages of its ledger's listing from our state_dir, the first
+        time we connect to the server.
+        """
+
+        if self.serverUID is not None:
+            return
+
+        # We know the server only by its address, which doubles as its name
+        conf = self.fMgr.config
+        self.serverUID = ServerUID(conf.server_ip, conf.server_ip, conf.server_port)
+
+        if not conf.state_dir:
+            return
+
+        self.stateCache = StateCache(conf.state_dir)
+        state = self.stateCache.load(self.serverUID)
+
+        if state.cache is not None:
+            self.fMgr.cache.fromString(state.cache)
+            self.savedCacheVersion = (self.fMgr.cache.epoch, self.fMgr.cache.version)
+
+        self.ledgerStamp = state.ledgerStamp
+        for (prefix, after), page in state.pages.items():
+            self.ledgerPages[(None, prefix, after)] = page
+
+    def resumeState(self):
+        """
+        Tells the server, once we've connected to it, which versions of its state we have, so that it need only send
+        us what has changed since.  See CryptoServer.resumeState.
+        """
+
+        pages = [(prefix, after, page[0]) for (userID, prefix, after), page in self.ledgerPages.items()
+                 if userID is None]
+
+        self.sendServerMessage(
+            action = CryptoMessage.CACHE_RESUME,
+            data = (self.fMgr.cache.epoch, self.fMgr.cache.version, self.ledgerStamp, pages),
+            flags = 0
+        )
+
+    def receiveResumedState(self, message):
+        """
+        Updates the pages of the server's ledger which have changed since we last revalidated them.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the current stamp of its
+                          ledger and a list of (prefix, after, etag, entries, next) tuples holding the pages which have
+                          changed.  Pages with an etag of None are to be dropped.
+        """
+
+        stamp, changed = message.data
+        self.ledgerStamp = tuple(stamp)
+
+        for prefix, after, etag, entries, following in changed:
+            if etag is None:
+                self.ledgerPages.pop((None, prefix, after), None)
+            else:
+                self.ledgerPages[(None, prefix, after)] = (etag, [tuple(entry) for entry in entries], following)
+
+        self.stateChanged = True
+
+    def saveState(self):
+        """ Stores our copies of the server's state in our state_dir if they've changed, at most every so often. """
+
+        if self.stateCache is None or time.time() - self.stateSaveTime < self.STATE_SAVE_INTERVAL:
+            return
+
+        cache = self.fMgr.cache
+        if not self.stateChanged and (cache.epoch, cache.version) == self.savedCacheVersion:
+            return
+
+        # The listings of our peers are keyed by their userIDs, which don't outlive their connections
+        pages = dict(((prefix, after), page) for (userID, prefix, after), page in self.ledgerPages.items()
+                     if userID is None)
+        state = ServerState(cache.toString() if cache.version is not None else None, self.ledgerStamp, pages)
+
+        try:
+            self.stateCache.save(self.serverUID, state)
+
+        except (IOError, OSError):
+            logging.error(traceback.format_exc())
+
+        self.stateChanged = False
+        self.savedCacheVersion = (cache.epoch, cache.version)
+        self.stateSaveTime = time.time()
+
+    def resumeTransfers(self):
+        """
+        Requests the chunks we're missing of every download interrupted by losing our connection to the server, or by
+        closing the client, and restarts any uploads interrupted by losing our connection.  The server only asks us for
+        the chunks of a restarted upload which it didn't receive the first time.
+        """
+
+        # Begin interrupted uploads again, under new transferIDs
+        uploads = list(self.uploads.values())
+        for transferID in list(self.uploads):
+            self.endUpload(transferID)
+
+        for path, name, password, visible in uploads:
+            self.upload(path, name, password, visible)
+
+        # Swarm downloads find their sources again, as our peers may have come and gone
+        swarms = list(self.swarmQueries.values())
+        for transferID in self.swarms:
+            receiver = self.downloads.pop(transferID)
+            receiver.suspend()
+            swarms.append((receiver.root, receiver.path))
+
+        self.swarmQueries = dict()
+        self.swarms = dict()
+
+        for root, destination in swarms:
+            self.swarmDownload(root, destination)
+
+        # Map the destination of each interrupted download to the name and password of the file
+        interrupted = dict()
+
+        for download in self.downloads.values():
+            if isinstance(download, FileReceiver):
+                download.suspend()
+                interrupted[download.path] = (download.name, download.password)
+
+            else:
+                interrupted[download[0]] = download[1:]
+
+        self.downloads = dict()
+
+        # Downloads from a previous run of the client are known only by their sidecars.  If they need a password, they
+        # will have to be requested again by hand.
+        swarming = set(destination for root, destination in swarms)
+        pattern = os.path.join(self.fMgr.config.download_dir, '*' + PART_SUFFIX + SIDECAR_SUFFIX)
+        for sidecarPath in glob.glob(pattern):
+            destination = sidecarPath[:-len(PART_SUFFIX + SIDECAR_SUFFIX)]
+            sidecar = Sidecar.load(sidecarPath)
+            if sidecar is not None and destination not in interrupted and destination not in swarming:
+                interrupted[destination] = (sidecar.name, None)
+
+        for destination, (name, password) in interrupted.items():
+            self.download(name, password, destination)
+
+    def beginDownload(self, message):
+        """
+        Prepares to receive a file the server has begun sending us.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the transferID of the download,
+                          the size, chunk size and version of the file, and the root of its Merkle tree.
+        """
+
+        transferID, size, chunkSize, version, root = message.data
+
+        # Ignore offers of downloads we didn't request, or have already been offered
+        download = self.downloads.get(transferID, None)
+        if download is None or isinstance(download, FileReceiver):
+            return
+
+        destination, name, password = download
+
+        # Any chunks we already have of this version of the file are picked up from its sidecar
+        receiver = FileReceiver(transferID, destination, name, size, chunkSize, version, password, root)
+        self.downloads[transferID] = receiver
+
+        # Empty files, and resumed downloads which were only missing their last few chunks, have nothing to wait for
+        if receiver.complete:
+            self.finishDownload(receiver)
+
+    def receiveChunk(self, message):
+        """
+        Queues a chunk of a file the server is sending us, to be verified along with the others we've received since we
+        last polled the server.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the transferID of the download,
+                          the index and contents of the chunk, and its proof.
+        """
+
+        # Chunks of a swarm download are only accepted from the peers we asked for them, and of others from the server
+        transferID, index = message.data[:2]
+        if transferID in self.swarms:
+            if not self.swarms[transferID].requestedFrom(message.sender_id, index):
+                return
+
+        elif message.sender_id is not None:
+            logging.info("Ignoring chunk %s of %s from peer %s." % (index, transferID, message.sender_id))
+            return
+
+        self.receivedChunks.append((message.sender_id,) + tuple(message.data))
+
+    def verifyChunks(self):
+        """
+        Verifies the chunks we've received since we last polled the server against the Merkle trees of their files,
+        several at once, then writes those which are intact and has the rest sent again.
+        """
+
+        chunks, self.receivedChunks = self.receivedChunks, []
+        chunks = [chunk for chunk in chunks if isinstance(self.downloads.get(chunk[1], None), FileReceiver)]
+        if not chunks:
+            return
+
+        # Hashing releases the GIL, so chunks are verified on as many cores as we have threads
+        if self.verifier is None:
+            self.verifier = ThreadPool(self.fMgr.config.verify_threads)
+
+        verified = self.verifier.map(lambda chunk: self.downloads[chunk[1]].verify(*chunk[2:]), chunks)
+
+        for (senderID, transferID, index, chunk, proof), intact in zip(chunks, verified):
+            # The download may have been completed or abandoned by an earlier chunk
+            receiver = self.downloads.get(transferID, None)
+            if receiver is None:
+                continue
+
+            if transferID in self.swarms:
+                self.receiveSwarmChunk(receiver, senderID, index, chunk, intact)
+
+            elif intact:
+                self.writeChunk(receiver, index, chunk)
+
+            else:
+                logging.info("Chunk %s of %s failed verification." % (index, receiver.path))
+                self.sendServerMessage(action=CryptoMessage.FILE_RETRY, data=(transferID, index), flags=0)
+
+    def writeChunk(self, receiver, index, chunk):
+        """
+        Writes a verified chunk of a file the server is sending us, and acknowledges it so the server sends us more.
+
+        Inputs: receiver - The utils.transfer.receiver.FileReceiver receiving the file.
+                index    - The index of the chunk.
+                chunk    - A string containing the chunk.
+        """
+
+        try:
+            receiver.write(index, chunk)
+
+        except (IOError, OSError, ValueError):
+            logging.error(traceback.format_exc())
+            self.sendServerMessage(
+                action = CryptoMessage.FILE_CANCEL,
+                data = (receiver.transferID, "Unable to write chunk."),
+                flags = 0
+            )
+            self.endDownload(receiver.transferID)
+            return
+
+        self.sendServerMessage(action=CryptoMessage.FILE_ACK, data=(receiver.transferID, index), flags=0)
+
+        if receiver.complete:
+            self.finishDownload(receiver)
+
+    def finishDownload(self, receiver):
+        """ Moves a file which has been received entirely to its destination. """
+
+        del self.downloads[receiver.transferID]
+        self.swarms.pop(receiver.transferID, None)
+        receiver.finish()
+        logging.info("Downloaded %s (%s bytes)." % (receiver.path, receiver.size))
+
+    def cancelTransfer(self, message):
+        """
+        Stops a download or upload the server was unable to complete.  What we've received of a download is kept, so
+        that it can be resumed later.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the transferID of the transfer,
+                          and the reason it was stopped.
+        """
+
+        transferID, reason = message.data
+
+        # A peer which no longer shares a file we're downloading from it leaves the rest of the swarm to carry on
+        if transferID in self.swarms:
+            if message.sender_id in self.swarms[transferID].peers:
+                logging.info("Peer %s stopped sending %s: %s" % (message.sender_id, transferID, reason))
+                self.swarms[transferID].removePeer(message.sender_id)
+            return
+
+        # Only the server may stop our other transfers
+        if message.sender_id is not None:
+            logging.info("Ignoring peer %s stopping transfer %s." % (message.sender_id, transferID))
+            return
+
+        logging.info("Transfer %s stopped: %s" % (transferID, reason))
+
+        receiver = self.downloads.pop(transferID, None)
+        if isinstance(receiver, FileReceiver):
+            receiver.suspend()
+
+        self.endUpload(transferID)
+
+    def endDownload(self, transferID):
+        """ Discards a download, and anything we've received of it. """
+
+        self.swarms.pop(transferID, None)
+        receiver = self.downloads.pop(transferID, None)
+        if isinstance(receiver, FileReceiver):
+            receiver.cancel()
+
+    def upload(self, path, name=None, password=None, visible=True):
+        """
+        Uploads a file to the server, to be shared from its ledger.  The server is first sent the digests of the file's
+        chunks, and only asks us for those it doesn't already have.
+
+        Inputs: path     - The path to the file to upload.
+                name     - The name to share the file under.  Defaults to the file's name.
+                password - A password to require peers to provide to download the file, if any.
+                visible  - Whether or not the file should be listed to peers.
+
+        Outputs: The transferID identifying the upload.
+        """
+
+        transferID = self.transferIDIncrementor
+        self.transferIDIncrementor += 1
+
+        if name is None:
+            name = os.path.basename(path)
+
+        size, hashes = hashFile(path, CHUNK_SIZE)
+
+        self.uploads[transferID] = (path, name, password, visible)
+        self.sendServerMessage(
+            action = CryptoMessage.UPLOAD_QUERY,
+            data = (transferID, name, password, visible, size, CHUNK_SIZE, hashes),
+            flags = 0
+        )
+
+        return transferID
+
+    def beginUpload(self, message):
+        """
+        Begins sending the server the chunks of an upload it doesn't have.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the transferID of the upload,
+                          and the ranges of chunks the server needs.
+        """
+
+        transferID, ranges = message.data
+
+        upload = self.uploads.get(transferID, None)
+        if upload is None or transferID in self.uploadSenders:
+            return
+
+        sender = FileSender(transferID, LocalFile(upload[0]), CHUNK_SIZE)
+        sender.select(ranges)
+        self.uploadSenders[transferID] = sender
+
+        self.sendUploadChunks(sender)
+
+    def sendUploadChunks(self, sender):
+        """ Sends the server as many chunks of an upload as the upload's window allows. """
+
+        # The server checks uploaded chunks against the digests we sent it, so they carry no proof
+        for index, chunk in sender.pending():
+            self.sendServerMessage(
+                action = CryptoMessage.FILE_CHUNK,
+                data = (sender.transferID, index, chunk, None),
+                flags = 0
+            )
+
+    def acknowledgeUploadChunk(self, message):
+        """
+        Records the server's acknowledgement of a chunk of an upload, and sends it the chunks which follow.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the transferID of the upload,
+                          and the index of the chunk.
+        """
+
+        transferID, index = message.data
+
+        sender = self.uploadSenders.get(transferID, None)
+        if sender is not None:
+            sender.ack(index)
+            self.sendUploadChunks(sender)
+
+    def finishUpload(self, message):
+        """
+        Records the completion of an upload.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the transferID of the upload.
+        """
+
+        transferID = message.data[0]
+
+        upload = self.uploads.get(transferID, None)
+        if upload is not None:
+            logging.info("Uploaded %s as %s." % upload[:2])
+            self.endUpload(transferID)
+
+    def endUpload(self, transferID):
+        """ Releases the resources of an upload. """
+
+        self.uploads.pop(transferID, None)
+
+        sender = self.uploadSenders.pop(transferID, None)
+        if sender is not None:
+            sender.close()
+
+    def publishFiles(self):
+        """
+        Tells the server which of the files in our own ledger we share, so that our peers can download them from us.
+        Password protected files are not shared.
+        """
+
+        self.shares = dict()
+        self.sharedRoots = dict()
+
+        ledgerPath = self.fMgr.config.file_ledger_path
+        if not ledgerPath:
+            return
+
+        # Our share_dir is scanned in full just once; after that, pollShares picks up only what has changed
+        if self.fMgr.config.share_dir and self.indexer is None:
+            self.indexer = LedgerIndexer(Ledger(ledgerPath), self.fMgr.config.share_dir, (PART_SUFFIX, SIDECAR_SUFFIX))
+            self.indexer.scan()
+
+        ledger = Ledger(ledgerPath) if self.indexer is None else self.indexer.ledger
+        self.shareTrees = TreeCache(ledgerPath + '.trees')
+
+        # Hash whatever is new in our ledger in parallel, rather than one file at a time as each is shared
+        hasher = hashLedger(ledger, self.shareTrees, CHUNK_SIZE, self.fMgr.config.hash_processes)
+        if hasher.files:
+            logging.info("Hashed %s files at %.1f MB/s, %.1f files/s." % (
+                hasher.files, hasher.megabytesPerSecond, hasher.filesPerSecond
+            ))
+
+        for metadata in ledger:
+            self.shareFile(metadata)
+
+        # Large shares are described a batch at a time, rather than in one enormous message
+        published = [self.describeShare(root) for root in self.shares]
+        batches = [published[start:start + self.PUBLISH_BATCH_SIZE]
+                   for start in range(0, len(published), self.PUBLISH_BATCH_SIZE)]
+
+        self.sendServerMessage(action=CryptoMessage.PUBLISH_FILES, data=batches[0] if batches else [], flags=0)
+        for batch in batches[1:]:
+            self.sendServerMessage(action=CryptoMessage.PUBLISH_CHANGES, data=(batch, []), flags=0)
+
+    def shareFile(self, metadata):
+        """
+        Begins sharing a file from our ledger with our peers.  Password protected files are not shared.
+
+        Inputs: metadata - The FileMetadata of the file.
+        """
+
+        if metadata.password:
+            return
+
+        try:
+            source = LocalFile(metadata.path)
+            try:
+                tree = self.shareTrees.get(metadata.name, source, CHUNK_SIZE)
+            finally:
+                source.close()
+
+        except (IOError, OSError):
+            logging.error(traceback.format_exc())
+            return
+
+        # Describe the file as we'll actually send it, should it have changed since it was added to the ledger
+        metadata.size = source.size
+
+        self.sharedRoots[metadata.name] = tree.root
+        self.shares.setdefault(tree.root, (tree, dict()))[1][metadata.name] = metadata
+
+    def unshareFile(self, name):
+        """
+        Stops sharing a file from our ledger with our peers.
+
+        Inputs: name - The name the file is shared under.
+        """
+
+        root = self.sharedRoots.pop(name, None)
+        if root is None:
+            return
+
+        copies = self.shares[root][1]
+        copies.pop(name, None)
+        if not copies:
+            del self.shares[root]
+
+    def describeShare(self, root):
+        """
+        Describes a file we share to the server.  Of the files in our ledger with the same contents, any one is named.
+
+        Inputs: root - The root of the file's Merkle tree.
+
+        Outputs: A (name, size, visible, chunkSize, root) tuple.
+        """
+
+        metadata = next(iter(self.shares[root][1].values()))
+        return (metadata.name, metadata.size, metadata.visible, CHUNK_SIZE, root)
+
+    def pollShares(self):
+        """ Tells the server about the files in our share_dir which have changed since we last polled it. """
+
+        if self.indexer is None or self.shareTrees is None:
+            return
+
+        changed, removed = self.indexer.poll()
+
+        # The roots of the files we shared or now share under the names which have changed
+        roots = set()
+
+        for name in removed:
+            roots.add(self.sharedRoots.get(name, None))
+            self.unshareFile(name)
+            self.shareTrees.remove(name)
+
+        for metadata in changed:
+            roots.add(self.sharedRoots.get(metadata.name, None))
+            self.unshareFile(metadata.name)
+            self.shareFile(metadata)
+            roots.add(self.sharedRoots.get(metadata.name, None))
+
+        roots.discard(None)
+        if not roots:
+            return
+
+        # Roots we still share are described again, in case the name we described them by has gone
+        published = [self.describeShare(root) for root in roots if root in self.shares]
+        withdrawn = [root for root in roots if root not in self.shares]
+
+        self.sendServerMessage(action=CryptoMessage.PUBLISH_CHANGES, data=(published, withdrawn), flags=0)
+
+    def servePeerChunks(self, message):
+        """
+        Sends a peer the chunks it has asked us for of a file we share.
+
+        Inputs: message - The CryptoMessage object relayed to us from the peer, containing the peer's transferID for
+                          the download, the root of the file's Merkle tree, and the indices of the chunks it wants.
+        """
+
+        transferID, root, indices = message.data
+
+        share = self.shares.get(root, None)
+        if share is None:
+            self.sendServerMessage(
+                action = CryptoMessage.FILE_CANCEL,
+                recipient_id = message.sender_id,
+                data = (transferID, "File is no longer shared."),
+                flags = 0
+            )
+            return
+
+        tree, copies = share
+        metadata = next(iter(copies.values()))
+
+        # Peers ask for no more than a window of chunks at a time
+        sender = FileSender(transferID, LocalFile(metadata.path), CHUNK_SIZE, WINDOW)
+        sender.select([(index, index + 1) for index in indices[:WINDOW] if 0 <= index < len(tree.leaves)])
+
+        try:
+            for index, chunk in sender.pending():
+                self.sendServerMessage(
+                    action = CryptoMessage.FILE_CHUNK,
+                    recipient_id = message.sender_id,
+                    data = (transferID, index, chunk, tree.proof(index)),
+                    flags = 0
+                )
+
+        finally:
+            sender.close()
+
+    def swarmDownload(self, root, destination=None):
+        """
+        Downloads a file from every peer sharing it at once.
+
+        Inputs: root        - The root of the file's Merkle tree, identifying it by its contents.
+                destination - The path to save the file to.  Defaults to the file's name, in our download_dir.
+
+        Outputs: The transferID identifying the download.
+        """
+
+        transferID = self.transferIDIncrementor
+        self.transferIDIncrementor += 1
+
+        self.swarmQueries[transferID] = (root, destination)
+        self.sendServerMessage(action=CryptoMessage.SOURCES_QUERY, data=(transferID, root), flags=0)
+
+        return transferID
+
+    def beginSwarm(self, message):
+        """
+        Begins downloading a file from the peers the server tells us share it.
+
+        Inputs: message - The CryptoMessage object received from the server, containing the transferID of the download,
+                          and a list of (userID, name, size, visible, chunkSize, root) tuples describing the peers
+                          sharing the file.
+        """
+
+        transferID, sources = message.data
+
+        query = self.swarmQueries.pop(transferID, None)
+        if query is None:
+            return
+
+        root, destination = query
+        if not sources:
+            logging.info("No peers are sharing the file requested by download %s." % transferID)
+            return
+
+        # Sources sharing the same contents under a different chunk size would send chunks we can't verify
+        userID, name, size, visible, chunkSize, _ = sources[0]
+        if destination is None:
+            destination = os.path.join(self.fMgr.config.download_dir, os.path.basename(name))
+
+        # The version of a swarmed file is taken from its root, as it's the same file no matter who shares it
+        version = struct.unpack('!Q', root[:8])[0]
+        receiver = FileReceiver(transferID, destination, name, size, chunkSize, version, None, root)
+        self.downloads[transferID] = receiver
+
+        if receiver.complete:
+            self.finishDownload(receiver)
+            return
+
+        missing = [index for index in range(receiver.chunks) if not receiver.sidecar.has(index)]
+        scheduler = SwarmScheduler(receiver.chunks, missing, WINDOW, self.fMgr.config.swarm_peer_timeout)
+        for source in sources:
+            if source[2] == size and source[4] == chunkSize:
+                scheduler.addPeer(source[0], now=time.time())
+
+        self.swarms[transferID] = scheduler
+        logging.info("Downloading %s from %s peers." % (name, len(scheduler.peers)))
+
+        self.pumpSwarms()
+
+    def receiveSwarmChunk(self, receiver, senderID, index, chunk, intact):
+        """
+        Writes a chunk a peer sent us of a swarm download, if it's intact and we don't already have it.
+
+        Inputs: receiver - The utils.transfer.receiver.FileReceiver receiving the file.
+                senderID - The userID of the peer which sent the chunk.
+                index    - The index of the chunk.
+                chunk    - A string containing the chunk.
+                intact   - Whether or not the chunk passed verification.
+        """
+
+        scheduler = self.swarms[receiver.transferID]
+
+        if not intact:
+            logging.info("Chunk %s of %s from peer %s failed verification." % (index, receiver.path, senderID))
+            scheduler.failed(senderID, index)
+            return
+
+        if not scheduler.received(senderID, index, len(chunk), time.time()):
+            return
+
+        try:
+            receiver.write(index, chunk)
+
+        except (IOError, OSError, ValueError):
+            logging.error(traceback.format_exc())
+            self.endDownload(receiver.transferID)
+            return
+
+        if receiver.complete:
+            self.finishDownload(receiver)
+
+    def pumpSwarms(self):
+        """ Requests chunks from the peers of our swarm downloads which have room for them. """
+
+        now = time.time()
+
+        for transferID, scheduler in list(self.swarms.items()):
+            for userID in scheduler.expire(now):
+                logging.info("Peer %s timed out sending download %s." % (userID, transferID))
+
+            # Keep what we have, so the download can be resumed once more peers share the file
+            if not scheduler.peers:
+                logging.info("Download %s has run out of peers." % transferID)
+                del self.swarms[transferID]
+                self.downloads.pop(transferID).suspend()
+                continue
+
+            for userID, indices in scheduler.schedule(now).items():
+                self.sendServerMessage(
+                    action = CryptoMessage.PEER_CHUNK_REQUEST,
+                    recipient_id = userID,
+                    data = (transferID, self.downloads[transferID].root, indices),
+                    flags = 0
+                )
+
     def registerHandler(self, action, callback):
         """
         Registers a function to be called when a message from the server is received.
@@ -101,7 +1043,10 @@ class ServerComm(object):
             """
 
             if self.conn.handshakeComplete:
+                self.resumeState()
                 self.fMgr.showChat()
+                self.publishFiles()
+                self.resumeTransfers()
 
             else:
                 if not self.conn.active:
@@ -128,7 +1073,13 @@ class ServerComm(object):
 
         try:
             self.authenticating = True
-            self.conn = ClientStocking(username, password, self.crypto)
+
+            self.loadState()
+
+            # Tickets may only be redeemed once; the server gives us a new one each time we connect
+            ticket, self.resumptionTicket = self.resumptionTicket, None
+
+            self.conn = ClientStocking(password, self.crypto, ticket=ticket)
 
         except socket.error:
             error = "Unable to reach server at: %s:%s" % (self.fMgr.config.server_ip, self.fMgr.config.server_port)
@@ -142,13 +1093,26 @@ class ServerComm(object):
     def beginPolling(self):
         """ Begins a recurring function loop which checks if we have received any messages from the server. """
 
-        message = self.conn.read()
-        if message:
+        # Handle everything which has arrived since we last polled, so that downloads aren't limited to a chunk per poll
+        while True:
+            message = self.conn.read()
+            if not message:
+                break
+
             try:
                 self.handleServerMessage(message)
             except:
                 logging.debug(traceback.format_exc())
 
+        # Verify the chunks of downloads which arrived together all at once, then ask our peers for more
+        try:
+            self.verifyChunks()
+            self.pumpSwarms()
+            self.pollShares()
+            self.saveState()
+        except:
+            logging.debug(traceback.format_exc())
+
         self.fMgr.widget.after(constants.CLIENT_POLL_FREQ, self.beginPolling)
 
 
@@ -181,6 +1145,9 @@ class FrameManager(object):
 
 
 def main():
+    # Generate the key for our next login in the background while the user is entering their credentials
+    RSA_AES.startKeyPool(config.client().rsa_key_pool)
+
     try:
         root = Tkinter.Tk()
 
@@ -193,6 +1160,8 @@ def main():
         fMgr = FrameManager(root)
 
     finally:
+        RSA_AES.stopKeyPool()
+
         try:
             root.destroy()
 
@@ -19,22 +19,38 @@
 """
 
 # Standard imports
+import os
 import time
+import hashlib
 import socket
 import errno
-import select
+import fcntl
+import collections
+import itertools
 import traceback
 import logging
+import kimchi
 
 # Project imports
 from utils import config
+from utils import engines
+from utils import shard as sharding
 from utils.stockings.server import ServerStocking
 from utils.message import CryptoMessage
 from utils.cache import ServerCache
 from utils.crypto.rsa_aes import RSA_AES
-
-if not hasattr(select, 'poll'):
-    raise Exception("CryptoServer must be run on a system with poll capabilities (typically linux systems).")
+from utils.crypto.group_key import GroupKey
+from utils.crypto.resumption import TicketIssuer
+from utils.timer_wheel import TimerWheel
+from utils.presence import PresenceCoalescer
+from utils.published import PublishedFiles
+from utils.ledger import Ledger
+from utils.file_metadata import FileMetadata
+from utils.transfer import CHUNK_SIZE
+from utils.transfer.sender import FileSender, LocalFile
+from utils.transfer.chunk_store import ChunkStore
+from utils.transfer.upload import ChunkUpload
+from utils.transfer.merkle import TreeCache
 
 logging.basicConfig(filename='CryptoServer.log',level=logging.INFO)
 
@@ -49,28 +65,96 @@ class CryptoServer(object):
     addr = None
     # Password clients must provide in order to connect to the server
     password = None
-    # select.poll object to manage connections
-    poller = None
+    # utils.engines.EventEngineABC object to manage connections
+    engine = None
     # ServerCache object to maintain information about connected clients
     cache = None
+    # utils.timer_wheel.TimerWheel object tracking session deadlines
+    timers = None
+    # Whether or not the cache has changed since clients' local caches were last refreshed
+    cacheChanged = False
+    # utils.presence.PresenceCoalescer gathering changes to the cache into merged updates to clients
+    presence = None
+    # utils.crypto.resumption.TicketIssuer issuing clients tickets to resume their sessions with, if enabled
+    tickets = None
+    # Dictionary mapping roomIDs to the utils.crypto.group_key.GroupKey messages to the room are encrypted with
+    roomKeys = None
+    # utils.ledger.Ledger listing the files we serve to clients
+    ledger = None
+    # Dictionary mapping (userID, transferID) tuples to the utils.transfer.sender.FileSender sending each download
+    transfers = None
+    # utils.transfer.chunk_store.ChunkStore holding uploaded files, if uploads are permitted, and a dictionary mapping
+    # (userID, transferID) tuples to the utils.transfer.upload.ChunkUpload receiving each upload
+    chunkStore = None
+    uploads = None
+    # utils.transfer.merkle.TreeCache holding the Merkle trees of the files in our ledger
+    trees = None
+    # utils.published.PublishedFiles tracking the files users share from their own ledgers
+    published = None
+
+    # Number of times a chunk which a client could not verify will be sent again, before its download is abandoned
+    MAX_CHUNK_RETRIES = 3
+    # Number of the pages of our ledger's listing a resuming client has which will be revalidated
+    MAX_RESUMED_PAGES = 1000
+    # Number of seconds a client which has logged in has to tell us which version of our cache it has, before it is sent
+    # a full snapshot anyways.  Clients predating CACHE_RESUME never tell us.
+    CACHE_RESUME_GRACE = 2
+    # utils.shard.ShardLink connecting this server to the other workers of a Supervisor, if it is one of them
+    shard = None
     # Counter to prevent userID/roomID conflicts
     uniqueIDIncrementor = 1
 
-    def __init__(self):
+    # Pipe written to by sessions' handshake threads to wake up our loop when they finish, and a deque of
+    # (session, complete) tuples describing the handshakes which have finished
+    wakeupIn = None
+    wakeupOut = None
+    finishedHandshakes = None
+
+    def __init__(self, shard=None):
         self.config = config.server()
+        self.shard = shard
 
         self.addr = (self.config.server_ip, self.config.server_port)
-        self.poller = select.poll()
+        self.timers = TimerWheel()
 
         self.cache = ServerCache()
+        self.roomKeys = dict()
+        self.initFiles()
+        self.initTickets()
+        self.presence = PresenceCoalescer(
+            self.config.presence_coalesce_window / 1000.0, self.timers, self.cache, self.pushCacheUpdates
+        )
+
+        self.initLoop()
+
+        # Learn who is connected to the other workers
+        if self.shard is not None:
+            self.shard.send(sharding.SYNC_REQUEST, None)
+
+    def initLoop(self):
+        """ Starts listening for connections, and prepares the loop which waits on them.  Called as we're created. """
+
+        self.engine = engines.getEngine(self.config.event_engine)
 
         self.serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.serverSocket.setblocking(0)
         self.serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Workers each bind their own socket to the same port, and the kernel distributes connections between them
+        if self.shard is not None:
+            self.serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.serverSocket.bind(self.addr)
         self.serverSocket.listen(5)
-        self.poller.register(self.serverSocket, select.POLLIN)
-        logging.info("Server starting on %s:%s" % self.addr)
+        self.engine.register(self.serverSocket, engines.EVENT_READ)
+
+        self.finishedHandshakes = collections.deque()
+        self.wakeupIn, self.wakeupOut = os.pipe()
+        for fd in (self.wakeupIn, self.wakeupOut):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.engine.register(self.wakeupIn, engines.EVENT_READ)
+
+        if self.shard is not None:
+            self.engine.register(self.shard, engines.EVENT_READ)
+        logging.info("Server starting on %s:%s using %s" % (self.addr + (self.engine.__class__.__name__,)))
 
     def __enter__(self):
         return self
@@ -81,15 +165,55 @@ class CryptoServer(object):
     def _getUniqueID(self):
         uniqueID = self.uniqueIDIncrementor
         self.uniqueIDIncrementor += 1
+
+        if self.shard is not None:
+            uniqueID = self.shard.uniqueID(uniqueID)
+
         return uniqueID
 
+    def initFiles(self):
+        """ Loads our ledger and chunk store, and prepares to transfer files to and from clients. """
+
+        self.ledger = Ledger(self.config.file_ledger_path)
+        self.trees = TreeCache(self.config.file_ledger_path + '.trees')
+        self.transfers = dict()
+        self.uploads = dict()
+        self.published = PublishedFiles()
+
+        if self.config.upload_dir:
+            self.chunkStore = ChunkStore(self.config.upload_dir)
+
+            # Workers share a chunk store, and only the first of them collects its garbage
+            if self.config.chunk_gc_interval and (self.shard is None or self.shard.workerIndex == 0):
+                self.timers.schedule(self.config.chunk_gc_interval, self.collectGarbage)
+
+    def initTickets(self):
+        """ Prepares to issue resumption tickets, if enabled. """
+
+        if self.config.resumption_ticket_lifetime:
+            self.tickets = TicketIssuer(self.config.resumption_ticket_lifetime)
+
     def close(self):
         logging.info("Server shutting down!")
 
-        self.serverSocket.close()
-        for session in self.cache.authenticated.values() + self.cache.unauthenticated.values():
+        self.stopListening()
+        for session in list(itertools.chain(self.cache.authenticated.values(), self.cache.unauthenticated.values())):
             session.close()
 
+        self.closeLoop()
+
+    def stopListening(self):
+        """ Stops accepting connections.  Called as we're closed, before our sessions are. """
+
+        self.serverSocket.close()
+
+    def closeLoop(self):
+        """ Releases what our loop waits on.  Called as we're closed, after our sessions are. """
+
+        self.engine.close()
+        os.close(self.wakeupIn)
+        os.close(self.wakeupOut)
+
     def sendRoomMessage(self, message):
         """
         Sends a message posted to a room.
@@ -97,8 +221,65 @@ class CryptoServer(object):
         Inputs: message - An instance of utils.message.CryptoMessage containing the data to send.
         """
 
-        for session in self.cache.usersInRoom(message.recipient_id):
-            session.write(**dict(message))
+        self.deliverRoomMessage(dict(message))
+
+        # Relay the message to the other workers which have members of the room connected to them
+        if self.shard is not None and message.recipient_id in self.cache.roomDict:
+            workers = set(
+                self.shard.workerOf(userID) for userID in self.cache.roomDict[message.recipient_id][1]
+                if userID in self.cache.remoteUsers
+            )
+
+            for worker in workers:
+                self.shard.send(sharding.DELIVER_ROOM, worker, dict(message))
+
+    def deliverRoomMessage(self, message):
+        """
+        Sends a message posted to a room to the members of the room connected to this server.
+
+        Inputs: message - A dictionary of the fields of the utils.message.CryptoMessage to send.
+        """
+
+        roomID = message['recipient_id']
+        sessions = self.cache.usersInRoom(roomID)
+        if not sessions:
+            self.roomKeys.pop(roomID, None)
+            return
+
+        # Encrypt the message once with the room's key for each protocol version spoken by the room's members, and send
+        # the same ciphertext to every member speaking it
+        roomKey = self.roomKey(roomID, sessions)
+        plaintext = CryptoMessage(**message).toString()
+        frames = dict()
+        for session in sessions:
+            protocol = session.encryptor.protocol
+            if protocol not in frames:
+                frames[protocol] = roomKey.encrypt(plaintext, protocol)
+
+            session.writeFrame(frames[protocol])
+
+    def roomKey(self, roomID, sessions):
+        """
+        Returns the key to encrypt messages to a room with.  If the members of the room connected to this server have
+        changed since the room's key was issued, the room is rekeyed and the new key is sent to its members.
+
+        Inputs: roomID   - The ID of the room.
+                sessions - A list of the ServerStockings of the members of the room connected to this server.
+
+        Outputs: A utils.crypto.group_key.GroupKey object.
+        """
+
+        members = frozenset(session.userID for session in sessions)
+        roomKey = self.roomKeys.get(roomID)
+
+        if roomKey is None or roomKey.members != members:
+            roomKey = GroupKey(roomID, roomKey.epoch + 1 if roomKey else 1, members=members)
+            self.roomKeys[roomID] = roomKey
+
+            for session in sessions:
+                session.write(action=CryptoMessage.ROOM_KEY, recipient_id=roomID, data=roomKey.export())
+
+        return roomKey
 
     def sendUserMessage(self, message):
         """
@@ -111,7 +292,11 @@ class CryptoServer(object):
             session = self.cache.authenticated[message.recipient_id]
             session.write(**dict(message))
 
-    def broadcast(self, fromUserID, action=CryptoMessage.MESSAGE, msg=None, flags=CryptoMessage.MOD_PRINT):
+        # Relay the message to the worker the recipient is connected to
+        elif message.recipient_id in self.cache.remoteUsers:
+            self.shard.send(sharding.DELIVER_USER, self.shard.workerOf(message.recipient_id), dict(message))
+
+    def broadcast(self, fromUserID, action=CryptoMessage.MESSAGE, msg=None, flags=CryptoMessage.MOD_PRINT, relay=True):
         """
         Sends a message to all authenticated users.
 
@@ -119,8 +304,12 @@ class CryptoServer(object):
                 action     - The action flag to associate with the message.
                 msg        - The contents of the message.
                 flags      - The flags to associate with the message.
+                relay      - Whether or not to relay the message to the users connected to other workers.
         """
 
+        if relay and self.shard is not None:
+            self.shard.send(sharding.BROADCAST, None, fromUserID, action, msg, flags)
+
         for session in self.cache.authenticated.values():
             session.write(
                 sender_id=fromUserID,
@@ -136,11 +325,17 @@ class CryptoServer(object):
 
         logging.info("Disconnecting %s:%s" % session.addr)
 
-        # Remove the session from our cache
-        self.cache.removeUser(session.userID)
+        # Stop watching the session and release its resources
+        self.cancelTimers(session)
+        self.unwatchSession(session)
+        self.closeTransfers(session)
+        session.close()
 
-        # Inform other clients that this client has disconnected
-        self.broadcast(session.userID, CryptoMessage.LOGOUT)
+        # Remove the session from our cache.  Other clients learn of the logout with the next update to their caches.
+        self.cache.removeUser(session.userID)
+        self.published.withdraw(session.userID)
+        self.replicate(sharding.USER_LEFT, session.userID)
+        self.cacheChanged = True
 
     def createNewSessions(self):
         """ Spawns new ServerStocking instances from our server socket. """
@@ -158,9 +353,19 @@ class CryptoServer(object):
 
                 # Connect the new session, and add to self.handshaking
                 userID = self._getUniqueID()
-                session = ServerStocking(conn, userID, RSA_AES())
+                session = ServerStocking(conn, userID, RSA_AES(), self.handshakeFinished, self.tickets)
                 self.cache.newUser(session)
 
+                # Register the session with our engine once, for the lifetime of the session.  Level-triggered engines
+                # would repeatedly report the handshake messages destined for the session's own thread, so under them
+                # we only begin watching for input once the session has authenticated.
+                self.engine.register(session.fileno(), engines.EVENT_READ if self.engine.edgeTriggered else 0)
+
+                # Arm the session's handshake deadline
+                session.handshakeTimer = self.timers.schedule(
+                    self.config.inactive_disconnect_period, self.expireHandshake, session
+                )
+
                 logging.info("%s:%s Has connected." % addr)
 
         except socket.error as e:
@@ -168,49 +373,559 @@ class CryptoServer(object):
             if e.errno != errno.EAGAIN:
                 raise
 
-    def removeInactiveConnections(self):
-        """ Removes inactive unauthenticated connections. """
+    def watchSession(self, session):
+        """ Begins watching a newly authenticated session for input. """
 
-        for session in self.cache.unauthenticated.values():
-            if int(time.time()) - session.connectionTime > self.config.inactive_disconnect_period or not session.active:
-                self.cache.removeUser(session.userID)
+        # Level-triggered engines only begin watching for input once the session has authenticated
+        if not self.engine.edgeTriggered:
+            self.engine.modify(session.fileno(), engines.EVENT_READ)
 
-        disconnected = False
+    def unwatchSession(self, session):
+        """ Stops watching a session for events. """
 
-        for session in self.cache.authenticated.values():
-            if not session.active:
-                disconnected = True
-                self.disconnect(session)
+        self.engine.unregister(session.fileno())
+
+    def dropSession(self, session):
+        """ Discards an unauthenticated session. """
+
+        self.cancelTimers(session)
+        self.unwatchSession(session)
+        session.close()
+        self.cache.removeUser(session.userID)
+
+    def cancelTimers(self, session):
+        """ Disarms any timers armed on behalf of a session. """
+
+        for timer in (session.handshakeTimer, session.idleTimer, session.resumeTimer):
+            if timer is not None:
+                timer.cancel()
+
+    def expireHandshake(self, session):
+        """ Timer callback which removes a session which has taken too long to complete its handshake. """
+
+        if session.userID in self.cache.unauthenticated:
+            logging.info("%s:%s Failed to authenticate in time." % session.addr)
+            self.dropSession(session)
+
+    def handshakeFinished(self, session, complete):
+        """
+        Called from a session's handshake thread once its handshake has finished.  Queues the session to be
+        authenticated or dropped by our loop, and wakes the loop up.
+
+        Inputs: session  - The ServerStocking whose handshake finished.
+                complete - Whether or not the handshake succeeded.
+        """
+
+        self.finishedHandshakes.append((session, complete))
+
+        try:
+            os.write(self.wakeupOut, b'\0')
+
+        except OSError as e:
+            # If the pipe is full our loop already has a wakeup pending
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def handleFinishedHandshakes(self):
+        """ Authenticates or drops the sessions whose handshakes have finished. """
+
+        # Drain the wakeup pipe before the deque, so a wakeup for a handshake finishing meanwhile isn't lost
+        try:
+            while os.read(self.wakeupIn, 4096):
+                pass
+
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+        while self.finishedHandshakes:
+            session, complete = self.finishedHandshakes.popleft()
+            if session.userID not in self.cache.unauthenticated:
+                continue
+
+            if complete and session.active:
+                self.authenticateSession(session)
+
+            else:
+                self.dropSession(session)
+
+    def expireIdleSession(self, session):
+        """ Timer callback which disconnects an authenticated session which has been silent for too long. """
+
+        if session.userID in self.cache.authenticated:
+            logging.info("%s:%s Has been idle too long." % session.addr)
+            self.disconnect(session)
+
+    def expireCacheResume(self, session):
+        """ Timer callback which starts sending our cache to a client which hasn't resumed its copy of it. """
+
+        if session.userID in self.cache.authenticated and not session.cacheResumed:
+            session.cacheResumed = True
+            self.cacheChanged = True
+
+    def authenticateSession(self, session):
+        """ Authenticates a connection which has successfully logged in. """
+
+        self.cancelTimers(session)
+        self.cache.authenticate(session.userID)
+        self.replicate(sharding.USER_JOINED, session.userID, session.username)
+        self.cacheChanged = True
+
+        if self.config.idle_disconnect_period:
+            session.idleTimer = self.timers.schedule(
+                self.config.idle_disconnect_period, self.expireIdleSession, session
+            )
+        session.resumeTimer = self.timers.schedule(self.CACHE_RESUME_GRACE, self.expireCacheResume, session)
+
+        self.watchSession(session)
+
+        # Give the client a ticket so that if it reconnects, it can skip the key exchange
+        if self.tickets is not None:
+            session.write(action=CryptoMessage.RESUMPTION_TICKET, data=self.tickets.issue())
+
+        # Any messages which arrived alongside the end of the handshake will not be reported again
+        self.readSession(session)
+
+    def startTransfer(self, session, message):
+        """
+        Begins sending a client a file from our ledger.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's FILE_REQUEST CryptoMessage, containing the transferID it has given the download,
+                          the name and password of the file, and if the client is resuming a download, a tuple of
+                          the chunk size and version of its partial download, and the ranges of chunks it is missing.
+        """
+
+        transferID, name, password, resume = message.data
+
+        metadata = self.ledger.get(name, password)
+        if metadata is None:
+            self.cancelTransfer(session, transferID, "No such file: %s" % name)
+            return
+
+        try:
+            # Uploaded files are read from our chunk store
+            if self.chunkStore is not None and self.chunkStore.isManifest(metadata.path):
+                source = self.chunkStore.open(metadata.path)
+            else:
+                source = LocalFile(metadata.path)
+
+            sender = FileSender(transferID, source, self.config.transfer_chunk_size * 1024, self.config.transfer_window)
+
+            # The file is only hashed the first time it's sent, and again if it changes
+            sender.tree = self.trees.get(name, source, sender.chunkSize)
+
+        except (IOError, OSError):
+            logging.error(traceback.format_exc())
+            self.cancelTransfer(session, transferID, "Unable to read file: %s" % name)
+            return
+
+        # Only send the chunks the client is missing, so long as the file hasn't changed since it began downloading it.
+        # Chunks are proven against a tree of chunks of our own chunk size, so the client must be using it too.
+        resumed = resume is not None and resume[0] == sender.chunkSize and sender.resume(*resume)
+
+        # A client reusing a transferID abandons the download it previously identified
+        self.endTransfer(session, transferID)
+        self.transfers[(session.userID, transferID)] = sender
+
+        logging.info("%s:%s Is %s %s (%s bytes)." % (
+            session.addr[:2] + ("resuming" if resumed else "downloading", name, sender.size)
+        ))
+        session.write(
+            action = CryptoMessage.FILE_OFFER,
+            data = (transferID, sender.size, sender.chunkSize, sender.version, sender.tree.root),
+            flags = 0
+        )
+        self.sendChunks(session, sender)
+
+    def sendChunks(self, session, sender):
+        """
+        Sends a client as many chunks of a download as the download's window allows.
+
+        Inputs: session - The ServerStocking object of the client.
+                sender  - The utils.transfer.sender.FileSender of the download.
+        """
+
+        # Each chunk is encrypted as a message of its own, so only the chunks in flight are ever held in memory.  Each
+        # carries its proof, so that the client can verify it as soon as it arrives.
+        for index, chunk in sender.pending():
+            session.write(
+                action = CryptoMessage.FILE_CHUNK,
+                data = (sender.transferID, index, chunk, sender.tree.proof(index)),
+                flags = 0
+            )
+
+        if sender.done:
+            self.endTransfer(session, sender.transferID)
+
+    def acknowledgeChunk(self, session, message):
+        """
+        Records a client's acknowledgement of a chunk of a download, and sends it the chunks which follow.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's FILE_ACK CryptoMessage, containing the transferID and index of the chunk.
+        """
+
+        transferID, index = message.data
+
+        sender = self.transfers.get((session.userID, transferID), None)
+        if sender is not None:
+            sender.ack(index)
+            self.sendChunks(session, sender)
+
+    def retryChunk(self, session, message):
+        """
+        Sends a client a chunk of a download again, which it could not verify.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's FILE_RETRY CryptoMessage, containing the transferID and index of the chunk.
+        """
+
+        transferID, index = message.data
+
+        sender = self.transfers.get((session.userID, transferID), None)
+        if sender is None:
+            return
+
+        if sender.retry(index) > self.MAX_CHUNK_RETRIES:
+            self.cancelTransfer(session, transferID, "Chunk %s repeatedly failed verification." % index)
+
+        else:
+            self.sendChunks(session, sender)
+
+    def cancelTransfer(self, session, transferID, reason):
+        """
+        Abandons a download, informing the client why.
+
+        Inputs: session    - The ServerStocking object of the client.
+                transferID - The identifier the client gave the download.
+                reason     - A string describing why the download was abandoned.
+        """
+
+        self.endTransfer(session, transferID)
+        session.write(action=CryptoMessage.FILE_CANCEL, data=(transferID, reason), flags=0)
+
+    def endTransfer(self, session, transferID):
+        """ Releases the resources of a download, if it is in progress. """
+
+        sender = self.transfers.pop((session.userID, transferID), None)
+        if sender is not None:
+            sender.close()
+
+    def closeTransfers(self, session):
+        """ Releases the resources of every download and upload a session has in progress. """
+
+        for userID, transferID in list(self.transfers):
+            if userID == session.userID:
+                self.endTransfer(session, transferID)
+
+        for userID, transferID in list(self.uploads):
+            if userID == session.userID:
+                del self.uploads[(userID, transferID)]
+
+    def startUpload(self, session, message):
+        """
+        Begins receiving a file a client is uploading into our chunk store, and asks it for the chunks we don't have.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's UPLOAD_QUERY CryptoMessage, containing the transferID it has given the upload,
+                          the name, password and visibility to share the file with, the size of the file and of its
+                          chunks, and the digests of its chunks.
+        """
+
+        transferID, name, password, visible, size, chunkSize, hashes = message.data
+
+        if self.chunkStore is None:
+            self.cancelTransfer(session, transferID, "Uploads are not permitted.")
+            return
+
+        # Uploads are chunked as our store is, so that every chunk can be stored and shared between files as it is
+        if chunkSize != CHUNK_SIZE:
+            self.cancelTransfer(session, transferID, "Uploads must be split into chunks of %s bytes." % CHUNK_SIZE)
+            return
+
+        try:
+            metadata = FileMetadata(name, size, password, None, visible)
+            upload = ChunkUpload(transferID, self.chunkStore, metadata, chunkSize, hashes)
+
+        except ValueError as e:
+            self.cancelTransfer(session, transferID, str(e))
+            return
+
+        self.uploads[(session.userID, transferID)] = upload
+
+        logging.info("%s:%s Is uploading %s (%s bytes, %s of %s chunks missing)." % (
+            session.addr[:2] + (name, size, len(upload.missing), len(hashes))
+        ))
+        session.write(action=CryptoMessage.UPLOAD_MISSING, data=(transferID, upload.missingRanges()), flags=0)
+
+        if upload.complete:
+            self.finishUpload(session, upload)
+
+    def receiveUploadChunk(self, session, message):
+        """
+        Stores a chunk of a file a client is uploading, and acknowledges it so the client sends us more.
 
-        if disconnected:
-            self.pushCacheUpdates()
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's FILE_CHUNK CryptoMessage, containing the transferID of the upload, and the index
+                          and contents of the chunk.
+        """
+
+        transferID, index, chunk, _ = message.data
+
+        upload = self.uploads.get((session.userID, transferID), None)
+        if upload is None:
+            return
+
+        try:
+            upload.write(index, chunk)
+
+        except ValueError as e:
+            del self.uploads[(session.userID, transferID)]
+            self.cancelTransfer(session, transferID, str(e))
+            return
+
+        session.write(action=CryptoMessage.FILE_ACK, data=(transferID, index), flags=0)
+
+        if upload.complete:
+            self.finishUpload(session, upload)
+
+    def finishUpload(self, session, upload):
+        """ Shares a file which has been uploaded entirely, and lets the client know. """
+
+        del self.uploads[(session.userID, upload.transferID)]
+
+        metadata = upload.finish()
+        self.ledger.add(metadata)
+        self.ledger.save()
+
+        # Build the file's tree while we're here.  When its chunks are the size we send files in, the tree's leaves are
+        # simply the digests in its manifest.
+        source = self.chunkStore.open(metadata.path)
+        try:
+            self.trees.get(metadata.name, source, self.config.transfer_chunk_size * 1024)
+
+        finally:
+            source.close()
+
+        logging.info("%s:%s Uploaded %s." % (session.addr[:2] + (metadata.name,)))
+        session.write(action=CryptoMessage.UPLOAD_COMPLETE, data=(upload.transferID,), flags=0)
+
+    def searchLedger(self, session, message):
+        """
+        Searches the names of the visible files in our ledger for a client.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's LEDGER_SEARCH CryptoMessage, containing the queryID it has given the search, and
+                          the words to search for.
+        """
+
+        queryID, text = message.data
+
+        results = [(metadata.name, metadata.size, bool(metadata.password)) for metadata in self.ledger.search(text)]
+        session.write(action=CryptoMessage.LEDGER_RESULTS, data=(queryID, results), flags=0)
+
+    def publishFiles(self, session, message):
+        """
+        Records the files a client shares from its own ledger, so that its peers can download them from it.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's PUBLISH_FILES CryptoMessage, containing a list of (name, size, visible,
+                          chunkSize, root) tuples describing its files.
+        """
+
+        files = [tuple(description) for description in message.data]
+
+        self.published.publish(session.userID, files)
+        self.replicate(sharding.FILES_PUBLISHED, session.userID, files)
+
+    def publishChanges(self, session, message):
+        """
+        Records changes to the files a client shares from its own ledger.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's PUBLISH_CHANGES CryptoMessage, containing a list of (name, size, visible,
+                          chunkSize, root) tuples describing the files it has begun sharing, and a list of the roots of
+                          the files it no longer shares.
+        """
+
+        files, withdrawn = message.data
+        files = [tuple(description) for description in files]
+        withdrawn = list(withdrawn)
+
+        self.published.update(session.userID, files, withdrawn)
+        self.replicate(sharding.FILES_CHANGED, session.userID, files, withdrawn)
+
+    def listLedger(self, session, message):
+        """
+        Sends a client a page of the listing of our ledger, or of the files one of its peers shares, in order of name.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's LEDGER_LIST CryptoMessage, containing the queryID it has given the listing, the
+                          userID of the peer whose files to list, or None to list our ledger, the name after which the
+                          page begins, or None to begin with the first file, a prefix the names listed must begin with,
+                          and the ETag of the client's copy of the page, if it has one.
+
+        The client is sent a LEDGER_PAGE message containing the queryID, the page's ETag, a list of the page's entries,
+        and the name after which the next page begins, or None if this is the last page.  If the client's copy of the
+        page is current, the list of entries is None instead.  Entries of our ledger are (name, size, protected) tuples,
+        and those of a peer's files are (name, size, chunkSize, root) tuples.
+        """
+
+        queryID, userID, after, prefix, etag = message.data
+
+        pageETag, entries, following = self.ledgerPage(userID, after, prefix)
+        if etag == pageETag:
+            entries = None
+
+        session.write(action=CryptoMessage.LEDGER_PAGE, data=(queryID, pageETag, entries, following), flags=0)
+
+    def ledgerPage(self, userID, after, prefix):
+        """
+        Builds a page of the listing of our ledger, or of the files a user shares.
+
+        Inputs: userID - The userID of the user whose files to list, or None to list our ledger.
+                after  - The name after which the page begins, or None to begin with the first file.
+                prefix - A prefix the names listed must begin with.
+
+        Outputs: An (etag, entries, next) tuple; see listLedger.
+        """
+
+        pageSize = self.config.listing_page_size
+
+        # Ask for one more file than fits on the page, to learn whether there is another page after it
+        if userID is None:
+            entries = [(metadata.name, metadata.size, bool(metadata.password))
+                       for metadata in self.ledger.page(after, prefix, pageSize + 1)]
+        else:
+            entries = self.published.page(userID, after, prefix, pageSize + 1)
+
+        following = entries[pageSize - 1][0] if len(entries) > pageSize else None
+        entries = entries[:pageSize]
+
+        return hashlib.sha256(kimchi.dumps((entries, following))).digest()[:16], entries, following
+
+    def resumeState(self, session, message):
+        """
+        Brings a connecting client's copies of our state up to date, sending only what has changed since it last saw
+        them.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's CACHE_RESUME CryptoMessage, containing the epoch and version of our cache its
+                          copy corresponds to, or Nones if it has no copy, the stamp of our ledger when it last
+                          revalidated its pages of our ledger's listing, and a list of (prefix, after, etag) tuples
+                          identifying those pages.
+
+        If the client's copy of our cache is from this process it is sent the changes made since, or nothing if it is
+        current, and otherwise a full snapshot; see pushCacheUpdates.  The client is then sent a CACHE_RESUME message
+        containing the current stamp of our ledger and a list of (prefix, after, etag, entries, next) tuples holding
+        those of its pages which have changed.  If our ledger hasn't changed since the client's stamp, there are none.
+        Pages beyond the first MAX_RESUMED_PAGES aren't revalidated, and are instead listed with etags and entries of
+        None, telling the client to drop them.
+        """
+
+        epoch, version, stamp, pages = message.data
+
+        # Versions of our cache only mean something alongside the epoch they were sent with
+        session.cacheVersion = version if epoch is not None and epoch == self.cache.epoch else None
+        session.cacheResumed = True
+        self.cacheChanged = True
+
+        current = self.ledger.stamp()
+        changed = []
+
+        if stamp is None or tuple(stamp) != current:
+            for index, (prefix, after, etag) in enumerate(pages):
+                if index >= self.MAX_RESUMED_PAGES:
+                    changed.append((prefix, after, None, None, None))
+                    continue
+
+                pageETag, entries, following = self.ledgerPage(None, after, prefix)
+                if pageETag != etag:
+                    changed.append((prefix, after, pageETag, entries, following))
+
+        session.write(action=CryptoMessage.CACHE_RESUME, data=(current, changed), flags=0)
+
+    def searchNetwork(self, session, message):
+        """
+        Searches the names of the visible files a client's peers share, and sends the client a page of the results.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's NETWORK_SEARCH CryptoMessage, containing the queryID it has given the search, the
+                          text to search for, whether the names found must begin with it, and the number of the page of
+                          results to send, counting from 0.
+
+        The client is sent a NETWORK_RESULTS message containing the queryID, the total number of files found, the page
+        number, and a list of (name, size, chunkSize, root, sources) tuples describing the files on the page.
+        """
+
+        queryID, text, prefix, page = message.data
+
+        pageSize = self.config.search_page_size
+        total, results = self.published.search(text, prefix, session.userID, (page + 1) * pageSize)
+
+        session.write(action=CryptoMessage.NETWORK_RESULTS, data=(queryID, total, page, results[page * pageSize:]),
+                      flags=0)
+
+    def findSources(self, session, message):
+        """
+        Tells a client which of its peers share a file.
+
+        Inputs: session - The ServerStocking object of the client.
+                message - The client's SOURCES_QUERY CryptoMessage, containing the transferID it has given the download,
+                          and the root of the file's Merkle tree.
+        """
 
-    def authenticateConnections(self):
-        """ Authenticates connections which have successfully logged in. """
+        transferID, root = message.data
 
-        newSession = False
+        sources = [(userID,) + tuple(published) for userID, published in self.published.sourcesOf(root)
+                   if userID != session.userID]
+        session.write(action=CryptoMessage.FILE_SOURCES, data=(transferID, sources), flags=0)
 
-        for session in self.cache.unauthenticated.values():
-            if session.handshakeComplete:
-                newSession = True
-                self.cache.authenticate(session.userID)
-                self.poller.register(session.sock.fileno(), select.POLLHUP)
-                self.poller.register(session.fileno(), select.POLLIN)
+    def collectGarbage(self):
+        """ Timer callback which removes the uploaded chunks which are no longer part of any file in our ledger. """
 
-        if newSession:
-            self.pushCacheUpdates()
+        live = [metadata.path for metadata in self.ledger if self.chunkStore.isManifest(metadata.path)]
+        pinned = set()
+        for upload in self.uploads.values():
+            pinned.update(upload.manifest.hashes)
+
+        manifests, chunks, freed = self.chunkStore.collectGarbage(live, pinned, self.config.chunk_gc_interval)
+        logging.info("Collected %s manifests and %s chunks, freeing %s bytes." % (manifests, chunks, freed))
+
+        self.timers.schedule(self.config.chunk_gc_interval, self.collectGarbage)
 
     def pushCacheUpdates(self):
-        """ Refreshes all clients local caches. """
+        """
+        Brings all clients local caches up to date.  Clients are sent only the changes made since the version of the
+        cache they last received, unless those changes are no longer known, in which case they're sent a snapshot.
+        """
+
+        self.cacheChanged = False
 
-        data = self.cache.toString()
+        # Most clients will be at the same version, so only serialize each update once
+        updates = dict()
 
         for session in self.cache.authenticated.values():
+            # Congested clients are caught up, with a single merged update, once they've drained their backlog.  Clients
+            # which haven't yet told us which version of the cache they have are caught up once they do.
+            if session.cacheVersion == self.cache.version or session.congested or not session.cacheResumed:
+                continue
+
+            if session.cacheVersion not in updates:
+                data = self.cache.deltaString(session.cacheVersion)
+                if data is None:
+                    updates[session.cacheVersion] = (CryptoMessage.CACHE_REFRESH, self.cache.toString())
+                else:
+                    updates[session.cacheVersion] = (CryptoMessage.CACHE_DELTA, data)
+
+            action, data = updates[session.cacheVersion]
             session.write(
-                action = CryptoMessage.CACHE_REFRESH,
+                action = action,
                 data = data,
                 flags = 0
             )
+            session.cacheVersion = self.cache.version
 
     def processMessage(self, session, message):
         """
@@ -223,8 +938,12 @@ class CryptoServer(object):
         # Assign sender_id automatically
         message.sender_id = session.userID
 
+        # Relay the messages peers exchange to download files from each other
+        if message.action in message.PEER_ACTIONS and message.recipient_id is not None:
+            self.sendUserMessage(message)
+
         # Handle logouts
-        if message.action == message.ERROR:
+        elif message.action == message.ERROR:
             self.disconnect(session)
 
         # Handle distribution of messages
@@ -232,7 +951,7 @@ class CryptoServer(object):
             # Find the recipient of this message
             if message.recipient_id in self.cache.roomDict:
                 self.sendRoomMessage(message)
-            elif message.recipient_id in self.cache.authenticated:
+            elif message.recipient_id in self.cache.authenticated or message.recipient_id in self.cache.remoteUsers:
                 self.sendUserMessage(message)
 
         # Handle new room creation
@@ -240,72 +959,258 @@ class CryptoServer(object):
             roomID = self._getUniqueID()
             self.cache.newRoom(roomID, message.data)
             self.cache.joinRoom(message.sender_id, roomID)
+            self.replicate(sharding.ROOM_CREATED, roomID, message.data)
+            self.replicate(sharding.ROOM_JOINED, roomID, message.sender_id)
 
         # Handle a user joining a room
         elif message.action == message.JOIN_ROOM:
-            self.cache.joinRoom(message.sender_id, roomID)
+            self.cache.joinRoom(message.sender_id, message.recipient_id)
+            self.replicate(sharding.ROOM_JOINED, message.recipient_id, message.sender_id)
             self.sendRoomMessage(message)
 
         # Handle a user leaving a room
         elif message.action == message.LEAVE_ROOM:
-            self.cache.leaveRoom(message.sender_id, roomID)
+            self.cache.leaveRoom(message.sender_id, message.recipient_id)
+            self.replicate(sharding.ROOM_LEFT, message.recipient_id, message.sender_id)
             self.sendRoomMessage(message)
 
+        # Handle a client which was unable to apply an update to its cache, and needs a fresh snapshot
+        elif message.action == message.CACHE_REFRESH:
+            session.cacheVersion = None
+            session.cacheResumed = True
+            self.cacheChanged = True
+
+        # Handle a client which has just connected telling us what it already knows of our state
+        elif message.action == message.CACHE_RESUME:
+            self.resumeState(session, message)
+
+        # Handle file downloads
+        elif message.action == message.FILE_REQUEST:
+            self.startTransfer(session, message)
+
+        elif message.action == message.FILE_ACK:
+            self.acknowledgeChunk(session, message)
+
+        elif message.action == message.FILE_RETRY:
+            self.retryChunk(session, message)
+
+        elif message.action == message.FILE_CANCEL:
+            self.endTransfer(session, message.data[0])
+            self.uploads.pop((session.userID, message.data[0]), None)
+
+        elif message.action == message.LEDGER_SEARCH:
+            self.searchLedger(session, message)
+
+        # Handle the files clients share with each other
+        elif message.action == message.PUBLISH_FILES:
+            self.publishFiles(session, message)
+
+        elif message.action == message.PUBLISH_CHANGES:
+            self.publishChanges(session, message)
+
+        elif message.action == message.SOURCES_QUERY:
+            self.findSources(session, message)
+
+        elif message.action == message.NETWORK_SEARCH:
+            self.searchNetwork(session, message)
+
+        elif message.action == message.LEDGER_LIST:
+            self.listLedger(session, message)
+
+        # Handle file uploads
+        elif message.action == message.UPLOAD_QUERY:
+            self.startUpload(session, message)
+
+        elif message.action == message.FILE_CHUNK:
+            self.receiveUploadChunk(session, message)
+
         # If someone entered/left/created a room, the clients will need to have their local caches updated
         if message.action in (message.CREATE_ROOM, message.JOIN_ROOM, message.LEAVE_ROOM):
-            self.pushCacheUpdates()
+            self.cacheChanged = True
+
+
+    def replicate(self, op, *args):
+        """
+        Informs the other workers of a change to the users or rooms connected to this server, if we have any.
+
+        Inputs: op   - The utils.shard operation describing the change.
+                args - The arguments of the operation.
+        """
+
+        if self.shard is not None:
+            self.shard.send(op, None, *args)
+
+    def handleShardMessages(self):
+        """ Processes the presence changes and messages relayed to us from the other workers. """
+
+        for op, source, args in self.shard.receive():
+            if op == sharding.USER_JOINED:
+                self.cache.addRemoteUser(*args)
+
+            elif op == sharding.USER_LEFT:
+                self.cache.removeUser(*args)
+                self.published.withdraw(*args)
+
+            elif op == sharding.ROOM_CREATED:
+                self.cache.newRoom(*args)
+
+            elif op == sharding.ROOM_JOINED:
+                roomID, userID = args
+                self.cache.joinRoom(userID, roomID)
+
+            elif op == sharding.ROOM_LEFT:
+                roomID, userID = args
+                self.cache.leaveRoom(userID, roomID)
+
+            elif op == sharding.DELIVER_USER:
+                session = self.cache.authenticated.get(args[0]['recipient_id'])
+                if session is not None:
+                    session.write(**args[0])
+
+            elif op == sharding.DELIVER_ROOM:
+                self.deliverRoomMessage(args[0])
 
+            elif op == sharding.BROADCAST:
+                self.broadcast(*args, relay=False)
+
+            # Give a newly started worker our view of who is connected to us, and the rooms that exist
+            elif op == sharding.SYNC_REQUEST:
+                users = dict((userID, session.username) for userID, session in self.cache.authenticated.items())
+                self.shard.send(sharding.SNAPSHOT, source, users, self.cache.roomDict)
+
+                for userID in users:
+                    if userID in self.published.files:
+                        files = [tuple(published) for published in self.published.files[userID].values()]
+                        self.shard.send(sharding.FILES_PUBLISHED, source, userID, files)
+
+                if self.tickets is not None:
+                    self.shard.send(sharding.TICKETS_REDEEMED, source, self.tickets.allRedeemed())
+
+            elif op == sharding.SNAPSHOT:
+                users, rooms = args
+                for userID, username in users.items():
+                    self.cache.addRemoteUser(userID, username)
+                for roomID, (name, members) in rooms.items():
+                    self.cache.newRoom(roomID, name)
+                    for userID in members:
+                        self.cache.joinRoom(userID, roomID)
+
+            # Forget the users of a worker which has exited
+            elif op == sharding.WORKER_LOST:
+                for userID in list(self.cache.remoteUsers):
+                    if self.shard.workerOf(userID) == args[0]:
+                        self.cache.removeUser(userID)
+                        self.published.withdraw(userID)
+
+            elif op == sharding.FILES_PUBLISHED:
+                self.published.publish(*args)
+
+            elif op == sharding.FILES_CHANGED:
+                self.published.update(*args)
+
+            elif op == sharding.TICKETS_REDEEMED:
+                if self.tickets is not None:
+                    self.tickets.markRedeemed(*args)
+
+            if op in (sharding.USER_JOINED, sharding.USER_LEFT, sharding.ROOM_CREATED, sharding.ROOM_JOINED,
+                      sharding.ROOM_LEFT, sharding.SNAPSHOT, sharding.WORKER_LOST):
+                self.cacheChanged = True
+
+    def readSession(self, session):
+        """
+        Processes every message an authenticated session has waiting for us.
+
+        Inputs: session - The ServerStocking object to read messages from.
+        """
+
+        # Edge-triggered engines only report a session once per burst of input, so it must be drained entirely
+        while True:
+            try:
+                message = session.read()
+                if message is None:
+                    break
+
+                self.processMessage(session, message)
+
+                # Any activity from the session pushes back its idle deadline
+                if session.idleTimer is not None and session.idleTimer.armed:
+                    self.timers.reschedule(session.idleTimer, self.config.idle_disconnect_period)
+
+            except:
+                logging.error(traceback.format_exc())
+                break
+
+    def handleSessionEvent(self, fd, events):
+        """
+        Handles an event reported by our engine for one of our sessions.
+
+        Inputs: fd     - The file descriptor of the session the event occurred on.
+                events - A bitmask of utils.engines.EVENT_* flags describing the event.
+        """
+
+        # Ensure we have a corresponding session
+        session = self.cache.sessionDict.get(fd, None)
+        if session is None:
+            self.engine.unregister(fd)
+            logging.error("%s is not in server cache!! Unregistered from engine." % fd)
+            return
+
+        # Sessions which are still handshaking are handled once their handshake completes or fails
+        if session.userID in self.cache.unauthenticated:
+            return
+
+        if events & engines.EVENT_READ:
+            self.readSession(session)
+
+            # The session may have logged out while its messages were processed
+            if session.userID not in self.cache.authenticated:
+                return
+
+        # If a connection has disconnected, disconnect it
+        if events & engines.EVENT_HUP or not session.active:
+            self.disconnect(session)
+
+    def settle(self):
+        """ Performs the work owed after a batch of events has been handled. """
+
+        # Run the callbacks of any session deadlines which have passed
+        self.timers.advance()
+
+        # Tell the other workers which tickets have been redeemed with us, so they can't be redeemed again with them
+        if self.tickets is not None and self.shard is not None:
+            redeemed = self.tickets.takeRedeemed()
+            if redeemed:
+                self.replicate(sharding.TICKETS_REDEEMED, redeemed)
+
+        # Refresh clients' local caches once for everything which changed over the coalescing window
+        if self.cacheChanged:
+            self.presence.changed()
 
     def loop(self):
         """ Main handler. """
 
         try:
             while True:
-                for fd, eventMask in self.poller.poll(3):
-                    logging.debug("Event (%s): %s" % (fd, eventMask))
-
-                    # If a connection has disconnected, disconnect it
-                    if eventMask & select.POLLHUP:
-                        # If this connection is not in the cache, ignore this input
-                        session = self.cache.sockDict.get(fd, None)
-                        if not session:
-                            logging.debug("Cannot disconnect %s; unknown connection" % fd)
-                            continue
-                        self.disconnect(session)
-
-                    # If we have input to process
-                    elif eventMask & select.POLLIN:
-                        # If the fd is our serverSocket, accept new connections
-                        if fd == self.serverSocket.fileno():
-                            self.createNewSessions()
-
-                        # Otherwise it is from one of our sessions
-
-                        # Ensure we have a corresponding session
-                        elif fd not in self.cache.sessionDict:
-                            self.poller.unregister(fd)
-                            logging.error("%s is not in server cache!! Unregistered from poller." % fd)
+                for fd, events in self.engine.poll(self.timers.nextTimeout()):
+                    logging.debug("Event (%s): %s" % (fd, events))
 
-                        # Otherwise process any messages this session's sent
-                        else:
-                            try:
-                                session = self.cache.sessionDict[fd]
-                                self.processMessage(session, session.read())
+                    # If the fd is our serverSocket, accept new connections
+                    if fd == self.serverSocket.fileno():
+                        self.createNewSessions()
 
-                            except:
-                                logging.error(traceback.format_exc())
+                    # If the fd is our wakeup pipe, some sessions have finished handshaking
+                    elif fd == self.wakeupIn:
+                        self.handleFinishedHandshakes()
 
-                # Remove inactive connections
-                self.removeInactiveConnections()
+                    # If the fd is our link to the other workers, process what they've relayed to us
+                    elif self.shard is not None and fd == self.shard.fileno():
+                        self.handleShardMessages()
 
-                # Authenticate connections finished handshaking
-                self.authenticateConnections()
+                    # Otherwise it is from one of our sessions
+                    else:
+                        self.handleSessionEvent(fd, events)
 
-                # Process connections waiting to authenticate
-                for session in self.cache.unauthenticated.values():
-                    logging.debug("Checking if %s has finished authenticating" % session)
-                    if session.handshakeComplete:
-                        self.cache.authenticate(session)
+                self.settle()
 
         except KeyboardInterrupt:
             logging.info("Interrupt caught. Exiting...")
@@ -317,8 +1222,18 @@ class CryptoServer(object):
 
 if __name__ == '__main__':
     try:
-        with CryptoServer() as server:
-            server.loop()
+        serverClass = CryptoServer
+        if config.server().transport == 'asyncio':
+            from async_server import AsyncCryptoServer as serverClass
+
+        # Fork workers to share our port if we've been asked to, otherwise serve connections from this process
+        if config.server().workers > 1:
+            with sharding.Supervisor(serverClass, config.server().workers) as supervisor:
+                supervisor.loop()
+
+        else:
+            with serverClass() as server:
+                server.loop()
     except:
         traceback.print_exc()
         logging.error(traceback.format_exc())
@@ -0,0 +1,371 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import collections
+import itertools
+import os
+import kimchi
+
+
+# Changes recorded in the ServerCache journal, and replayed by ClientCaches
+USER_ADDED = 1    # (userID, username)
+USER_REMOVED = 2  # (userID,)              Also removes the user from every room
+ROOM_ADDED = 3    # (roomID, name)
+ROOM_JOINED = 4   # (roomID, userID)
+ROOM_LEFT = 5     # (roomID, userID)
+
+
+def compactChanges(changes):
+    """
+    Folds a sequence of changes into an equivalent, shorter sequence by removing changes which undo one another; for
+    instance a user who logs in and back out again, or who joins and then leaves a room.
+
+    Inputs: changes - A list of change tuples.
+
+    Outputs: A list of change tuples having the same effect as the given changes when applied in order.
+    """
+
+    compacted = []
+    # Dictionaries mapping users added, and (roomID, userID) tuples joined, to their change's index in compacted
+    added = dict()
+    joined = dict()
+
+    for change in changes:
+        op = change[0]
+
+        if op == USER_REMOVED and change[1] in added:
+            compacted[added.pop(change[1])] = None
+            for key in [key for key in joined if key[1] == change[1]]:
+                compacted[joined.pop(key)] = None
+            continue
+
+        if op == ROOM_LEFT and (change[1], change[2]) in joined:
+            compacted[joined.pop((change[1], change[2]))] = None
+            continue
+
+        if op == USER_ADDED:
+            added[change[1]] = len(compacted)
+
+        elif op == ROOM_JOINED:
+            joined[(change[1], change[2])] = len(compacted)
+
+        compacted.append(change)
+
+    return [change for change in compacted if change is not None]
+
+
+class ServerCache(object):
+    """
+    Class which maintains the server's record of connected users and the rooms they're in.
+
+    Every change to the parts of the cache which clients keep a copy of increments the cache's version and is recorded
+    in a journal, so a client known to be at an earlier version can be sent just the changes it has missed.  Versions
+    are only meaningful alongside the cache's epoch, which is chosen at random by each server process; a client which
+    reconnects to a different process, or after a restart, can't be caught up from the version it has.
+    """
+
+    # Maximum number of changes kept in the journal.  Clients further behind than this are sent a full snapshot.
+    JOURNAL_LENGTH = 1024
+
+    # Dictionary mapping the userIDs of every connected session to the session
+    userDict = None
+    # Dictionaries mapping userIDs to the sessions which have and have not yet completed their handshake
+    authenticated = None
+    unauthenticated = None
+    # Dictionaries mapping the file descriptors of sessions, and of their sockets, to the sessions
+    sessionDict = None
+    sockDict = None
+    # Dictionary mapping roomIDs to a tuple of the name of the room and the set of userIDs in it
+    roomDict = None
+    # Dictionary mapping the userIDs of users connected to other server processes to their usernames
+    remoteUsers = None
+    # Dictionary mapping userIDs to the file descriptors they're stored under, as sessions can't report them once closed
+    _filenos = None
+    # Random bytes distinguishing the versions of this cache from those of every other
+    epoch = None
+    # Version of the client visible parts of the cache, incremented with every change to them
+    version = 0
+    # Deque of (version, change) tuples recording the most recent changes to the cache
+    journal = None
+
+    def __init__(self):
+        self.userDict = dict()
+        self.authenticated = dict()
+        self.unauthenticated = dict()
+        self.sessionDict = dict()
+        self.sockDict = dict()
+        self.roomDict = dict()
+        self.remoteUsers = dict()
+        self._filenos = dict()
+        self.epoch = os.urandom(8)
+        self.version = 0
+        self.journal = collections.deque(maxlen=self.JOURNAL_LENGTH)
+
+    def _record(self, *change):
+        """ Records a change to the client visible parts of the cache, advancing the cache's version. """
+
+        self.version += 1
+        self.journal.append((self.version, change))
+
+    def changesSince(self, version):
+        """
+        Returns the changes made to the cache since a given version.
+
+        Inputs: version - The version of the cache to return the changes since.
+
+        Outputs: A list of change tuples, or None if the journal no longer reaches back as far as the given version.
+        """
+
+        if version == self.version:
+            return []
+
+        if version is None or not self.journal or version < self.journal[0][0] - 1 or version > self.version:
+            return None
+
+        # Versions in the journal are contiguous, so the position of the first change we need is known
+        start = version - (self.journal[0][0] - 1)
+        return [change for _, change in itertools.islice(self.journal, start, None)]
+
+    def newUser(self, session):
+        """
+        Adds a newly connected session to the cache.  The session remains unauthenticated until authenticate is called.
+
+        Inputs: session - The session which has connected.
+        """
+
+        fileno = session.fileno()
+        sockFileno = getattr(session, 'sockFileno', None)
+
+        self.userDict[session.userID] = session
+        self.unauthenticated[session.userID] = session
+        self.sessionDict[fileno] = session
+        self._filenos[session.userID] = (fileno, sockFileno)
+
+        if sockFileno is not None:
+            self.sockDict[sockFileno] = session
+
+    def authenticate(self, userID):
+        """
+        Marks a session as having completed its handshake.
+
+        Inputs: userID - The userID of the session to authenticate.
+        """
+
+        session = self.unauthenticated.pop(userID, None)
+        if session is not None:
+            self.authenticated[userID] = session
+            self._record(USER_ADDED, userID, session.username)
+
+    def removeUser(self, userID):
+        """
+        Removes a user from the cache, and from any rooms they were in.
+
+        Inputs: userID - The userID of the user to remove.
+        """
+
+        session = self.userDict.pop(userID, None)
+        self.unauthenticated.pop(userID, None)
+
+        # Only authenticated users are visible to clients
+        if self.authenticated.pop(userID, None) is not None or self.remoteUsers.pop(userID, None) is not None:
+            self._record(USER_REMOVED, userID)
+
+        if session is not None:
+            fileno, sockFileno = self._filenos.pop(userID)
+            for fdDict, fd in ((self.sessionDict, fileno), (self.sockDict, sockFileno)):
+                if fdDict.get(fd) is session:
+                    del fdDict[fd]
+
+        for name, members in self.roomDict.values():
+            members.discard(userID)
+
+    def addRemoteUser(self, userID, username):
+        """
+        Adds a user connected to another server process to the cache.
+
+        Inputs: userID   - The userID of the user.
+                username - The username of the user.
+        """
+
+        if self.remoteUsers.get(userID) != username:
+            self.remoteUsers[userID] = username
+            self._record(USER_ADDED, userID, username)
+
+    def newRoom(self, roomID, name):
+        """
+        Adds a new, empty room to the cache.
+
+        Inputs: roomID - The unique ID of the room.
+                name   - The name of the room.
+        """
+
+        if roomID not in self.roomDict:
+            self.roomDict[roomID] = (name, set())
+            self._record(ROOM_ADDED, roomID, name)
+
+    def joinRoom(self, userID, roomID):
+        """
+        Adds a user to a room.
+
+        Inputs: userID - The userID of the user joining the room.
+                roomID - The roomID of the room being joined.
+        """
+
+        if roomID in self.roomDict and userID not in self.roomDict[roomID][1]:
+            self.roomDict[roomID][1].add(userID)
+            self._record(ROOM_JOINED, roomID, userID)
+
+    def leaveRoom(self, userID, roomID):
+        """
+        Removes a user from a room.
+
+        Inputs: userID - The userID of the user leaving the room.
+                roomID - The roomID of the room being left.
+        """
+
+        if roomID in self.roomDict and userID in self.roomDict[roomID][1]:
+            self.roomDict[roomID][1].discard(userID)
+            self._record(ROOM_LEFT, roomID, userID)
+
+    def usersInRoom(self, roomID):
+        """
+        Returns the authenticated sessions connected to this process which are in a room.
+
+        Inputs: roomID - The roomID of the room.
+
+        Outputs: A list of sessions.
+        """
+
+        if roomID not in self.roomDict:
+            return []
+
+        return [self.authenticated[userID] for userID in self.roomDict[roomID][1] if userID in self.authenticated]
+
+    def usernames(self):
+        """ Returns a dictionary mapping the userIDs of every authenticated user, local or remote, to their usernames. """
+
+        users = dict(self.remoteUsers)
+        for userID, session in self.authenticated.items():
+            users[userID] = session.username
+
+        return users
+
+    def toString(self):
+        """ Serializes the parts of the cache which clients keep a copy of. """
+
+        rooms = dict((roomID, (name, sorted(members))) for roomID, (name, members) in self.roomDict.items())
+        return kimchi.dumps((self.epoch, self.version, self.usernames(), rooms))
+
+    def deltaString(self, version):
+        """
+        Serializes the changes made to the cache since a given version.
+
+        Inputs: version - The version of the cache the recipient has.
+
+        Outputs: A string which can be applied using ClientCache.applyDelta, or None if the changes since the given
+                 version are no longer known and a full snapshot must be sent instead.
+        """
+
+        changes = self.changesSince(version)
+        if changes is None:
+            return None
+
+        return kimchi.dumps((version, self.version, compactChanges(changes)))
+
+
+class ClientCache(object):
+    """ Class which maintains the client's copy of the users and rooms on the server. """
+
+    # Dictionary mapping userIDs to usernames
+    userDict = None
+    # Dictionary mapping roomIDs to a tuple of the name of the room and the list of userIDs in it
+    roomDict = None
+    # Dictionary mapping userIDs to the set of roomIDs of the rooms they're in, so users can be removed from their rooms
+    # without searching every room
+    userRooms = None
+    # Epoch and version of the server's cache our copy corresponds to
+    epoch = None
+    version = None
+
+    def __init__(self):
+        self.userDict = dict()
+        self.roomDict = dict()
+        self.userRooms = dict()
+
+    def fromString(self, s):
+        """
+        Replaces the contents of the cache with those serialized by ServerCache.toString.
+
+        Inputs: s - The serialized cache.
+        """
+
+        self.epoch, self.version, self.userDict, self.roomDict = kimchi.loads(s)
+
+        self.userRooms = dict()
+        for roomID, (name, members) in self.roomDict.items():
+            for userID in members:
+                self.userRooms.setdefault(userID, set()).add(roomID)
+
+    def toString(self):
+        """ Serializes the cache in the same form as ServerCache.toString, so that it can be restored by fromString. """
+
+        return kimchi.dumps((self.epoch, self.version, self.userDict, self.roomDict))
+
+    def applyDelta(self, s):
+        """
+        Applies the changes serialized by ServerCache.deltaString to the cache.
+
+        Inputs: s - The serialized changes.
+
+        Outputs: The list of changes applied, or None if they could not be applied because they do not follow on from
+                 the version of our copy; in which case a full snapshot should be requested from the server.
+        """
+
+        fromVersion, toVersion, changes = kimchi.loads(s)
+        if fromVersion != self.version:
+            return None
+
+        for change in changes:
+            op = change[0]
+
+            if op == USER_ADDED:
+                self.userDict[change[1]] = change[2]
+
+            elif op == USER_REMOVED:
+                self.userDict.pop(change[1], None)
+                for roomID in self.userRooms.pop(change[1], ()):
+                    self.roomDict[roomID][1].remove(change[1])
+
+            elif op == ROOM_ADDED:
+                self.roomDict.setdefault(change[1], (change[2], []))
+
+            elif op == ROOM_JOINED:
+                if change[1] in self.roomDict and change[1] not in self.userRooms.get(change[2], ()):
+                    self.roomDict[change[1]][1].append(change[2])
+                    self.userRooms.setdefault(change[2], set()).add(change[1])
+
+            elif op == ROOM_LEFT:
+                if change[1] in self.userRooms.get(change[2], ()):
+                    self.roomDict[change[1]][1].remove(change[2])
+                    self.userRooms[change[2]].discard(change[1])
+
+        self.version = toVersion
+        return changes
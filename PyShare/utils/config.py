@@ -23,7 +23,61 @@ import hconf
 
 # Client configs
 _CLIENT = (
-
+    {
+        'name': 'rsa_key_pool',
+        'required': False,
+        'default': 2,
+        'cast': int,
+        'description': 'Number of RSA keys to generate in the background ahead of logging in; 0 disables the pool.',
+    },
+    {
+        'name': 'download_dir',
+        'required': False,
+        'default': '.',
+        'description': 'Path to the directory to store files downloaded from the server at.',
+    },
+    {
+        'name': 'verify_threads',
+        'required': False,
+        'default': 4,
+        'cast': int,
+        'description': 'Number of threads to verify the chunks of downloads on.',
+    },
+    {
+        'name': 'file_ledger_path',
+        'required': False,
+        'default': '',
+        'description': 'Path to a ledger of files to share with peers.  If not given, no files are shared.',
+    },
+    {
+        'name': 'share_dir',
+        'required': False,
+        'default': '',
+        'description': 'Path to a directory whose files are kept indexed in file_ledger_path as they change, and '
+                       'shared with peers.',
+    },
+    {
+        'name': 'hash_processes',
+        'required': False,
+        'default': 0,
+        'cast': int,
+        'description': 'Number of processes to hash the files in file_ledger_path with; 0 uses one per CPU.',
+    },
+    {
+        'name': 'swarm_peer_timeout',
+        'required': False,
+        'default': 30,
+        'cast': int,
+        'description': 'Number of seconds a peer may take to send a chunk we asked it for before we stop downloading '
+                       'from it.',
+    },
+    {
+        'name': 'state_dir',
+        'required': False,
+        'default': '',
+        'description': 'Path to a directory to keep our copies of the state of the servers we connect to in, so that '
+                       'on reconnecting after a restart only what has changed need be sent to us.',
+    },
 )
 
 # Server configs
@@ -40,7 +94,7 @@ _SERVER = (
         'default': 16482,
         'cast': int,
         'description': 'Port the server is bound to.'
-    }
+    },
     {
         'name': 'server_password',
         'required': True,
@@ -59,6 +113,148 @@ _SERVER = (
         'required': True,
         'description': 'Path to the file ledger, containing a listing of all the files which can be served to peers.',
     },
+
+    {
+        'name': 'workers',
+        'required': False,
+        'default': 1,
+        'cast': int,
+        'description': 'Number of server processes to run.  Workers share the server port and relay messages and '
+                       'presence between each other so that clients of every worker can reach one another.',
+    },
+
+    # Session timeout configuration directives
+    {
+        'name': 'inactive_disconnect_period',
+        'required': False,
+        'default': 30,
+        'cast': int,
+        'description': 'Number of seconds a connection is given to authenticate before it is disconnected.',
+    },
+    {
+        'name': 'idle_disconnect_period',
+        'required': False,
+        'default': 0,
+        'cast': int,
+        'description': 'Number of seconds an authenticated connection may be silent before it is disconnected. '
+                       '0 disables idle disconnection.',
+    },
+
+    # Handshake configuration directives
+    {
+        'name': 'handshake_workers',
+        'required': False,
+        'default': 2,
+        'cast': int,
+        'description': 'Number of processes the asyncio transport hands handshake cryptography off to, so logins do not '
+                       'hold up message delivery.  0 performs it in the server process.',
+    },
+    {
+        'name': 'handshake_queue_length',
+        'required': False,
+        'default': 256,
+        'cast': int,
+        'description': 'Maximum number of handshake computations handed to the handshake workers at once.',
+    },
+
+    {
+        'name': 'resumption_ticket_lifetime',
+        'required': False,
+        'default': 86400,
+        'cast': int,
+        'description': 'Number of seconds a client may resume its session for after connecting, without repeating the '
+                       'full handshake.  0 disables session resumption.',
+    },
+
+    # Outbound queue configuration directives
+    {
+        'name': 'outbound_high_watermark',
+        'required': False,
+        'default': 256,
+        'cast': int,
+        'description': 'Number of KiB which may be waiting to be sent to a client before it is considered congested, '
+                       'and stops being sent presence updates.  Applies to the asyncio transport.',
+    },
+    {
+        'name': 'outbound_low_watermark',
+        'required': False,
+        'default': 64,
+        'cast': int,
+        'description': 'Number of KiB a congested client\'s outbound queue must drain to before it is caught up on '
+                       'presence updates.  Applies to the asyncio transport.',
+    },
+    {
+        'name': 'outbound_disconnect_limit',
+        'required': False,
+        'default': 4096,
+        'cast': int,
+        'description': 'Number of KiB which may be waiting to be sent to a client before it is disconnected as unable '
+                       'to keep up.  Applies to the asyncio transport.',
+    },
+
+    # File transfer configuration directives
+    {
+        'name': 'transfer_chunk_size',
+        'required': False,
+        'default': 256,
+        'cast': int,
+        'description': 'Number of KiB of a file to send to a client in each encrypted chunk.',
+    },
+    {
+        'name': 'transfer_window',
+        'required': False,
+        'default': 8,
+        'cast': int,
+        'description': 'Number of chunks of a file which may be sent to a client ahead of its acknowledgements.',
+    },
+    {
+        'name': 'chunk_gc_interval',
+        'required': False,
+        'default': 3600,
+        'cast': int,
+        'description': 'Number of seconds between removing uploaded chunks which no shared file is made up of.  0 '
+                       'disables garbage collection.',
+    },
+    {
+        'name': 'search_page_size',
+        'required': False,
+        'default': 50,
+        'cast': int,
+        'description': 'Number of files to send to a client in each page of the results of a search of the files '
+                       'shared by its peers.',
+    },
+    {
+        'name': 'listing_page_size',
+        'required': False,
+        'default': 500,
+        'cast': int,
+        'description': 'Number of files to send to a client in each page of a listing of a ledger.',
+    },
+
+    # Presence configuration directives
+    {
+        'name': 'presence_coalesce_window',
+        'required': False,
+        'default': 100,
+        'cast': int,
+        'description': 'Number of milliseconds to gather logins, logouts and room changes over before sending them to '
+                       'clients as a single update.  0 sends every change immediately.',
+    },
+
+    # Event handling configuration directives
+    {
+        'name': 'transport',
+        'required': False,
+        'default': 'threaded',
+        'description': 'Transport used to serve connections; threaded runs a thread per connection, asyncio serves '
+                       'every connection from a single asyncio event loop.',
+    },
+    {
+        'name': 'event_engine',
+        'required': False,
+        'default': 'auto',
+        'description': 'Event engine used to wait on connections; one of epoll, poll or auto to pick the best available.',
+    },
 )
 
 _SERVER_CONFIG = None
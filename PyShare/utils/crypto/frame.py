@@ -0,0 +1,110 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import struct
+
+# Protocol versions, which determine how encrypted messages are laid out.  Negotiated during the handshake.
+PROTOCOL_KIMCHI = 1     # A kimchi dumped (ciphertext, mac, nonce) tuple, with a decimal string nonce
+PROTOCOL_BINARY = 2     # A fixed binary frame; see pack
+SUPPORTED_PROTOCOLS = (PROTOCOL_KIMCHI, PROTOCOL_BINARY)
+
+# Kinds of binary frames
+KIND_SESSION = 0        # Encrypted with the symmetric key of the session
+KIND_GROUP = 1          # Encrypted with a GroupKey; followed by the ID of the group and the epoch of the key
+
+# Header length, kind, nonce and tag of a binary frame
+_HEADER = struct.Struct('!BB12s16s')
+# Group ID and key epoch of a KIND_GROUP frame
+_GROUP = struct.Struct('!QI')
+# 12 byte nonce holding a message counter
+_NONCE = struct.Struct('!4xQ')
+
+
+def negotiate(offered):
+    """
+    Picks the protocol version to use with a remote.
+
+    Inputs: offered - A sequence of the protocol versions the remote supports, or None if it predates negotiation.
+
+    Outputs: The newest protocol version supported by both sides.
+    """
+
+    common = set(offered or (PROTOCOL_KIMCHI,)) & set(SUPPORTED_PROTOCOLS)
+    return max(common) if common else PROTOCOL_KIMCHI
+
+
+def nonce(counter):
+    """ Returns the 12 byte nonce for the message numbered counter. """
+
+    return _NONCE.pack(counter)
+
+
+def pack(nonce, tag, ciphertext, groupID=None, epoch=None):
+    """
+    Lays out an encrypted message as a binary frame:
+
+        | header length (1) | kind (1) | nonce (12) | tag (16) | [group ID (8) | epoch (4)] | ciphertext |
+
+    Inputs: nonce      - The 12 byte nonce the message was encrypted with.
+            tag        - The 16 byte authentication tag of the message.
+            ciphertext - The encrypted message.
+            groupID    - The ID of the group whose key encrypted the message, if it was encrypted with a GroupKey.
+            epoch      - The epoch of the GroupKey which encrypted the message.
+
+    Outputs: A string containing the frame.
+    """
+
+    if groupID is None:
+        return _HEADER.pack(_HEADER.size, KIND_SESSION, nonce, tag) + ciphertext
+
+    headerLength = _HEADER.size + _GROUP.size
+    return _HEADER.pack(headerLength, KIND_GROUP, nonce, tag) + _GROUP.pack(groupID, epoch) + ciphertext
+
+
+def unpack(frame):
+    """
+    Parses a binary frame, without copying its ciphertext.
+
+    Inputs: frame - A string containing a frame produced by pack.
+
+    Outputs: A tuple of the frame's kind, nonce, tag, a memoryview of its ciphertext, and its group ID and key epoch
+             (both None unless the frame is of KIND_GROUP).
+
+    Notes: This function raises a ValueError if the frame is malformed.
+    """
+
+    view = memoryview(frame)
+    if len(view) < _HEADER.size:
+        raise ValueError("Frame is too short")
+
+    headerLength, kind, nonce, tag = _HEADER.unpack_from(view)
+    if headerLength > len(view):
+        raise ValueError("Frame header is longer than the frame")
+    if headerLength < _HEADER.size:
+        raise ValueError("Frame header is too short")
+
+    groupID = epoch = None
+    if kind == KIND_GROUP:
+        if headerLength < _HEADER.size + _GROUP.size:
+            raise ValueError("Group frame header is too short")
+        groupID, epoch = _GROUP.unpack_from(view, _HEADER.size)
+
+    return kind, nonce, tag, view[headerLength:], groupID, epoch
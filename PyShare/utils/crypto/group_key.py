@@ -0,0 +1,94 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+from Cryptodome.Random import get_random_bytes
+from Cryptodome.Cipher import AES
+
+# Project imports
+import kimchi
+from . import frame
+
+
+class GroupKey(object):
+    """
+    Class encapsulating a symmetric key shared by every member of a group, such as a chat room.
+
+    The server encrypts a message to the group once with the group's key, and the same ciphertext can then be sent to
+    every member.  Group keys are distributed to members over their own encrypted sessions, and are replaced with a key
+    of a new epoch whenever the membership of the group changes, so that departed members cannot read what follows.
+    """
+
+    # Identifier of the group the key belongs to
+    groupID = None
+    # Generation of the group's key.  Increases each time the group is rekeyed.
+    epoch = None
+    # The symmetric key itself
+    key = None
+    # Frozenset of the IDs of the members this key was issued to
+    members = None
+    # nonce used to initialize the cipher.  Must not repeat.
+    nonce = 0
+
+    def __init__(self, groupID, epoch, key=None, members=None):
+        self.groupID = groupID
+        self.epoch = epoch
+        self.key = key if key is not None else get_random_bytes(32)
+        self.members = members
+
+    def export(self):
+        """ Returns a tuple which can be sent to a member of the group, and passed to RSA_AES.registerGroupKey. """
+
+        return (self.groupID, self.epoch, self.key)
+
+    def encrypt(self, plaintext, protocol=frame.PROTOCOL_KIMCHI):
+        """
+        Encrypts a plaintext for the group.
+
+        Inputs: plaintext - The plaintext to encrypt.  Should be a string.
+                protocol  - The utils.crypto.frame protocol version of the members the result will be sent to.
+
+        Outputs: A string which can be decrypted by any member of the group, using RSA_AES.decrypt.
+        """
+
+        self.nonce += 1
+
+        if protocol == frame.PROTOCOL_BINARY:
+            nonce = frame.nonce(self.nonce)
+            cipher = AES.new(self.key, AES.MODE_OCB, nonce=nonce)
+            ciphertext, mac = cipher.encrypt_and_digest(plaintext)
+            return frame.pack(nonce, mac, ciphertext, self.groupID, self.epoch)
+
+        nonce = str(self.nonce).encode('ascii')
+        cipher = AES.new(self.key, AES.MODE_OCB, nonce=nonce)
+        ciphertext, mac = cipher.encrypt_and_digest(plaintext)
+        return kimchi.dumps((ciphertext, mac, nonce, self.groupID, self.epoch))
+
+    def decrypt(self, ciphertext, mac, nonce):
+        """
+        Decrypts a message encrypted for the group.
+
+        Inputs: ciphertext, mac, nonce - The fields of the packet produced by encrypt.
+
+        Outputs: The decrypted message.
+        """
+
+        cipher = AES.new(self.key, AES.MODE_OCB, nonce=nonce)
+        return cipher.decrypt_and_verify(ciphertext, mac)
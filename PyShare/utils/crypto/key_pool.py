@@ -0,0 +1,128 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import multiprocessing
+from Cryptodome.PublicKey import RSA
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def _generateKeys(keyQueue, bits):
+    """
+    Entry point of the background process of a KeyPool.  Generates RSA private keys forever, blocking whenever the
+    pool's reserve is full.
+
+    Inputs: keyQueue - The multiprocessing.Queue to put the components of the keys we generate on.
+            bits     - The size of the keys to generate.
+    """
+
+    while True:
+        key = RSA.generate(bits)
+        keyQueue.put((key.n, key.e, key.d, key.p, key.q))
+
+
+class KeyPool(object):
+    """
+    Pool of RSA private keys generated ahead of time by a background process, so that a connection can be given a key
+    without waiting for one to be generated.
+
+    The background process keeps up to `reserve` keys waiting in the pool.  If the pool is drained faster than keys can
+    be generated, keys are generated inline as though there were no pool, and the shortfall is counted in our stats.
+    """
+
+    # Size, in bits, of the keys in the pool
+    bits = None
+    # Maximum number of keys to keep in reserve
+    reserve = None
+    # multiprocessing.Queue of the components of generated keys, and the process filling it
+    keyQueue = None
+    process = None
+
+    # Number of keys handed out from the pool, and the number which had to be generated inline because it was empty
+    hits = 0
+    misses = 0
+    # Total number of seconds spent generating keys inline
+    missTime = 0
+
+    def __init__(self, reserve, bits):
+        self.reserve = reserve
+        self.bits = bits
+        self.keyQueue = multiprocessing.Queue(reserve)
+        self.process = multiprocessing.Process(target=_generateKeys, args=(self.keyQueue, bits))
+        self.process.daemon = True
+        self.process.start()
+
+    def take(self):
+        """
+        Returns an RSA private key from the pool, or a freshly generated one if the pool is empty.
+
+        Outputs: A Cryptodome.PublicKey.RSA.RsaKey object.
+        """
+
+        try:
+            # The keys were generated by us, so skip the costly primality checks done when importing a foreign key
+            key = RSA.construct(self.keyQueue.get_nowait(), consistency_check=False)
+            self.hits += 1
+
+        except queue.Empty:
+            start = time.time()
+            key = RSA.generate(self.bits)
+            self.missTime += time.time() - start
+            self.misses += 1
+
+        return key
+
+    def depth(self):
+        """ Returns the number of keys waiting in the pool, or None if this platform cannot tell. """
+
+        try:
+            return self.keyQueue.qsize()
+
+        except NotImplementedError:
+            return None
+
+    def stats(self):
+        """
+        Returns a dictionary of statistics on the use of the pool.
+
+        Outputs: A dictionary containing the number of keys waiting in the pool, the number of keys handed out from the
+                 pool, the number of keys generated inline because the pool was empty, and the total time spent
+                 generating those keys.
+        """
+
+        return {
+            'depth': self.depth(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'missTime': self.missTime,
+        }
+
+    def close(self):
+        """ Stops the background process of the pool. """
+
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.keyQueue.close()
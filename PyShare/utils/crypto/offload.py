@@ -0,0 +1,100 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import asyncio
+import logging
+import concurrent.futures
+
+
+class CryptoPool(object):
+    """
+    Bounded pool of worker processes which costly cryptography is handed off to, so that it doesn't hold up the event
+    loop relaying messages.
+
+    At most maxPending jobs are handed to the workers at once; callers beyond that wait their turn on the event loop,
+    where waiting costs nothing, rather than piling up in the executor.
+    """
+
+    # concurrent.futures.ProcessPoolExecutor running our jobs
+    executor = None
+    # Number of worker processes, and the maximum number of jobs handed to them at once
+    workers = None
+    maxPending = None
+    # asyncio.Semaphore limiting the number of jobs handed to the workers at once
+    slots = None
+
+    # Number of jobs waiting for or running in the pool, and the most there have been at once
+    depth = 0
+    maxDepth = 0
+    # Number of jobs completed, the total number of seconds they spent waiting for a slot, and the total number of
+    # seconds they spent running once they had one
+    jobs = 0
+    waitTime = 0
+    runTime = 0
+
+    def __init__(self, workers, maxPending):
+        self.workers = workers
+        self.maxPending = maxPending
+        self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+        self.slots = asyncio.Semaphore(maxPending)
+
+    async def run(self, function, *args):
+        """
+        Coroutine which runs a function in the pool.
+
+        Inputs: function - The function to run.  Must be defined at module level, so it can be sent to a worker.
+                args     - Arguments to pass to function.
+
+        Outputs: The return value of function.
+        """
+
+        self.depth += 1
+        self.maxDepth = max(self.maxDepth, self.depth)
+        queued = time.time()
+        started = None
+
+        try:
+            async with self.slots:
+                started = time.time()
+                self.waitTime += started - queued
+                return await asyncio.wrap_future(self.executor.submit(function, *args))
+
+        finally:
+            self.depth -= 1
+            self.jobs += 1
+            if started is None:
+                self.waitTime += time.time() - queued
+            else:
+                self.runTime += time.time() - started
+
+            logging.debug("%s completed in the crypto pool (totals: %s)" % (function.__name__, self.stats()))
+
+    def stats(self):
+        """ Returns a dictionary of our counters. """
+
+        return {'depth': self.depth, 'maxDepth': self.maxDepth, 'jobs': self.jobs, 'waitTime': self.waitTime,
+                'runTime': self.runTime}
+
+    def close(self):
+        """ Shuts down our worker processes. """
+
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,198 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import threading
+import collections
+from Cryptodome.Cipher import AES
+from Cryptodome.Hash import HMAC, SHA512
+from Cryptodome.Protocol.KDF import HKDF
+from Cryptodome.Random import get_random_bytes
+
+# Project imports
+import kimchi
+
+# Key tickets are encrypted with.  Generated before a Supervisor forks its workers, so a ticket issued by one worker
+# can be redeemed with any of them.
+_TICKET_KEY = None
+
+
+def generateTicketKey():
+    """ Generates the key resumption tickets issued by this process and its children are encrypted with. """
+
+    global _TICKET_KEY
+    _TICKET_KEY = get_random_bytes(32)
+
+
+def deriveKey(secret, clientNonce, serverNonce):
+    """
+    Derives a fresh symmetric key for a resumed session.
+
+    Inputs: secret      - The resumption secret which was issued alongside the ticket.
+            clientNonce - Random bytes chosen by the client for this resumption.
+            serverNonce - Random bytes chosen by the server for this resumption.
+
+    Outputs: A 32 byte symmetric key.
+    """
+
+    return HKDF(secret, 32, clientNonce + serverNonce, SHA512)
+
+
+def prove(secret, label, nonce):
+    """
+    Proves knowledge of a resumption secret.
+
+    Inputs: secret - The resumption secret.
+            label  - Bytes identifying which endpoint is giving the proof.
+            nonce  - Random bytes chosen by the other endpoint for this resumption.
+
+    Outputs: A MAC of the label and nonce, keyed with the secret.
+    """
+
+    return HMAC.new(secret, label + nonce, SHA512).digest()
+
+
+class TicketIssuer(object):
+    """
+    Issues and redeems session resumption tickets.
+
+    A ticket carries a resumption secret, encrypted such that only we can read it.  The client is given the ticket and
+    the secret over its encrypted session; on reconnecting it presents the ticket and proves it holds the secret, and
+    both sides derive a new symmetric key from the secret without repeating the RSA key exchange.  Tickets expire after
+    `lifetime` seconds, and may only be redeemed once.
+
+    Workers sharing a ticket key each keep their own record of the tickets which have been redeemed, so the tickets
+    redeemed with one must be passed on to the others; see takeRedeemed and markRedeemed.  A ticket presented to two
+    workers before either has heard from the other can be redeemed by both.
+    """
+
+    # Number of seconds a ticket may be redeemed for after it is issued
+    lifetime = None
+    # Set of the IDs of redeemed tickets which have yet to expire, to refuse redeeming them twice
+    redeemed = None
+    # collections.deque of (time, ticketID) tuples for the tickets in redeemed, ordered by the time they may be
+    # forgotten after
+    expiries = None
+    # List of the IDs of the tickets redeemed with us since takeRedeemed was last called
+    unshared = None
+    # threading.Lock guarding the above, as handshakes may be run on threads of their own
+    lock = None
+
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+        self.redeemed = set()
+        self.expiries = collections.deque()
+        self.unshared = []
+        self.lock = threading.Lock()
+
+        if _TICKET_KEY is None:
+            generateTicketKey()
+
+    def issue(self):
+        """
+        Issues a ticket.
+
+        Outputs: A tuple containing the ticket, and the resumption secret it carries.
+        """
+
+        secret = get_random_bytes(32)
+        ticketID = get_random_bytes(16)
+        nonce = get_random_bytes(15)
+
+        plaintext = kimchi.dumps((ticketID, secret, time.time() + self.lifetime))
+        cipher = AES.new(_TICKET_KEY, AES.MODE_OCB, nonce=nonce)
+        ciphertext, mac = cipher.encrypt_and_digest(plaintext)
+
+        return kimchi.dumps((nonce, ciphertext, mac)), secret
+
+    def redeem(self, ticket):
+        """
+        Redeems a ticket.
+
+        Inputs: ticket - A ticket previously returned from issue, by us or by another issuer sharing our key.
+
+        Outputs: The resumption secret carried by the ticket, or None if the ticket is invalid, expired or has already
+                 been redeemed.
+        """
+
+        now = time.time()
+
+        try:
+            nonce, ciphertext, mac = kimchi.loads(ticket)
+            cipher = AES.new(_TICKET_KEY, AES.MODE_OCB, nonce=nonce)
+            ticketID, secret, expiry = kimchi.loads(cipher.decrypt_and_verify(ciphertext, mac))
+
+        except (ValueError, TypeError, KeyError, OverflowError):
+            return None
+
+        with self.lock:
+            self._forget(now)
+            if expiry < now or ticketID in self.redeemed:
+                return None
+
+            self._record(ticketID, now)
+            self.unshared.append(ticketID)
+
+        return secret
+
+    def markRedeemed(self, ticketIDs):
+        """
+        Records tickets which have been redeemed with another issuer sharing our key.
+
+        Inputs: ticketIDs - A list of the IDs of the tickets, as returned from the other issuer's takeRedeemed.
+        """
+
+        now = time.time()
+
+        with self.lock:
+            self._forget(now)
+            for ticketID in ticketIDs:
+                if ticketID not in self.redeemed:
+                    self._record(ticketID, now)
+
+    def allRedeemed(self):
+        """ Returns a list of the IDs of every ticket we know to have been redeemed, which has yet to expire. """
+
+        with self.lock:
+            self._forget(time.time())
+            return list(self.redeemed)
+
+    def takeRedeemed(self):
+        """ Returns a list of the IDs of the tickets redeemed with us since this was last called. """
+
+        with self.lock:
+            unshared, self.unshared = self.unshared, []
+
+        return unshared
+
+    def _record(self, ticketID, now):
+        """ Records that a ticket has been redeemed. """
+
+        # Any ticket redeemed now expires within a lifetime from now, and using that rather than its expiry keeps the
+        # queue in order
+        self.redeemed.add(ticketID)
+        self.expiries.append((now + self.lifetime, ticketID))
+
+    def _forget(self, now):
+        """ Forgets redeemed tickets once they would have expired anyways. """
+
+        while self.expiries and self.expiries[0][0] < now:
+            self.redeemed.discard(self.expiries.popleft()[1])
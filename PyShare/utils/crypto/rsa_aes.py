@@ -20,13 +20,47 @@
 
 # Standard imports
 from Cryptodome.PublicKey import RSA
-from Cryptodome.PublicKey import pss
+from Cryptodome.Signature import pss
 from Cryptodome.Random import get_random_bytes
 from Cryptodome.Cipher import AES, PKCS1_OAEP
 from Cryptodome.Hash import SHA512
 
 # Project imports
 import kimchi
+from . import frame
+from ..py_compat import toBytes
+from .group_key import GroupKey
+from .key_pool import KeyPool
+
+
+# Functions below are free of state, so that they can be run in a worker process; see utils.crypto.offload
+def hashPassword(plaintext, salt):
+    """
+    Hashes the plaintext using the given salt.
+
+    Inputs: plaintext - The text to hash.  Unicode text is hashed as its utf8 encoding.
+            salt      - The salt to use in the hash.
+
+    Outputs: The hashed value of the plaintext.
+    """
+
+    hashObj = SHA512.new()
+    hashObj.update(toBytes(plaintext))
+    hashObj.update(salt)
+    return hashObj.digest()
+
+
+def exchangeKeys(publicKey):
+    """
+    Server side of the key exchange: generates a symmetric key, and encrypts it using the client's public key.
+
+    Inputs: publicKey - A string containing the client's public key.
+
+    Outputs: A tuple containing the symmetric key, and the symmetric key encrypted using the client's public key.
+    """
+
+    symm = get_random_bytes(32)
+    return symm, PKCS1_OAEP.new(RSA.import_key(publicKey)).encrypt(symm)
 
 class RSA_AES(object):
     """
@@ -60,9 +94,37 @@ class RSA_AES(object):
     remoteSymm = None
     # nonce used to initialize the cipher.  Must not repeat.
     nonce = 0
+    # Dictionary mapping the IDs of groups we're a member of to the current GroupKey of the group
+    groupKeys = None
+    # Version of the protocol negotiated with the remote, determining how encrypted messages are laid out
+    protocol = frame.PROTOCOL_KIMCHI
 
     # Maximum number of bits that can be transferred with this cipher before it begins to lose its security
     BYTE_TRANSFER_LIMIT = 2**52 # TODO
+    # Size, in bits, of the RSA keys we generate
+    KEY_BITS = 1024 # TODO 3072
+
+    # utils.crypto.key_pool.KeyPool shared by all instances to obtain private keys from, if one has been started
+    keyPool = None
+
+    @classmethod
+    def startKeyPool(cls, reserve):
+        """
+        Starts a background process generating RSA keys ahead of time, which new instances take their keys from.
+
+        Inputs: reserve - The number of keys to keep generated in advance.
+        """
+
+        if cls.keyPool is None and reserve > 0:
+            cls.keyPool = KeyPool(reserve, cls.KEY_BITS)
+
+    @classmethod
+    def stopKeyPool(cls):
+        """ Stops the background process started by startKeyPool. """
+
+        if cls.keyPool is not None:
+            cls.keyPool.close()
+            cls.keyPool = None
 
     ###
     # Handshake functions
@@ -73,7 +135,12 @@ class RSA_AES(object):
         public key.  Also generates the private key's public key counterpart.
         """
 
-        self.priv = RSA.generate(1024) # TODO 3072
+        if self.keyPool is not None:
+            self.priv = self.keyPool.take()
+
+        else:
+            self.priv = RSA.generate(self.KEY_BITS)
+
         self.pub = self.priv.publickey()
 
     def exportPublicKey(self):
@@ -109,6 +176,55 @@ class RSA_AES(object):
         cipher = PKCS1_OAEP.new(self.remotePub)
         return cipher.encrypt(self.symm)
 
+    def generateClientPublicKey(self):
+        """
+        Client side of the key exchange: generates our key pair, and returns the public key to send to the server.
+
+        Outputs: A string containing our public key in DER format.
+        """
+
+        self.generatePublicPrivateKeys()
+        return self.exportPublicKey()
+
+    def registerClientPublicKey(self, key):
+        """
+        Server side of the key exchange: registers the client's public key, and generates the symmetric key used to
+        communicate with the client.
+
+        Inputs: key - A string containing the client's public key.
+
+        Outputs: A string containing the symmetric key, encrypted using the client's public key.
+        """
+
+        self.registerPublicKey(key)
+        self.registerSymmetricKey(self.randomBytes(32))
+
+        return self.exportSymmetricKey()
+
+    def registerSymmetricKey(self, symm, server=True):
+        """
+        Registers a symmetric key agreed upon outside of the RSA key exchange, such as the one produced by exchangeKeys
+        or derived when resuming a session.
+
+        Inputs: symm   - The symmetric key used to communicate with the remote.
+                server - Whether we are the server side of the connection.
+        """
+
+        self.symm = symm
+
+        # Both endpoints share the symmetric key; the server uses odd nonces and the client even ones, so they never meet
+        self.nonce = 1 if server else 0
+
+    def registerEncryptedSymmKey(self, encryptedKey):
+        """
+        Client side of the key exchange: decrypts the symmetric key sent to us by the server.
+
+        Inputs: encryptedKey - The output of registerClientPublicKey on the server.
+        """
+
+        cipher = PKCS1_OAEP.new(self.priv)
+        self.symm = cipher.decrypt(encryptedKey)
+
     def generateAuthenticationToken(self, pwd):
         """
         Generates a token which can be used by the remote endpoint to verify that the endpoint it is communicating with
@@ -149,6 +265,27 @@ class RSA_AES(object):
         except (ValueError, TypeError, OverflowError):
             return False
 
+    def registerGroupKey(self, groupID, epoch, key):
+        """
+        Registers the key of a group we're a member of, replacing any older key of the group.
+
+        Inputs: groupID, epoch, key - The tuple produced by GroupKey.export.
+        """
+
+        if self.groupKeys is None:
+            self.groupKeys = dict()
+
+        self.groupKeys[groupID] = GroupKey(groupID, epoch, key)
+
+    def _groupKey(self, groupID, epoch):
+        """ Returns the GroupKey of the given group and epoch, raising a ValueError if we don't have it. """
+
+        groupKey = (self.groupKeys or {}).get(groupID)
+        if groupKey is None or groupKey.epoch != epoch:
+            raise ValueError("No key for epoch %s of group %s" % (epoch, groupID))
+
+        return groupKey
+
     ###
     # Crypto functions
     ###
@@ -165,15 +302,26 @@ class RSA_AES(object):
         """
 
         self.nonce += 2
-        cipher = AES.new(self.symm, AES.MODE_OCB, nonce=str(self.nonce))
+
+        if self.protocol == frame.PROTOCOL_BINARY:
+            nonce = frame.nonce(self.nonce)
+            cipher = AES.new(self.symm, AES.MODE_OCB, nonce=nonce)
+            ciphertext, mac = cipher.encrypt_and_digest(plaintext)
+            return frame.pack(nonce, mac, ciphertext)
+
+        nonce = str(self.nonce).encode('ascii')
+        cipher = AES.new(self.symm, AES.MODE_OCB, nonce=nonce)
         ciphertext, mac = cipher.encrypt_and_digest(plaintext)
-        return kimchi.dumps((ciphertext, mac, str(self.nonce)))
+        return kimchi.dumps((ciphertext, mac, nonce))
 
     def decrypt(self, cipherPacket):
         """
-        Decrypts a given kimchi-bundled cipher packet.
+        Decrypts a given cipher packet.
 
-        Inputs: cipherPacket - A kimchi dumped tuple containing the ciphertext, mac, and nonce to use for decryption.
+        Inputs: cipherPacket - Under PROTOCOL_BINARY, a frame as laid out by utils.crypto.frame.pack.  Otherwise, a
+                               kimchi dumped tuple containing the ciphertext, mac, and nonce to use for decryption.
+                               Packets encrypted with a GroupKey also contain the group ID and epoch of the key.
+                               May be a string or a memoryview; binary frames are decrypted without being copied.
 
         Outputs: The decrypted message.
 
@@ -181,7 +329,24 @@ class RSA_AES(object):
                This function can also raise a ReAuthenticateexception if we need to re-authenticate with the endpoint.
         """
 
-        ciphertext, mac, nonce = kimchi.loads(cipherPacket)
+        if self.protocol == frame.PROTOCOL_BINARY:
+            kind, nonce, mac, ciphertext, groupID, epoch = frame.unpack(cipherPacket)
+            if kind == frame.KIND_GROUP:
+                return self._groupKey(groupID, epoch).decrypt(ciphertext, mac, nonce)
+
+            cipher = AES.new(self.symm, AES.MODE_OCB, nonce=nonce)
+            return cipher.decrypt_and_verify(ciphertext, mac)
+
+        if isinstance(cipherPacket, memoryview):
+            cipherPacket = cipherPacket.tobytes()
+
+        packet = kimchi.loads(cipherPacket)
+
+        if len(packet) == 5:
+            ciphertext, mac, nonce, groupID, epoch = packet
+            return self._groupKey(groupID, epoch).decrypt(ciphertext, mac, nonce)
+
+        ciphertext, mac, nonce = packet
         cipher = AES.new(self.symm, AES.MODE_OCB, nonce=nonce)
         return cipher.decrypt_and_verify(ciphertext, mac)
 
@@ -195,10 +360,7 @@ class RSA_AES(object):
         Outputs: The hashed value of the plaintext.
         """
 
-        hashObj = SHA512.new()
-        hashObj.update(plaintext)
-        hashObj.update(salt)
-        return hashObj.digest()
+        return hashPassword(plaintext, salt)
 
     def randomBytes(self, numBytes):
         """
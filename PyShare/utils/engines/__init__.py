@@ -0,0 +1,116 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import abc
+import select
+
+# Engine independent event flags.  Engines translate their native event masks to and from these.
+EVENT_READ = 1
+EVENT_WRITE = 2
+EVENT_HUP = 4
+
+
+class EventEngineABC(object):
+    """
+    Base class for the event engines which the CryptoServer uses to wait on its file descriptors.
+
+    An engine is told about each file descriptor once, when it is registered, and from then on only reports the file
+    descriptors which are ready.  Edge-triggered engines report a file descriptor only when its state changes, so
+    callers must drain a file descriptor completely every time it is reported.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    # Whether or not this engine only reports changes in readiness, rather than readiness itself
+    edgeTriggered = False
+
+    @abc.abstractmethod
+    def register(self, fd, events):
+        """
+        Begins watching a file descriptor.
+
+        Inputs: fd     - The file descriptor (or an object with a fileno method) to watch.
+                events - A bitmask of EVENT_* flags to watch for.
+        """
+
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def modify(self, fd, events):
+        """
+        Changes the events being watched for on an already registered file descriptor.
+
+        Inputs: fd     - The file descriptor (or an object with a fileno method) to modify.
+                events - A bitmask of EVENT_* flags to watch for.
+        """
+
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def unregister(self, fd):
+        """
+        Stops watching a file descriptor.  Unregistering an unknown file descriptor is not an error.
+
+        Inputs: fd - The file descriptor (or an object with a fileno method) to stop watching.
+        """
+
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def poll(self, timeout=None):
+        """
+        Waits until at least one registered file descriptor is ready, or until timeout seconds have passed.
+
+        Inputs: timeout - The maximum number of seconds to wait, or None to wait indefinitely.
+
+        Outputs: A list of (fd, events) tuples, where events is a bitmask of EVENT_* flags.
+        """
+
+        raise NotImplementedError()
+
+    def close(self):
+        """ Releases any resources held by the engine. """
+
+        pass
+
+
+def getEngine(name='auto'):
+    """
+    Creates an event engine.
+
+    Inputs: name - The name of the engine to create; one of 'epoll', 'poll', or 'auto' to use the best engine available
+                   on this system.
+
+    Outputs: An instance of an EventEngineABC subclass.
+    """
+
+    if name == 'auto':
+        name = 'epoll' if hasattr(select, 'epoll') else 'poll'
+
+    if name == 'epoll':
+        from .epoll import EpollEngine
+        return EpollEngine()
+
+    elif name == 'poll':
+        from .poll import PollEngine
+        return PollEngine()
+
+    raise Exception("Unknown event engine: %s" % name)
@@ -0,0 +1,109 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import errno
+import select
+
+# Project imports
+from . import EventEngineABC, EVENT_READ, EVENT_WRITE, EVENT_HUP
+
+
+class EpollEngine(EventEngineABC):
+    """
+    Edge-triggered event engine built on select.epoll.
+
+    File descriptors are registered with the kernel once and the kernel hands back only those which have become ready,
+    so the cost of a wakeup is proportional to the amount of activity rather than the number of connections.
+    """
+
+    edgeTriggered = True
+
+    # select.epoll object used to wait on our file descriptors
+    epoller = None
+
+    # Maximum number of events to collect from a single call to epoll_wait
+    MAX_EVENTS = 1024
+
+    def __init__(self):
+        if not hasattr(select, 'epoll'):
+            raise Exception("EpollEngine must be run on a system with epoll capabilities (linux systems).")
+
+        self.epoller = select.epoll()
+
+    def _toMask(self, events):
+        """ Translates a bitmask of EVENT_* flags to an edge-triggered select.epoll event mask. """
+
+        mask = select.EPOLLET
+        if events & EVENT_READ:
+            mask |= select.EPOLLIN | select.EPOLLPRI
+        if events & EVENT_WRITE:
+            mask |= select.EPOLLOUT
+
+        return mask
+
+    def register(self, fd, events):
+        self.epoller.register(fd, self._toMask(events))
+
+    def modify(self, fd, events):
+        self.epoller.modify(fd, self._toMask(events))
+
+    def unregister(self, fd):
+        try:
+            self.epoller.unregister(fd)
+
+        except (IOError, OSError, ValueError) as e:
+            # The file descriptor may already have been closed, which implicitly removes it from the epoll set
+            if getattr(e, 'errno', errno.EBADF) not in (errno.EBADF, errno.ENOENT):
+                raise
+
+    def poll(self, timeout=None):
+        # select.epoll expects -1 to block indefinitely
+        if timeout is None:
+            timeout = -1
+
+        else:
+            timeout = max(0, timeout)
+
+        try:
+            polled = self.epoller.poll(timeout, self.MAX_EVENTS)
+
+        except (IOError, OSError) as e:
+            # Treat an interrupted wait as a wakeup with no events
+            if e.errno != errno.EINTR:
+                raise
+            return []
+
+        ready = []
+        for fd, mask in polled:
+            events = 0
+            if mask & (select.EPOLLIN | select.EPOLLPRI):
+                events |= EVENT_READ
+            if mask & select.EPOLLOUT:
+                events |= EVENT_WRITE
+            if mask & (select.EPOLLHUP | select.EPOLLERR):
+                events |= EVENT_HUP
+
+            ready.append((fd, events))
+
+        return ready
+
+    def close(self):
+        self.epoller.close()
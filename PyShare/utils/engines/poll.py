@@ -0,0 +1,83 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import math
+import select
+
+# Project imports
+from . import EventEngineABC, EVENT_READ, EVENT_WRITE, EVENT_HUP
+
+
+class PollEngine(EventEngineABC):
+    """ Level-triggered event engine built on select.poll, for systems without epoll. """
+
+    # select.poll object used to wait on our file descriptors
+    poller = None
+
+    def __init__(self):
+        if not hasattr(select, 'poll'):
+            raise Exception("PollEngine must be run on a system with poll capabilities (typically linux systems).")
+
+        self.poller = select.poll()
+
+    def _toMask(self, events):
+        """ Translates a bitmask of EVENT_* flags to a select.poll event mask. """
+
+        mask = 0
+        if events & EVENT_READ:
+            mask |= select.POLLIN | select.POLLPRI
+        if events & EVENT_WRITE:
+            mask |= select.POLLOUT
+
+        return mask
+
+    def register(self, fd, events):
+        self.poller.register(fd, self._toMask(events))
+
+    def modify(self, fd, events):
+        self.poller.modify(fd, self._toMask(events))
+
+    def unregister(self, fd):
+        try:
+            self.poller.unregister(fd)
+
+        except KeyError:
+            pass
+
+    def poll(self, timeout=None):
+        # select.poll expects its timeout in milliseconds.  Rounding down would have us wake up before a deadline less
+        # than a millisecond away, and spin until it passes.
+        if timeout is not None:
+            timeout = max(0, int(math.ceil(timeout * 1000)))
+
+        ready = []
+        for fd, mask in self.poller.poll(timeout):
+            events = 0
+            if mask & (select.POLLIN | select.POLLPRI):
+                events |= EVENT_READ
+            if mask & select.POLLOUT:
+                events |= EVENT_WRITE
+            if mask & (select.POLLHUP | select.POLLERR | select.POLLNVAL):
+                events |= EVENT_HUP
+
+            ready.append((fd, events))
+
+        return ready
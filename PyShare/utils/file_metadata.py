@@ -30,9 +30,17 @@ class FileMetadata(object):
         'size',
         'password',
         'path',
-        'visible'
+        'visible',
+        'mtime',
+        'digest'
     ]
 
+    # Modification time of the file, in microseconds, when it was last indexed.  Records written before this was kept
+    # leave it as None.
+    mtime = None
+    # Digest identifying the contents of the file, where known
+    digest = None
+
     def __init__(self, *args):
         for name, val in zip(self.attrs, args):
             setattr(self, name, val)
@@ -41,5 +49,5 @@ class FileMetadata(object):
         return kimchi.dumps(tuple(getattr(self, name) for name in self.attrs))
 
     def fromString(self, s):
-        for name, val in zip(self.attrs, kimchi.loads(s))
+        for name, val in zip(self.attrs, kimchi.loads(s)):
             setattr(self, name, val)
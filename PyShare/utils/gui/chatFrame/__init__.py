@@ -31,6 +31,7 @@ from .users import Users
 
 from ...message import CryptoMessage
 from ... import constants
+from ... import cache
 
 class ChatFrame(CryptoFrameABC):
     """
@@ -59,6 +60,7 @@ class ChatFrame(CryptoFrameABC):
         self.serverComm.registerHandler(CryptoMessage.MESSAGE, self.children['message'].writeMessages)
         self.serverComm.registerHandler(CryptoMessage.ERROR, self.children['message'].writeMessages) #TODO - add err stuff
         self.serverComm.registerHandler(CryptoMessage.CACHE_REFRESH, self.updateCache)
+        self.serverComm.registerHandler(CryptoMessage.CACHE_DELTA, self.applyCacheDelta)
         self.serverComm.registerHandler(CryptoMessage.LOGOUT, self.handleLogout)
         self.serverComm.beginPolling()
 
@@ -73,6 +75,30 @@ class ChatFrame(CryptoFrameABC):
 
         self.children['users'].redraw()
 
+    def applyCacheDelta(self, message):
+        """
+        Applies the changes made to the server's cache since our copy of it was last updated.
+
+        Inputs: message - The CryptoMessage object received from the server containing the changes to apply.
+        """
+
+        # If we've missed an update, our copy can't be patched; ask the server for a fresh snapshot instead
+        changes = self.cache.applyDelta(message.data)
+        if changes is None:
+            self.serverComm.sendServerMessage(
+                send_time=int(time.time()),
+                action=CryptoMessage.CACHE_REFRESH,
+                flags=0
+            )
+            return
+
+        # Logouts are folded into cache updates rather than being sent separately
+        for change in changes:
+            if change[0] == cache.USER_REMOVED:
+                self.handleLogout(CryptoMessage(sender_id=change[1], action=CryptoMessage.LOGOUT))
+
+        self.children['users'].redraw()
+
     def handleLogout(self, message):
         """
         Updates the cache object and sends a message to each chat room including that user we have open.
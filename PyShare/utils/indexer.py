@@ -0,0 +1,394 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import errno
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+# Project imports
+from utils.file_metadata import FileMetadata
+
+# Events reported by inotify; see inotify(7)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# Flags accepted by inotify_init1
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# How names which aren't valid UTF-8 are decoded; python 3 keeps them round-trippable to the filesystem
+_DECODE_ERRORS = 'replace' if str is bytes else 'surrogateescape'
+
+
+class Inotify(object):
+    """
+    Minimal binding to Linux's inotify, which reports the changes made to the contents of watched directories.
+
+    Raises OSError if inotify is unavailable, such as on systems other than linux.
+    """
+
+    # Struct heading each event read from inotify: the watch descriptor, event mask, cookie and length of the name
+    EVENT_HEADER = struct.Struct('iIII')
+    # Number of bytes to read from inotify at once
+    READ_SIZE = 64 * 1024
+
+    # The libc the inotify system calls are made through
+    _libc = None
+    # The inotify file descriptor
+    fd = None
+    # Dictionary mapping watch descriptors to the directories they watch
+    paths = None
+
+    def __init__(self):
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            init = self._libc.inotify_init1
+
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, "inotify is not available on this system.")
+
+        self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+        self.paths = dict()
+
+    def _raise(self):
+        """ Raises the error of the last failed system call. """
+
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+
+    def fileno(self):
+        return self.fd
+
+    def watch(self, path, mask):
+        """
+        Watches a directory for changes.
+
+        Inputs: path - The path to the directory.
+                mask - A bitmask of the IN_* events to watch for.
+
+        Outputs: The watch descriptor of the watch.
+        """
+
+        encoded = path if isinstance(path, bytes) else path.encode('utf8')
+        wd = self._libc.inotify_add_watch(self.fd, encoded, mask | IN_ONLYDIR)
+        if wd < 0:
+            self._raise()
+
+        self.paths[wd] = path
+        return wd
+
+    def unwatch(self, wd):
+        """ Stops watching the directory with the given watch descriptor. """
+
+        if self.paths.pop(wd, None) is not None:
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        """
+        Reads the events which have occurred since we last read, without blocking.
+
+        Outputs: A list of (directory, mask, name) tuples, where name is the name of the entry of directory which
+                 changed, or the empty string if the event concerns directory itself.
+        """
+
+        events = []
+
+        while True:
+            try:
+                buf = os.read(self.fd, self.READ_SIZE)
+
+            except (IOError, OSError) as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    break
+                raise
+
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(buf, offset)
+                offset += self.EVENT_HEADER.size
+                name = buf[offset:offset + length].rstrip(b'\0').decode('utf8', _DECODE_ERRORS)
+                offset += length
+
+                directory = self.paths.get(wd, None)
+                if mask & IN_IGNORED:
+                    self.paths.pop(wd, None)
+
+                if directory is not None or mask & IN_Q_OVERFLOW:
+                    events.append((directory, mask, name))
+
+        return events
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class LedgerIndexer(object):
+    """
+    Class which keeps a ledger in step with the files beneath a shared directory.
+
+    The directory is scanned once, then followed with inotify so that only the files which change are indexed again.
+    A file whose size and modification time are unchanged is left alone, so its Merkle tree is never recomputed.
+    Where inotify is unavailable, every call to poll rescans the directory instead.
+    """
+
+    # Events which may mean the entries of a watched directory have changed
+    MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | \
+        IN_MOVE_SELF
+
+    # The utils.ledger.Ledger being maintained
+    ledger = None
+    # The directory whose files are shared
+    root = None
+    # Tuple of the suffixes of files which are never shared, such as those of files still being written
+    ignored = None
+    # The Inotify instance following the directory, or None if we fall back to rescanning
+    inotify = None
+
+    def __init__(self, ledger, root, ignored=(), follow=True):
+        """
+        Creates an indexer for a directory.  The directory isn't scanned until scan is called.
+
+        Inputs: ledger  - The utils.ledger.Ledger to maintain.
+                root    - The directory whose files are shared.
+                ignored - An iterable of the suffixes of files which are never shared.
+                follow  - Whether or not to follow changes to the directory once it has been scanned.
+        """
+
+        self.ledger = ledger
+        self.root = os.path.abspath(root)
+        self.ignored = ('.tmp',) + tuple(ignored)
+
+        if not follow:
+            return
+
+        try:
+            self.inotify = Inotify()
+
+        except OSError:
+            logging.info("inotify is unavailable; %s will be rescanned to find changes." % self.root)
+
+    def nameOf(self, path):
+        """ Returns the name a file beneath our directory is shared under: its path relative to the directory. """
+
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def ignores(self, path):
+        """ Returns whether or not a path is never shared.  The ledger and anything stored alongside it is ignored. """
+
+        return path.endswith(self.ignored) or path.startswith(os.path.abspath(self.ledger.path))
+
+    def index(self, path):
+        """
+        Brings the ledger's record of a file up to date.
+
+        Inputs: path - The path to the file.
+
+        Outputs: The FileMetadata of the file if it's new or has changed, otherwise None.
+        """
+
+        if self.ignores(path):
+            return None
+
+        try:
+            stat = os.stat(path)
+
+        except (IOError, OSError):
+            return None
+
+        # Sockets, devices and the like aren't shared
+        if not os.path.isfile(path):
+            return None
+
+        name = self.nameOf(path)
+        mtime = int(stat.st_mtime * 1000000)
+
+        existing = self.ledger.record(name)
+        if existing is not None and existing.path == path and existing.size == stat.st_size and \
+                existing.mtime == mtime:
+            return None
+
+        metadata = FileMetadata(name, stat.st_size, None, path, True, mtime)
+        self.ledger.add(metadata)
+        return metadata
+
+    def walk(self, directory):
+        """
+        Watches a directory and every directory beneath it, and indexes their files.
+
+        Inputs: directory - The path to the directory.
+
+        Outputs: A list of the FileMetadata of the files which are new or have changed, and a set of the names of every
+                 file found.
+        """
+
+        changed = []
+        found = set()
+
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [dirname for dirname in dirnames if not self.ignores(os.path.join(dirpath, dirname))]
+
+            # Watch before listing, so that nothing created in between goes unnoticed
+            if self.inotify is not None:
+                try:
+                    self.inotify.watch(dirpath, self.MASK)
+
+                except OSError as e:
+                    logging.error("Could not watch %s: %s" % (dirpath, e))
+
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if self.ignores(path):
+                    continue
+
+                found.add(self.nameOf(path))
+
+                metadata = self.index(path)
+                if metadata is not None:
+                    changed.append(metadata)
+
+        return changed, found
+
+    def scan(self):
+        """
+        Indexes every file beneath our directory, forgetting any we no longer find.
+
+        Outputs: A list of the FileMetadata of the files which are new or have changed, and a list of the names of the
+                 files which have been removed.
+        """
+
+        if self.inotify is not None:
+            for wd in list(self.inotify.paths):
+                self.inotify.unwatch(wd)
+
+        changed, found = self.walk(self.root)
+
+        removed = [metadata.name for metadata in self.ledger.under(self.root) if metadata.name not in found]
+        for name in removed:
+            self.ledger.remove(name)
+
+        if changed or removed:
+            self.ledger.save()
+
+        return changed, removed
+
+    def forget(self, prefix):
+        """ Removes every file beneath a directory which has been moved away or deleted, returning their names. """
+
+        removed = [metadata.name for metadata in self.ledger.under(prefix)]
+        for name in removed:
+            self.ledger.remove(name)
+
+        # Watches on directories moved elsewhere outlive the move, so are removed by hand
+        for wd, path in list(self.inotify.paths.items()):
+            if path == prefix or path.startswith(prefix + os.sep):
+                self.inotify.unwatch(wd)
+
+        return removed
+
+    def poll(self):
+        """
+        Indexes the files which have changed since we last polled, without blocking.
+
+        Outputs: A list of the FileMetadata of the files which are new or have changed, and a list of the names of the
+                 files which have been removed.
+        """
+
+        if self.inotify is None:
+            return self.scan()
+
+        events = self.inotify.read()
+        if not events:
+            return [], []
+
+        # The kernel dropped events, so we can't know what changed
+        if any(mask & IN_Q_OVERFLOW for _, mask, _ in events):
+            logging.info("inotify queue overflowed; rescanning %s." % self.root)
+            return self.scan()
+
+        # Coalesce the events, so a file written to repeatedly is indexed just once
+        touched = set()
+        directories = set()
+        removed = set()
+
+        for directory, mask, name in events:
+            if not name:
+                continue
+
+            path = os.path.join(directory, name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    removed.update(self.forget(path))
+                    directories.discard(path)
+                elif mask & (IN_MOVED_TO | IN_CREATE) and not self.ignores(path):
+                    directories.add(path)
+
+            elif mask & (IN_MOVED_FROM | IN_DELETE):
+                touched.discard(path)
+                name = self.nameOf(path)
+                if name in self.ledger:
+                    self.ledger.remove(name)
+                    removed.add(name)
+
+            elif mask & (IN_MOVED_TO | IN_CLOSE_WRITE | IN_ATTRIB):
+                touched.add(path)
+
+        changed = []
+
+        for path in touched:
+            metadata = self.index(path)
+            if metadata is not None:
+                changed.append(metadata)
+
+        # Files may have been put in a new directory before we began watching it
+        for directory in directories:
+            walked, _ = self.walk(directory)
+            changed.extend(walked)
+
+        # A file removed and then replaced is reported only as changed
+        removed.difference_update(metadata.name for metadata in changed)
+
+        if changed or removed:
+            self.ledger.save()
+
+        return changed, list(removed)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
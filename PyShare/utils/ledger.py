@@ -0,0 +1,353 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import binascii
+import os
+import struct
+import sqlite3
+
+# Project imports
+from utils.file_metadata import FileMetadata
+from utils.py_compat import UNICODE, UNICHR
+
+
+def prefixEnd(prefix):
+    """ Returns the first string to sort after every string beginning with the given, non-empty, prefix. """
+
+    return prefix[:-1] + (UNICHR if isinstance(prefix, UNICODE) else chr)(ord(prefix[-1]) + 1)
+
+
+class Ledger(object):
+    """
+    Class which maintains the listing of files which can be served to peers.
+
+    The ledger is stored in an SQLite database, so files are looked up as they're needed rather than all being loaded
+    up front.  Names and paths are indexed for full-text search with FTS5, where SQLite has it, and sizes and digests
+    have indexes of their own.  Changes are made within a transaction, which save commits.
+
+    Every save which changes the ledger advances its version, which together with an identifier chosen at random when
+    the ledger is created forms its stamp; so clients holding pages of its listing can tell whether they're current.
+
+    Ledgers in the older format, a sequence of serialized FileMetadata records each prefixed with its length, are
+    converted the first time they're opened.
+    """
+
+    # The first bytes of every SQLite database, which tell them apart from ledgers in the older format
+    SQLITE_MAGIC = b'SQLite format 3\0'
+    # Struct prefixing each record of a ledger in the older format with its length
+    RECORD_HEADER = struct.Struct('!I')
+    # Number of seconds to wait for another worker to finish writing to the ledger
+    LOCK_TIMEOUT = 30
+    # Default number of results returned by a search
+    SEARCH_LIMIT = 50
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS files ("
+        "    id INTEGER PRIMARY KEY,"
+        "    name TEXT NOT NULL UNIQUE,"
+        "    size INTEGER,"
+        "    password TEXT,"
+        "    path TEXT,"
+        "    visible INTEGER,"
+        "    mtime INTEGER,"
+        "    digest BLOB"
+        ")",
+        "CREATE INDEX IF NOT EXISTS files_size ON files (size)",
+        "CREATE INDEX IF NOT EXISTS files_path ON files (path)",
+        "CREATE INDEX IF NOT EXISTS files_digest ON files (digest)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)",
+    )
+
+    # The full-text index is kept in step with the files table by triggers; rows are deleted and inserted rather than
+    # replaced, as REPLACE doesn't fire delete triggers
+    FULL_TEXT_SCHEMA = (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5("
+        "    name, path, content='files', content_rowid='id', prefix='2 3'"
+        ")",
+        "CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN"
+        "    INSERT INTO files_fts (rowid, name, path) VALUES (new.id, new.name, new.path);"
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN"
+        "    INSERT INTO files_fts (files_fts, rowid, name, path) VALUES ('delete', old.id, old.name, old.path);"
+        "END",
+    )
+
+    # Columns of the files table holding each of FileMetadata's attributes
+    COLUMNS = ', '.join(FileMetadata.attrs)
+
+    # Path to the file the ledger is stored in
+    path = None
+    # The sqlite3 connection to the ledger
+    db = None
+    # Whether or not names and paths have a full-text index
+    fullText = False
+    # Value of our connection's total_changes when the ledger was last saved
+    savedChanges = 0
+
+    def __init__(self, path):
+        self.path = path
+
+        legacy = None
+        if os.path.exists(path):
+            with open(path, 'rb') as ledgerFile:
+                if ledgerFile.read(len(self.SQLITE_MAGIC)) != self.SQLITE_MAGIC:
+                    legacy = self.readRecords(path)
+
+            if legacy is not None:
+                os.rename(path, path + '.old')
+
+        self.db = sqlite3.connect(path, timeout=self.LOCK_TIMEOUT)
+        self.db.text_factory = str
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+
+        for statement in self.SCHEMA:
+            self.db.execute(statement)
+
+        try:
+            for statement in self.FULL_TEXT_SCHEMA:
+                self.db.execute(statement)
+            self.fullText = True
+
+        except sqlite3.OperationalError:
+            self.fullText = False
+
+        uid = binascii.hexlify(os.urandom(8)).decode('ascii')
+        self.db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('uid', ?)", (uid,))
+        self.db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+
+        self.db.commit()
+        self.savedChanges = self.db.total_changes
+
+        if legacy is not None:
+            for metadata in legacy:
+                self.add(metadata)
+            self.save()
+
+    @classmethod
+    def readRecords(cls, path):
+        """ Reads the FileMetadata records of a ledger in the older format, returning them as a list. """
+
+        records = []
+
+        with open(path, 'rb') as ledgerFile:
+            while True:
+                header = ledgerFile.read(cls.RECORD_HEADER.size)
+                if len(header) < cls.RECORD_HEADER.size:
+                    break
+
+                metadata = FileMetadata()
+                metadata.fromString(ledgerFile.read(cls.RECORD_HEADER.unpack(header)[0]))
+                records.append(metadata)
+
+        return records
+
+    def _toMetadata(self, row):
+        """ Creates a FileMetadata from a row of the files table. """
+
+        metadata = FileMetadata(*row)
+        metadata.visible = bool(metadata.visible)
+        if metadata.digest is not None:
+            metadata.digest = bytes(metadata.digest)
+
+        return metadata
+
+    def _select(self, where='', args=()):
+        """ Yields the FileMetadata of the files matching an SQL condition. """
+
+        for row in self.db.execute("SELECT %s FROM files %s" % (self.COLUMNS, where), args):
+            yield self._toMetadata(row)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def __iter__(self):
+        return self._select()
+
+    def __contains__(self, name):
+        return self.db.execute("SELECT 1 FROM files WHERE name = ?", (name,)).fetchone() is not None
+
+    def save(self):
+        """ Commits the changes made to the ledger, advancing its version if there were any. """
+
+        if self.db.total_changes != self.savedChanges:
+            self.db.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+        self.db.commit()
+        self.savedChanges = self.db.total_changes
+
+    def stamp(self):
+        """ Returns a (uid, version) tuple identifying the saved state of the ledger. """
+
+        meta = dict(self.db.execute("SELECT key, value FROM meta WHERE key IN ('uid', 'version')"))
+        return (meta['uid'], meta['version'])
+
+    def add(self, metadata):
+        """
+        Adds a file to the ledger, replacing any file already shared under the same name.
+
+        Inputs: metadata - The FileMetadata object describing the file.
+        """
+
+        values = [getattr(metadata, name) for name in FileMetadata.attrs]
+        if metadata.digest is not None:
+            values[FileMetadata.attrs.index('digest')] = sqlite3.Binary(metadata.digest)
+
+        self.db.execute("DELETE FROM files WHERE name = ?", (metadata.name,))
+        self.db.execute("INSERT INTO files (%s) VALUES (%s)" % (self.COLUMNS, ', '.join('?' * len(values))), values)
+
+    def remove(self, name):
+        """
+        Removes a file from the ledger, if it is in it.
+
+        Inputs: name - The name the file is shared under.
+        """
+
+        self.db.execute("DELETE FROM files WHERE name = ?", (name,))
+
+    def record(self, name):
+        """
+        Looks up a file, whether or not it's password protected.
+
+        Inputs: name - The name the file is shared under.
+
+        Outputs: The FileMetadata of the file, or None if there is no such file.
+        """
+
+        for metadata in self._select("WHERE name = ?", (name,)):
+            return metadata
+
+        return None
+
+    def get(self, name, password=None):
+        """
+        Looks up a file which a peer has asked for.
+
+        Inputs: name     - The name the file is shared under.
+                password - The password the peer gave for the file, if any.
+
+        Outputs: The FileMetadata of the file, or None if there is no such file or the password given is incorrect.
+        """
+
+        metadata = self.record(name)
+        if metadata is None or (metadata.password and metadata.password != password):
+            return None
+
+        return metadata
+
+    def under(self, directory):
+        """
+        Finds the files stored beneath a directory.
+
+        Inputs: directory - The path to the directory.
+
+        Outputs: A list of the FileMetadata of the files.
+        """
+
+        # Every path beneath the directory sorts between its path with a trailing separator and the next character up
+        prefix = directory.rstrip(os.sep) + os.sep
+
+        return list(self._select("WHERE path >= ? AND path < ?", (prefix, prefixEnd(prefix))))
+
+    def page(self, after=None, prefix='', limit=SEARCH_LIMIT):
+        """
+        Lists the visible files in the ledger in order of their names, a page at a time.
+
+        Inputs: after  - The name after which the page begins.  The page begins with the first file if not given.
+                prefix - If given, only files whose names begin with it are listed.
+                limit  - The maximum number of files to list.
+
+        Outputs: A list of the FileMetadata of the files.
+        """
+
+        conditions = ["visible"]
+        args = []
+
+        if after is not None:
+            conditions.append("name > ?")
+            args.append(after)
+
+        if prefix:
+            conditions.append("name >= ? AND name < ?")
+            args.extend((prefix, prefixEnd(prefix)))
+
+        return list(self._select("WHERE %s ORDER BY name LIMIT ?" % ' AND '.join(conditions), args + [limit]))
+
+    def withDigest(self, digest):
+        """
+        Finds the files with the given contents.
+
+        Inputs: digest - The digest identifying the contents of the files.
+
+        Outputs: A list of the FileMetadata of the files.
+        """
+
+        return list(self._select("WHERE digest = ?", (sqlite3.Binary(digest),)))
+
+    def search(self, text, limit=SEARCH_LIMIT, minSize=None, maxSize=None):
+        """
+        Searches the names and paths of the visible files in the ledger.
+
+        Inputs: text    - The words to search for.  Every word must begin a word of the file's name or path.
+                limit   - The maximum number of results to return.
+                minSize - If given, the smallest size of file to return.
+                maxSize - If given, the largest size of file to return.
+
+        Outputs: A list of the FileMetadata of the matching files, best matches first.
+        """
+
+        words = text.split()
+        if not words:
+            return []
+
+        conditions = ["files.visible"]
+        args = []
+
+        if minSize is not None:
+            conditions.append("files.size >= ?")
+            args.append(minSize)
+
+        if maxSize is not None:
+            conditions.append("files.size <= ?")
+            args.append(maxSize)
+
+        if self.fullText:
+            # Each word is quoted, so that nothing typed is taken as FTS5 query syntax
+            query = ' '.join('"%s"*' % word.replace('"', '""') for word in words)
+            sql = ("SELECT %s FROM files_fts JOIN files ON files.id = files_fts.rowid WHERE files_fts MATCH ? AND %s "
+                   "ORDER BY files_fts.rank LIMIT ?")
+            args = [query] + args
+
+        else:
+            for word in words:
+                conditions.append("(files.name LIKE ? ESCAPE '\\' OR files.path LIKE ? ESCAPE '\\')")
+                pattern = '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                args.extend((pattern, pattern))
+
+            sql = "SELECT %s FROM files WHERE %s ORDER BY files.name LIMIT ?"
+
+        columns = ', '.join('files.' + name for name in FileMetadata.attrs)
+        rows = self.db.execute(sql % (columns, ' AND '.join(conditions)), args + [limit])
+
+        return [self._toMetadata(row) for row in rows]
+
+    def close(self):
+        self.db.close()
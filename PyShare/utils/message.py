@@ -0,0 +1,127 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import kimchi
+
+
+class CryptoMessage(object):
+    """ Class which contains a message sent between a PyShare client and server. """
+
+    # Actions
+    MESSAGE = 1         # A chat message sent to a user or room
+    ERROR = 2           # An error; sent by a client when it is logging out
+    CACHE_REFRESH = 3   # Sent by the server with a snapshot of its cache, or by a client requesting one
+    LOGOUT = 4          # A user has disconnected; conveyed to clients as part of their cache updates
+    CREATE_ROOM = 5     # Sent by a client to create a room, named by data
+    JOIN_ROOM = 6       # Sent by a client to join the room recipient_id
+    LEAVE_ROOM = 7      # Sent by a client to leave the room recipient_id
+    CACHE_DELTA = 8     # Sent by the server with the changes made to its cache since a given cache version
+    ROOM_KEY = 9        # Sent by the server with the key that messages to the room recipient_id are encrypted with
+    RESUMPTION_TICKET = 10  # Sent by the server with a ticket the client can resume its session with on reconnecting
+    FILE_REQUEST = 11   # Sent by a client to download a ledger file; data is (transferID, name, password, resume)
+    FILE_OFFER = 12     # Sent by the server to begin a download; data is (transferID, size, chunkSize, version, root)
+    FILE_CHUNK = 13     # Sent by the sender of a file with a chunk; data is (transferID, index, chunk, proof)
+    FILE_ACK = 14       # Sent by the receiver of a file once it has written a chunk; data is (transferID, index)
+    FILE_CANCEL = 15    # Sent by either side to abandon a transfer; data is (transferID, reason)
+    UPLOAD_QUERY = 16   # Sent by a client to upload a file, listing the digests of its chunks; see startUpload
+    UPLOAD_MISSING = 17     # Sent by the server with the chunks of an upload it needs; data is (transferID, ranges)
+    UPLOAD_COMPLETE = 18    # Sent by the server once an upload has been stored and shared; data is (transferID,)
+    FILE_RETRY = 19     # Sent by a client to have a chunk it could not verify resent; data is (transferID, index)
+    PUBLISH_FILES = 20  # Sent by a client with the files it shares; data is [(name, size, visible, chunkSize, root)]
+    SOURCES_QUERY = 21  # Sent by a client to find the peers sharing a file; data is (transferID, root)
+    FILE_SOURCES = 22   # Sent by the server with the peers sharing a file; data is (transferID, [(userID, ...)])
+    PEER_CHUNK_REQUEST = 23     # Sent by a client to a peer sharing a file; data is (transferID, root, indices)
+    PUBLISH_CHANGES = 24    # Sent by a client as the files it shares change; data is (files, withdrawn roots)
+    LEDGER_SEARCH = 25  # Sent by a client to search the names of the server's files; data is (queryID, text)
+    LEDGER_RESULTS = 26     # Sent by the server with the files found; data is (queryID, [(name, size, protected)])
+    NETWORK_SEARCH = 27     # Sent by a client to search its peers' files; data is (queryID, text, prefix, page)
+    NETWORK_RESULTS = 28    # Sent by the server with a page of the files found; see searchNetwork
+    LEDGER_LIST = 29        # Sent by a client to list a page of a ledger, see listLedger
+    LEDGER_PAGE = 30        # Sent by the server with a page of a ledger; data is (queryID, etag, entries, next)
+    CACHE_RESUME = 31       # Sent by a client on connecting with the versions of our state it has; see resumeState
+
+    # Actions which, when addressed to a user, are relayed to them so peers can download files from each other
+    PEER_ACTIONS = (FILE_CHUNK, FILE_CANCEL, PEER_CHUNK_REQUEST)
+
+    # Flags
+    MOD_PRINT = 1       # The message should be displayed to the user
+
+    attrs = [
+        'sender_id',
+        'recipient_id',
+        'send_time',
+        'action',
+        'data',
+        'flags'
+    ]
+
+    sender_id = None
+    recipient_id = None
+    send_time = None
+    action = None
+    data = None
+    flags = 0
+
+    def __init__(self, s=None, **kwargs):
+        """
+        Creates a message, either by deserializing a string produced by toString, or from keyword arguments.
+
+        Inputs: s      - A string produced by toString.
+                kwargs - Values for any of the attributes named in attrs.
+        """
+
+        if s is not None:
+            self.fromString(s)
+
+        for name, val in kwargs.items():
+            if name in self.attrs:
+                setattr(self, name, val)
+
+    def __iter__(self):
+        """ Yields (name, value) pairs of our attributes, so dict(message) can be used to copy a message. """
+
+        for name in self.attrs:
+            yield name, getattr(self, name)
+
+    def __repr__(self):
+        return "<CryptoMessage %s>" % dict(self)
+
+    def format(self, cache):
+        """
+        Formats the message for display to the user.
+
+        Inputs: cache - A utils.cache.ClientCache object used to look up the name of the sender.
+
+        Outputs: A string to display.
+        """
+
+        sender = cache.userDict.get(self.sender_id, self.sender_id)
+        return "[%s] %s: %s\n" % (time.strftime("%H:%M", time.localtime(self.send_time or 0)), sender, self.data)
+
+    def toString(self):
+        return kimchi.dumps(tuple(getattr(self, name) for name in self.attrs))
+
+    def fromString(self, s):
+        # Fields are decoded up front: the server reads the action and recipient of, and stamps the sender on, every
+        # message it receives, so deferring their decoding would save nothing
+        for name, val in zip(self.attrs, kimchi.loads(s)):
+            setattr(self, name, val)
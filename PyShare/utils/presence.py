@@ -0,0 +1,86 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import logging
+
+
+class PresenceCoalescer(object):
+    """
+    Gathers the changes made to the server's cache over a short window, so that a burst of logins, logouts and room
+    changes is sent to each client as a single merged update rather than an update per change.
+    """
+
+    # Number of seconds to gather changes over before flushing them
+    window = None
+    # utils.timer_wheel.TimerWheel to arm our flush timer on
+    timers = None
+    # utils.cache.ServerCache whose changes we're coalescing
+    cache = None
+    # Function to call to send the gathered changes to clients
+    flush = None
+    # utils.timer_wheel.Timer armed while changes are being gathered
+    timer = None
+    # Version of the cache when we last flushed
+    lastVersion = 0
+
+    # Counters: changes observed, updates emitted, and changes folded into an update alongside another change
+    changes = 0
+    updates = 0
+    folded = 0
+
+    def __init__(self, window, timers, cache, flush):
+        self.window = window
+        self.timers = timers
+        self.cache = cache
+        self.flush = flush
+        self.lastVersion = cache.version
+
+    def changed(self):
+        """ Notes that the cache has changed, flushing once the window has elapsed. """
+
+        if not self.window:
+            self._flush()
+
+        elif self.timer is None or not self.timer.armed:
+            self.timer = self.timers.schedule(self.window, self._flush)
+
+    def stats(self):
+        """ Returns a dictionary of our counters. """
+
+        return {'changes': self.changes, 'updates': self.updates, 'folded': self.folded}
+
+    def _flush(self):
+        """ Sends everything gathered during the window in one update. """
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        changes = self.cache.version - self.lastVersion
+        self.lastVersion = self.cache.version
+
+        self.changes += changes
+        self.updates += 1
+        self.folded += max(0, changes - 1)
+
+        logging.debug("Flushing %s presence changes (totals: %s)" % (changes, self.stats()))
+
+        self.flush()
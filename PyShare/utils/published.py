@@ -0,0 +1,245 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import heapq
+import bisect
+import itertools
+import collections
+
+# Project imports
+from utils.trigram import TrigramIndex
+
+# Description of a file a user shares from their own ledger.  root is the root of the file's Merkle tree, which
+# identifies the file by its contents no matter what it is named.
+PublishedFile = collections.namedtuple('PublishedFile', ('name', 'size', 'visible', 'chunkSize', 'root'))
+
+
+class PublishedFiles(object):
+    """
+    Class which tracks the files connected users share from their own ledgers, so that peers can find and download them.
+
+    The names of visible files are kept in a TrigramIndex, keyed by (userID, root), so they can be searched, and in a
+    sorted list for each user, so that the files a user shares can be listed a page at a time.
+    """
+
+    # Characters which separate the words of a file's name
+    SEPARATORS = ' _-./\\'
+    # Maximum number of names a search examines, so that a search matching a large share of the network's files doesn't
+    # hold up the server.  Names beginning with the text searched for are examined first.
+    MAX_MATCHES = 20000
+
+    # Dictionary mapping userIDs to dictionaries mapping Merkle roots to the PublishedFiles each user shares
+    files = None
+    # Dictionary mapping Merkle roots to the set of userIDs of the users sharing the file
+    sources = None
+    # TrigramIndex of the names of the visible files users share
+    index = None
+    # Dictionary mapping userIDs to sorted lists of (name, root) tuples of the visible files each user shares
+    listings = None
+
+    def __init__(self):
+        self.files = dict()
+        self.sources = dict()
+        self.index = TrigramIndex()
+        self.listings = dict()
+
+    def _add(self, userID, published):
+        """ Records that a user shares a file. """
+
+        self.files[userID][published.root] = published
+        self.sources.setdefault(published.root, set()).add(userID)
+
+        if published.visible:
+            self.index.add((userID, published.root), published.name)
+        else:
+            self.index.remove((userID, published.root))
+
+    def _remove(self, userID, root):
+        """ Records that a user no longer shares a file. """
+
+        published = self.files[userID].pop(root, None)
+        if published is None:
+            return
+
+        listing = self.listings.get(userID, None)
+        if listing is not None and published.visible:
+            index = bisect.bisect_left(listing, (published.name, root))
+            if index < len(listing) and listing[index] == (published.name, root):
+                del listing[index]
+
+        sources = self.sources[root]
+        sources.discard(userID)
+        if not sources:
+            del self.sources[root]
+
+        self.index.remove((userID, root))
+
+    def publish(self, userID, files):
+        """
+        Records the files a user shares, replacing any they previously shared.
+
+        Inputs: userID - The userID of the user.
+                files  - An iterable of (name, size, visible, chunkSize, root) tuples describing the files.
+        """
+
+        self.withdraw(userID)
+
+        self.files[userID] = dict()
+        for description in files:
+            self._add(userID, PublishedFile(*description))
+
+        self.listings[userID] = sorted((published.name, root) for root, published in self.files[userID].items()
+                                       if published.visible)
+
+    def update(self, userID, files, withdrawn):
+        """
+        Records changes to the files a user shares.
+
+        Inputs: userID    - The userID of the user.
+                files     - An iterable of (name, size, visible, chunkSize, root) tuples describing the files the user
+                            has begun sharing.
+                withdrawn - An iterable of the roots of the files the user no longer shares.
+        """
+
+        published = self.files.setdefault(userID, dict())
+        listing = self.listings.setdefault(userID, [])
+
+        # Files described again, such as under a new name, are replaced
+        for root in itertools.chain(withdrawn, (description[4] for description in files)):
+            self._remove(userID, root)
+
+        for description in files:
+            self._add(userID, PublishedFile(*description))
+
+        # The new files are sorted on their own, so sorting the listing merges them in a single pass
+        listing.extend(sorted((published[description[4]].name, description[4]) for description in files
+                              if published[description[4]].visible))
+        listing.sort()
+
+    def withdraw(self, userID):
+        """ Forgets the files a user shares, such as when they disconnect. """
+
+        # Drop the listing first, so it isn't picked apart file by file
+        self.listings.pop(userID, None)
+
+        for root in list(self.files.get(userID, ())):
+            self._remove(userID, root)
+
+        self.files.pop(userID, None)
+
+    def sourcesOf(self, root):
+        """
+        Finds the users sharing a file.
+
+        Inputs: root - The root of the file's Merkle tree.
+
+        Outputs: A list of (userID, PublishedFile) tuples.
+        """
+
+        return [(userID, self.files[userID][root]) for userID in self.sources.get(root, ())]
+
+    def page(self, userID, after=None, prefix='', limit=None):
+        """
+        Lists the visible files a user shares in order of their names, a page at a time.
+
+        Inputs: userID - The userID of the user.
+                after  - The name after which the page begins.  The page begins with the first file if not given.
+                prefix - If given, only files whose names begin with it are listed.
+                limit  - The maximum number of files to list.
+
+        Outputs: A list of (name, size, chunkSize, root) tuples describing the files.
+        """
+
+        listing = self.listings.get(userID, ())
+        files = self.files.get(userID, None)
+
+        start = bisect.bisect_left(listing, (prefix,))
+        if after is not None:
+            start = max(start, bisect.bisect_left(listing, (after,)))
+            while start < len(listing) and listing[start][0] == after:
+                start += 1
+
+        end = len(listing) if limit is None else start + limit
+
+        page = []
+        for name, root in listing[start:end]:
+            if not name.startswith(prefix):
+                break
+
+            published = files[root]
+            page.append((name, published.size, published.chunkSize, root))
+
+        return page
+
+    def search(self, text, prefix=False, exclude=None, limit=None):
+        """
+        Searches the names of the visible files users share.
+
+        Files are ranked first by where the text was found: at the start of the file's name, at the start of one of its
+        words, or elsewhere.  Files shared by more users, then files with shorter names, rank higher among those found
+        alike.
+
+        Inputs: text    - The text to search for.
+                prefix  - Whether the names must begin with the text, rather than merely contain it.
+                exclude - The userID of a user whose files are left out, such as the user searching.
+                limit   - The number of the best matches to return.  All matches are returned if not given.
+
+        Outputs: A tuple of the number of files found, and a list of (name, size, chunkSize, root, sources) tuples
+                 describing the best of them, best first, where sources is the number of users sharing the file.  No
+                 more than MAX_MATCHES names are examined, so no more files than that are found.
+        """
+
+        # Map the roots of the files found to the sort key of their best matching name, and the user sharing it
+        found = dict()
+        separators = self.SEPARATORS
+        sourceSets = self.sources
+
+        matches = self.index.search(text, prefix)
+
+        for (userID, root), name, position in itertools.islice(matches, self.MAX_MATCHES):
+            if userID == exclude:
+                continue
+
+            if position == 0:
+                where = 0
+            elif name[position - 1] in separators:
+                where = 1
+            else:
+                where = 2
+
+            sources = sourceSets[root]
+            key = (where, (exclude in sources) - len(sources), len(name), name)
+
+            best = found.get(root, None)
+            if best is None or key < best[0]:
+                found[root] = (key, userID)
+
+        if limit is None:
+            results = sorted(found.items(), key=lambda item: item[1][0])
+        else:
+            results = heapq.nsmallest(limit, found.items(), key=lambda item: item[1][0])
+
+        described = []
+        for root, (key, userID) in results:
+            published = self.files[userID][root]
+            described.append((published.name, published.size, published.chunkSize, root, -key[1]))
+
+        return len(found), described
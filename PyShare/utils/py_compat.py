@@ -23,9 +23,11 @@ import sys
 
 if sys.version_info.major == 2:
     UNICODE = unicode
+    UNICHR = unichr
 
 else:
     UNICODE = str
+    UNICHR = chr
 
 
 def toBytes(s):
@@ -35,7 +37,7 @@ def toBytes(s):
     """
 
     if isinstance(s, UNICODE):
-        return s.decode('utf8')
+        return s.encode('utf8')
 
     elif isinstance(s, bytes):
         return s
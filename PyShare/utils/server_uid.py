@@ -19,6 +19,7 @@
 """
 
 # Standard imports
+import hashlib
 import kimchi
 
 
@@ -35,6 +36,11 @@ class ServerUID(object):
         for name, val in zip(self.attrs, args):
             setattr(self, name, val)
 
+    def digest(self):
+        """ Returns a hex digest identifying the server, which is safe to use as a file name. """
+
+        return hashlib.sha1(kimchi.dumps(tuple(getattr(self, name) for name in self.attrs))).hexdigest()
+
     def toString(self):
         uid = kimchi.dumps(tuple(getattr(self, name) for name in self.attrs))
 
@@ -0,0 +1,257 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import signal
+import logging
+import traceback
+import multiprocessing
+
+# Project imports
+from . import engines
+from .crypto import resumption
+
+
+# Operations which are exchanged between workers, by way of the supervisor
+USER_JOINED = 1   # (userID, username)
+USER_LEFT = 2     # (userID,)
+ROOM_CREATED = 3  # (roomID, name)
+ROOM_JOINED = 4   # (roomID, userID)
+ROOM_LEFT = 5     # (roomID, userID)
+DELIVER_USER = 6  # (messageDict,)            Deliver a message to a user connected to the destination worker
+DELIVER_ROOM = 7  # (messageDict,)            Deliver a message to the destination worker's members of a room
+BROADCAST = 8     # (fromUserID, action, msg, flags)
+SYNC_REQUEST = 9  # ()                        Ask every other worker for a snapshot of its presence
+SNAPSHOT = 10     # (users, rooms)
+WORKER_LOST = 11  # (workerIndex,)            Sent by the supervisor when a worker exits
+FILES_PUBLISHED = 12  # (userID, files)       The files a user shares from their own ledger
+FILES_CHANGED = 13  # (userID, files, roots)  Changes to the files a user shares, and the roots of those withdrawn
+TICKETS_REDEEMED = 14   # (ticketIDs,)        Resumption tickets redeemed with the source, which may not be used again
+
+# Number of bits of each unique ID given to the generation of the worker which allocated it; see ShardLink.uniqueID
+GENERATION_BITS = 24
+
+
+class ShardLink(object):
+    """
+    A worker's connection to the supervisor.  Presence changes are replicated to, and messages are relayed to, the
+    other workers over it.
+
+    Each message is a tuple of (operation, source worker index, destination, args), where the destination is either the
+    index of a single worker, or None to address every worker other than the source.
+    """
+
+    # Index of the worker this link belongs to
+    workerIndex = None
+    # Total number of workers
+    workerCount = None
+    # Number of times the worker at our index had been started before ours, modulo 2 ** GENERATION_BITS
+    generation = 0
+    # multiprocessing.Connection to the supervisor
+    conn = None
+
+    def __init__(self, workerIndex, workerCount, conn, generation=0):
+        self.workerIndex = workerIndex
+        self.workerCount = workerCount
+        self.conn = conn
+        self.generation = generation
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def workerOf(self, uniqueID):
+        """ Returns the index of the worker which allocated a userID.  Workers allocate IDs in interleaved strides. """
+
+        return uniqueID % self.workerCount
+
+    def uniqueID(self, count):
+        """
+        Returns the count'th unique ID allocated by our worker.  Workers allocate IDs in interleaved strides, so they
+        never conflict and the owner of an ID is evident.  IDs also carry the generation of the worker which allocated
+        them, so that a restarted worker never reissues an ID allocated by its predecessors, which other workers may
+        still hold; such as those of the rooms it created.
+        """
+
+        return ((count << GENERATION_BITS) | self.generation) * self.workerCount + self.workerIndex
+
+    def send(self, op, destination, *args):
+        """
+        Sends an operation to other workers.
+
+        Inputs: op          - The operation to send.
+                destination - The index of the worker to send to, or None to send to every other worker.
+                args        - The arguments of the operation.
+        """
+
+        self.conn.send((op, self.workerIndex, destination, args))
+
+    def receive(self):
+        """ Returns a list of every (op, source, args) tuple waiting to be read from the supervisor. """
+
+        received = []
+        while self.conn.poll():
+            op, source, _, args = self.conn.recv()
+            received.append((op, source, args))
+
+        return received
+
+
+def _runWorker(serverClass, link):
+    """ Entry point of a worker process. """
+
+    # Leave handling of interrupts to the supervisor, which will terminate us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    try:
+        with serverClass(shard=link) as server:
+            server.loop()
+
+    except:
+        logging.error(traceback.format_exc())
+
+
+class Supervisor(object):
+    """
+    Forks a number of CryptoServer workers which share a listening port using SO_REUSEPORT, and relays presence and
+    messages between them so each worker's clients can reach the clients of every other worker.
+    """
+
+    # The CryptoServer subclass each worker runs
+    serverClass = None
+    # Number of workers to run
+    workerCount = None
+    # Lists of each worker's multiprocessing.Process, the supervisor's end of its connection, and the generation the
+    # next worker started at its index will be
+    processes = None
+    conns = None
+    generations = None
+    # utils.engines.EventEngineABC used to wait on the workers' connections
+    engine = None
+    # Dictionary mapping the file descriptors of workers' connections to the index of the worker
+    fdDict = None
+
+    def __init__(self, serverClass, workerCount):
+        self.serverClass = serverClass
+        self.workerCount = workerCount
+        self.processes = [None] * workerCount
+        self.conns = [None] * workerCount
+        self.generations = [0] * workerCount
+        self.engine = engines.getEngine()
+        self.fdDict = dict()
+
+        # Share one ticket key amongst our workers, so a client can resume its session with whichever one it reaches
+        resumption.generateTicketKey()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def spawn(self, index):
+        """ Starts, or restarts, the worker at the given index. """
+
+        generation = self.generations[index]
+        self.generations[index] = (generation + 1) % (1 << GENERATION_BITS)
+
+        conn, childConn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_runWorker, args=(self.serverClass, ShardLink(index, self.workerCount, childConn, generation))
+        )
+        process.daemon = True
+        process.start()
+        childConn.close()
+
+        self.processes[index] = process
+        self.conns[index] = conn
+        self.fdDict[conn.fileno()] = index
+        self.engine.register(conn.fileno(), engines.EVENT_READ)
+
+        logging.info("Started worker %s (pid %s)" % (index, process.pid))
+
+    def workerLost(self, index):
+        """ Cleans up after a worker which has exited, informs the other workers, then restarts it. """
+
+        conn = self.conns[index]
+        self.engine.unregister(conn.fileno())
+        del self.fdDict[conn.fileno()]
+        conn.close()
+
+        self.processes[index].join()
+        logging.error("Worker %s exited with code %s; restarting" % (index, self.processes[index].exitcode))
+
+        self.route((WORKER_LOST, index, None, (index,)))
+        self.spawn(index)
+
+    def route(self, message):
+        """ Forwards a message from a worker to its destination worker(s). """
+
+        _, source, destination, _ = message
+
+        if destination is None:
+            destinations = [index for index in range(self.workerCount) if index != source]
+        else:
+            destinations = [destination]
+
+        for index in destinations:
+            try:
+                self.conns[index].send(message)
+
+            except (IOError, OSError, EOFError):
+                logging.error("Unable to relay to worker %s" % index)
+
+    def close(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+
+        for conn in self.conns:
+            if conn is not None:
+                conn.close()
+
+        self.engine.close()
+
+    def loop(self):
+        """ Main handler.  Starts every worker, then relays between them until interrupted. """
+
+        for index in range(self.workerCount):
+            self.spawn(index)
+
+        try:
+            while True:
+                for fd, events in self.engine.poll():
+                    index = self.fdDict.get(fd)
+                    if index is None:
+                        continue
+
+                    conn = self.conns[index]
+                    try:
+                        # Our engine may be edge-triggered, so drain the connection entirely
+                        while conn.poll():
+                            self.route(conn.recv())
+
+                    except (IOError, OSError, EOFError):
+                        self.workerLost(index)
+
+        except KeyboardInterrupt:
+            logging.info("Interrupt caught. Exiting...")
+
+        finally:
+            self.close()
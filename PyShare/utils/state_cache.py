@@ -0,0 +1,108 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import logging
+import traceback
+import kimchi
+
+
+class ServerState(object):
+    """ Class which holds a client's copy of the state of a server, as of when it last saw it. """
+
+    # String serialized by utils.cache.ClientCache.toString holding our copy of the server's cache, or None if we have
+    # no copy of it
+    cache = None
+    # The (uid, version) stamp of the server's ledger when we last revalidated our pages of its listing, if ever
+    ledgerStamp = None
+    # Dictionary mapping the (prefix, after) tuple identifying each page of the listing of the server's ledger we have
+    # to an (etag, entries, next) tuple holding the page; see client.ServerComm.listLedger
+    pages = None
+
+    def __init__(self, cache=None, ledgerStamp=None, pages=None):
+        self.cache = cache
+        self.ledgerStamp = ledgerStamp
+        self.pages = pages if pages is not None else dict()
+
+
+class StateCache(object):
+    """
+    Class which keeps a client's copies of the state of the servers it connects to on disk, so that on reconnecting to
+    a server, even after the client has restarted, it need only be sent what has changed since it last saw it.
+
+    The state of each server is stored in a file of its own, named by the digest of the server's ServerUID.
+    """
+
+    # Directory the states are stored in
+    directory = None
+
+    def __init__(self, directory):
+        self.directory = directory
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, serverUID):
+        """ Returns the path the state of the server identified by the given ServerUID is stored at. """
+
+        return os.path.join(self.directory, serverUID.digest() + '.state')
+
+    def load(self, serverUID):
+        """
+        Reads our copy of the state of a server.
+
+        Inputs: serverUID - The utils.server_uid.ServerUID of the server.
+
+        Outputs: A ServerState object, which is empty if we have no copy of the server's state.
+        """
+
+        try:
+            with open(self.path(serverUID), 'rb') as stateFile:
+                contents = stateFile.read()
+
+        except (IOError, OSError):
+            return ServerState()
+
+        # A state we can't make sense of is no worse than having none; the server will send us everything again
+        try:
+            cache, ledgerStamp, pages = kimchi.loads(contents)
+            pages = dict(((prefix, after), tuple(page)) for prefix, after, page in pages)
+
+        except Exception:
+            logging.debug(traceback.format_exc())
+            return ServerState()
+
+        return ServerState(cache, None if ledgerStamp is None else tuple(ledgerStamp), pages)
+
+    def save(self, serverUID, state):
+        """
+        Stores our copy of the state of a server, replacing any copy stored before.
+
+        Inputs: serverUID - The utils.server_uid.ServerUID of the server.
+                state     - The ServerState object to store.
+        """
+
+        pages = [(prefix, after, page) for (prefix, after), page in state.pages.items()]
+        path = self.path(serverUID)
+
+        with open(path + '.tmp', 'wb') as stateFile:
+            stateFile.write(kimchi.dumps((state.cache, state.ledgerStamp, pages)))
+        os.rename(path + '.tmp', path)
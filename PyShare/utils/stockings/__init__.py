@@ -20,10 +20,13 @@
 
 # Standard imports
 import time
+import select
 import Stockings
+from Stockings.exceptions.notReady import NotReady
 
 # Project imports
 from .. import py_compat
+from ..message import CryptoMessage
 
 
 class _Stocking(Stockings.Stocking):
@@ -33,7 +36,8 @@ class _Stocking(Stockings.Stocking):
     encryptor = None
     CryptoMessage = CryptoMessage
 
-    HANDSHAKE_SLEEP_TIME = .3
+    # Longest time to wait for input from the remote during the handshake before checking whether we've been closed
+    HANDSHAKE_WAIT_TIME = 1
 
 
     def __init__(self, conn, encryptor):
@@ -42,10 +46,42 @@ class _Stocking(Stockings.Stocking):
 
         super(Stockings.Stocking, self).__init__(conn)
 
-    def preWrite(self, s):
-        """ Encrypts a string before it is sent to the endpoint. """
+    def runHandshake(self, machine):
+        """
+        Drives a handshake state machine from utils.stockings.handshake, sending the messages it produces and feeding it
+        the messages of the remote as soon as they arrive.
 
-        return self.encryptor.encrypt(s)
+        Inputs: machine - The handshake state machine to drive.
+
+        Outputs: A boolean indicating whether or not the handshake completed successfully.
+        """
+
+        for message in machine.start():
+            self._write(message)
+
+        while self.active and not machine.finished:
+            message = self._read()
+            if message is None:
+                select.select([self], [], [], self.HANDSHAKE_WAIT_TIME)
+                continue
+
+            for reply in machine.receive(message):
+                self._write(reply)
+
+        return machine.complete
+
+    def writeFrame(self, frame):
+        """ Sends a message which has already been serialized and encrypted, such as one encrypted for a whole room. """
+
+        if not self.handshakeComplete:
+            raise NotReady()
+
+        self._write(frame)
+
+    def preWrite(self, **kwargs):
+        """ Serializes and encrypts a message, given as CryptoMessage keyword arguments, before it is sent. """
+
+        return self.encryptor.encrypt(CryptoMessage(**kwargs).toString())
 
     def postRead(self, s):
         """ Decrypts a string received from the endpoint. """
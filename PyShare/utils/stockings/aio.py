@@ -0,0 +1,484 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import asyncio
+import collections
+import traceback
+import logging
+from Stockings.utils.MessageHeaders import MessageHeaders
+from Stockings.exceptions.notReady import NotReady
+
+# Project imports
+from .. import config
+from ..message import CryptoMessage
+from .handshake import ServerHandshake, ClientHandshake, NOT_COMPUTED
+
+
+class _AsyncStocking(asyncio.BufferedProtocol):
+    """
+    asyncio counterpart to a Stocking.  Rather than running a thread per connection, the connection is driven by an
+    asyncio event loop, and the handshake and message dispatch run as coroutines on that loop.
+
+    Messages are framed exactly as a Stocking frames them, so either kind of endpoint can talk to the other.  Input is
+    received directly into a buffer preallocated for the connection, and once the handshake has completed messages are
+    decrypted straight out of that buffer, without being copied out of it first.
+    """
+
+    # Crypto module used to partake in encrpyted communication with the other endpoint
+    encryptor = None
+    # utils.stockings.handshake state machine carrying out our handshake with the remote
+    handshaker = None
+    # utils.crypto.offload.CryptoPool to run the costly parts of our handshake in, if any
+    cryptoPool = None
+    # asyncio transport of the connection, and the event loop it belongs to
+    transport = None
+    eventLoop = None
+    # Address of the remote
+    addr = None
+    # Time the connection was established
+    connectionTime = None
+    # A boolean indicating whether or not this connection is ready for interaction with the remote
+    handshakeComplete = False
+    # Flag which signals whether this connection is open
+    active = False
+    # Whether the remote has fallen behind in receiving what we send it
+    congested = False
+
+    # Number of bytes which may be waiting to be sent before we're congested, the number it must fall back to before
+    # we're no longer congested, and the number at which the remote is disconnected as unable to keep up.  Left as None,
+    # asyncio's defaults apply and the remote is never disconnected.
+    highWatermark = None
+    lowWatermark = None
+    disconnectLimit = None
+
+    # Initial size of the buffer input is received into.  Grown to fit larger messages as they arrive.
+    RECEIVE_BUFFER_SIZE = 65536
+
+    # Complete messages received from the remote which have not yet been consumed.  Raw strings until our handshake
+    # completes, and CryptoMessages afterwards.
+    _inbox = None
+    # asyncio.Event set whenever a message is added to _inbox, or the connection is lost
+    _readable = None
+    # MessageHeaders object used to parse the length of incoming messages
+    _messageHeaders = None
+    # Buffer input is received into, a memoryview of it, and the number of bytes of it holding unparsed input
+    _iBuffer = None
+    _iView = None
+    _iLength = 0
+    # Total length and type of the message currently being received, once its header has been parsed
+    _iMessageLen = 0
+    _iType = None
+    # List of buffers waiting to be sent to the remote, and their total length
+    _outbox = None
+    _outboxBytes = 0
+    # Whether a flush of _outbox has been scheduled, and whether our transport has asked us to stop writing
+    _flushScheduled = False
+    _writingPaused = False
+
+    def __init__(self, encryptor):
+        self.encryptor = encryptor
+        self.connectionTime = int(time.time())
+        self._inbox = collections.deque()
+        self._readable = asyncio.Event()
+        self._messageHeaders = MessageHeaders()
+        self._resizeBuffer(self.RECEIVE_BUFFER_SIZE)
+        self._outbox = []
+
+    def __repr__(self):
+        return "<AsyncStocking (%s) [%s]>" % (self.__class__.__name__, str(self.addr))
+
+    # asyncio.Protocol overrides
+    def connection_made(self, transport):
+        self.transport = transport
+        self.eventLoop = asyncio.get_event_loop()
+        self.addr = transport.get_extra_info('peername')
+        self.active = True
+
+        if self.highWatermark is not None:
+            transport.set_write_buffer_limits(high=self.highWatermark, low=self.lowWatermark)
+
+        asyncio.ensure_future(self._run())
+
+    def get_buffer(self, sizehint):
+        # Receive straight into the free space at the end of our buffer, doubling it if it is full
+        if self._iLength == len(self._iBuffer):
+            self._resizeBuffer(2 * len(self._iBuffer))
+
+        return self._iView[self._iLength:]
+
+    def buffer_updated(self, nbytes):
+        self._iLength += nbytes
+        offset = 0
+
+        while offset < self._iLength:
+            # If we don't yet know the length of the next message, continue parsing its size header
+            if not self._iMessageLen:
+                complete = self._messageHeaders.deserialize(self._iView[offset:offset + 1].tobytes())
+                offset += 1
+                if complete:
+                    self._iMessageLen = self._messageHeaders.getLength()
+                    self._iType = self._messageHeaders.getType()
+                    self._messageHeaders.reset()
+                continue
+
+            if self._iLength - offset < self._iMessageLen:
+                break
+
+            self._receive(self._iView[offset:offset + self._iMessageLen])
+            offset += self._iMessageLen
+            self._iMessageLen = 0
+
+        # Move any partial message to the front of the buffer, and make sure there is room for all of it
+        remaining = self._iLength - offset
+        if offset:
+            self._iView[:remaining] = self._iView[offset:self._iLength]
+            self._iLength = remaining
+        if self._iMessageLen > len(self._iBuffer):
+            self._resizeBuffer(self._iMessageLen)
+
+        if self._inbox:
+            self._readable.set()
+
+    def connection_lost(self, exc):
+        self.active = False
+        self._readable.set()
+
+    def pause_writing(self):
+        self._writingPaused = True
+        self.congested = True
+        self.congestionChanged()
+
+    def resume_writing(self):
+        self._writingPaused = False
+        self._flush()
+
+        self.congested = False
+        self.congestionChanged()
+
+    # API functions
+    def read(self):
+        """ Returns the next message received from the remote if there is one, else None. """
+
+        if not self.handshakeComplete:
+            raise NotReady()
+
+        if self._inbox:
+            message = self._inbox.popleft()
+            return message if isinstance(message, CryptoMessage) else self.postRead(message)
+
+    def write(self, *args, **kwargs):
+        """ Sends a message to the remote. """
+
+        if not self.handshakeComplete:
+            raise NotReady()
+
+        self._write(self.preWrite(*args, **kwargs))
+
+    def writeFrame(self, frame):
+        """ Sends a message which has already been serialized and encrypted, such as one encrypted for a whole room. """
+
+        if not self.handshakeComplete:
+            raise NotReady()
+
+        self._write(frame)
+
+    def backlog(self):
+        """ Returns the number of bytes waiting to be sent to the remote. """
+
+        return self._outboxBytes + (self.transport.get_write_buffer_size() if self.transport is not None else 0)
+
+    def fileno(self):
+        """ Returns the file descriptor of our connection, which identifies this session. """
+
+        return self.transport.get_extra_info('socket').fileno()
+
+    def close(self):
+        """ Closes our connection. """
+
+        if self.active:
+            self.active = False
+            self.transport.close()
+            self._readable.set()
+
+    def preWrite(self, **kwargs):
+        """ Serializes and encrypts a message, given as CryptoMessage keyword arguments, before it is sent. """
+
+        return self.encryptor.encrypt(CryptoMessage(**kwargs).toString())
+
+    def postRead(self, s):
+        """ Decrypts a string received from the endpoint. """
+
+        return CryptoMessage(self.encryptor.decrypt(s))
+
+    # Subclassable functions
+    async def handshake(self):
+        """
+        Coroutine which performs a handshake with the remote, driving our handshaker as the remote's messages arrive.
+
+        Outputs: A boolean indicating whether or not the handshake completed successfully.
+        """
+
+        if self.handshaker is None:
+            return True
+
+        for message in self.handshaker.start():
+            self._write(message)
+
+        while not self.handshaker.finished:
+            message = await self._read()
+            if message is None:
+                return False
+
+            result = NOT_COMPUTED
+            work = self.handshaker.offload(message)
+            if work is not None and self.cryptoPool is not None:
+                function, args = work
+                result = await self.cryptoPool.run(function, *args)
+
+            for reply in self.handshaker.receive(message, result):
+                self._write(reply)
+
+        return self.handshaker.complete
+
+    async def dispatch(self):
+        """ Coroutine which handles the messages received from the remote once the handshake has completed. """
+
+        pass
+
+    def handshakeFailed(self):
+        """ Called when the handshake fails or raises an exception, before the connection is closed. """
+
+        pass
+
+    def congestionChanged(self):
+        """ Called when the remote falls behind in receiving what we send it, or catches back up. """
+
+        pass
+
+    # Internal functions
+    def _resizeBuffer(self, size):
+        """ Replaces our receive buffer with one of the given size, keeping the input it holds. """
+
+        buf = bytearray(size)
+        if self._iLength:
+            buf[:self._iLength] = self._iView[:self._iLength]
+
+        self._iBuffer = buf
+        self._iView = memoryview(buf)
+
+    def _receive(self, view):
+        """
+        Handles a complete message received from the remote.
+
+        Inputs: view - A memoryview of the message within our receive buffer.  Only valid until we return.
+        """
+
+        if self._iType == MessageHeaders.UNICODE:
+            message = view.tobytes().decode('utf8')
+
+        # Until our handshake completes the message is for our handshaker, which needs a copy of its own
+        elif not self.handshakeComplete:
+            message = view.tobytes()
+
+        else:
+            try:
+                message = self.postRead(view)
+
+            except Exception:
+                logging.error(traceback.format_exc())
+                return
+
+        self._inbox.append(message)
+
+    async def _read(self):
+        """ Coroutine which waits for the next raw message from the remote.  Returns None if the connection is lost. """
+
+        while not self._inbox:
+            if not self.active:
+                return None
+
+            self._readable.clear()
+            await self._readable.wait()
+
+        return self._inbox.popleft()
+
+    async def _waitReadable(self):
+        """ Coroutine which waits until there is a message to read, or the connection is lost. """
+
+        while not self._inbox and self.active:
+            self._readable.clear()
+            await self._readable.wait()
+
+    def _write(self, msg):
+        """
+        Queues a raw message to be sent to the remote, bypassing preWrite.  Everything queued over one iteration of the
+        event loop is handed to the transport together, to be sent with a single vectored write.
+        """
+
+        if len(msg) and self.active:
+            typ = type(msg)
+            if typ != bytes:
+                msg = msg.encode('utf8')
+
+            header = MessageHeaders.serialize(typ, len(msg))
+            self._outbox.append(header)
+            self._outbox.append(msg)
+            self._outboxBytes += len(header) + len(msg)
+
+            if self.disconnectLimit is not None and self.backlog() > self.disconnectLimit:
+                logging.info("%s has fallen too far behind; disconnecting." % self)
+                self.active = False
+                self.transport.abort()
+                return
+
+            if not self._flushScheduled and not self._writingPaused:
+                self._flushScheduled = True
+                self.eventLoop.call_soon(self._flush)
+
+    def _flush(self):
+        """ Hands everything in our outbox to our transport. """
+
+        self._flushScheduled = False
+
+        if self._outbox and self.active and not self._writingPaused:
+            self.transport.writelines(self._outbox)
+            self._outbox = []
+            self._outboxBytes = 0
+
+    async def _run(self):
+        """ Coroutine driving the connection: performs the handshake, then dispatches messages. """
+
+        try:
+            self.handshakeComplete = await self.handshake()
+
+        except Exception:
+            logging.error(traceback.format_exc())
+            self.handshakeComplete = False
+
+        if not self.handshakeComplete:
+            self.handshakeFailed()
+            self.close()
+            return
+
+        await self.dispatch()
+
+
+class AsyncServerStocking(_AsyncStocking):
+    """ asyncio counterpart to a ServerStocking, sending and receiving messages to and from PyShare Clients. """
+
+    # The AsyncCryptoServer which accepted this connection
+    server = None
+    # Username of the user who's authenticating
+    username = None
+    # Server password
+    password = None
+    # Unique identifier of this session
+    userID = None
+    # utils.timer_wheel.Timer objects armed by the server for this session's handshake, idle and cache resumption
+    # deadlines
+    handshakeTimer = None
+    idleTimer = None
+    resumeTimer = None
+    # Version of the server's cache this session's client was last sent, or None if it needs a full snapshot
+    cacheVersion = None
+    # Whether the client has told us which version of the server's cache it has.  It isn't sent the cache until then, or
+    # until the server's CACHE_RESUME_GRACE has passed.
+    cacheResumed = False
+
+    def __init__(self, server, userID, encryptor):
+        self.server = server
+        self.userID = userID
+        conf = config.server()
+        self.password = conf.server_password
+        self.handshaker = ServerHandshake(encryptor, self.password, server.tickets)
+
+        self.highWatermark = conf.outbound_high_watermark * 1024
+        self.lowWatermark = conf.outbound_low_watermark * 1024
+        self.disconnectLimit = conf.outbound_disconnect_limit * 1024
+        self.cryptoPool = server.cryptoPool
+
+        super(AsyncServerStocking, self).__init__(encryptor)
+
+    def connection_made(self, transport):
+        super(AsyncServerStocking, self).connection_made(transport)
+        self.username = "%s:%s" % self.addr[:2] # Updated later, when we receive the actual username
+
+        self.server.sessionConnected(self)
+
+    def connection_lost(self, exc):
+        super(AsyncServerStocking, self).connection_lost(exc)
+
+        self.server.sessionLost(self)
+
+    def handshakeFailed(self):
+        self.server.sessionFailed(self)
+
+    def congestionChanged(self):
+        self.server.sessionCongestionChanged(self)
+
+    async def dispatch(self):
+        self.server.authenticateSession(self)
+        self.server.settle()
+
+        while self.active:
+            await self._waitReadable()
+            self.server.readSession(self)
+            self.server.settle()
+
+
+class AsyncClientStocking(_AsyncStocking):
+    """ asyncio counterpart to a ClientStocking, sending and receiving messages to and from a PyShare Server. """
+
+    # Password of the server we're connecting to
+    password = None
+
+    def __init__(self, password, encryptor, ticket=None):
+        self.password = password
+        self.handshaker = ClientHandshake(encryptor, password, ticket)
+
+        super(AsyncClientStocking, self).__init__(encryptor)
+
+    @property
+    def authStr(self):
+        """ Human readable string of the status of the authentication, used to keep the user informed of its status. """
+
+        return self.handshaker.authStr
+
+    @classmethod
+    def connect(cls, loop, password, encryptor, ticket=None):
+        """
+        Connects to the PyShare Server given in our configuration.  The handshake proceeds as `loop` is run.
+
+        Inputs: loop      - The asyncio event loop to connect on.
+                password  - The password of the server.
+                encryptor - The crypto module to use to communicate with the server.
+                ticket    - The resumption ticket and secret given to us on our last connection to the server, if any.
+
+        Outputs: A connected AsyncClientStocking.
+        """
+
+        conf = config.client()
+        _, stocking = loop.run_until_complete(
+            loop.create_connection(lambda: cls(password, encryptor, ticket), conf.server_ip, conf.server_port)
+        )
+
+        return stocking
@@ -21,10 +21,10 @@
 # Standard imports
 import socket
 import time
-import kimchi
 
 # Project imports
 from . import _Stocking
+from .handshake import ClientHandshake
 from .. import config
 
 
@@ -35,11 +35,12 @@ class ClientStocking(_Stocking):
     password = None
     # Time the connection was established
     connectionTime = None
-    # Human readable string of the status of the authentication, used to keep the user informed of its status
-    authStr = "Setting up connection"
+    # utils.stockings.handshake.ClientHandshake carrying out our handshake with the server
+    handshaker = None
 
-    def __init__(self, password, encryptor, conn=None):
+    def __init__(self, password, encryptor, conn=None, ticket=None):
         self.password = password
+        self.handshaker = ClientHandshake(encryptor, password, ticket)
         self.connectionTime = int(time.time())
 
         conf = config.client()
@@ -50,50 +51,13 @@ class ClientStocking(_Stocking):
 
         super(self.__class__, self).__init__(conn, encryptor)
 
+    @property
+    def authStr(self):
+        """ Human readable string of the status of the authentication, used to keep the user informed of its status. """
+
+        return self.handshaker.authStr
+
     def handshake(self):
         """ Authenticates with the CryptoServer, setting up encryption and giving it our credentials. """
 
-        phase = 1
-
-        while self.active:
-            # Phase 1: Create a public key to send to the server
-            if phase == 1:
-                self.authStr = "Generating Private/Public Key"
-                publicKey = self.encryptor.generateClientPublicKey()
-                self._write(publicKey)
-                phase += 1
-
-            # Phase 2: Decrypt the server's symmetric key
-            elif phase == 2:
-                self.authStr = "Decrypting Server Key"
-                symmKey = self._read()
-                if symmKey is not None:
-                    self.encryptor.registerEncryptedSymmKey(symmKey)
-                    phase += 1
-
-            # Phase 3: Send the server a salt and the hash of the password salted with the salt
-            elif phase == 3:
-                self.authStr = "Authenticating with the server"
-                salt = self.encryptor.randomBytes(64)
-                hashed = self.encryptor.hash(self.password, salt)
-                self._write(kimchi.dumps((salt, hashed)))
-                phase += 1
-
-            # Phase 4: Receive and verify the hash of the password salted with the salt + 1
-            elif phase == 4:
-                self.authStr = "Verifying the server's identity"
-                hashed = self._read()
-                if hashed:
-                    salt = salt[:-1] + chr((ord(salt[-1]) + 1) % 256)
-                    hashed2 = self.encryptor.hash(self.password, salt)
-                    if hashed != hashed2:
-                        return False
-
-                    phase += 1
-
-            else:
-                return True
-
-            time.sleep(self.HANDSHAKE_SLEEP_TIME)
-
-        return False
+        return self.runHandshake(self.handshaker)
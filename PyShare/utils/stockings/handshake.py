@@ -0,0 +1,302 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import hmac
+import kimchi
+
+# Project imports
+from ..crypto import frame
+from ..crypto import resumption
+from ..crypto.rsa_aes import hashPassword, exchangeKeys
+
+# Default result passed to _Handshake.receive, signifying the work for the message has not yet been done
+NOT_COMPUTED = object()
+
+# Prefix of the first message of a client resuming its session, which would otherwise be its public key.  A DER
+# encoded key can never begin with it.
+RESUME_PREFIX = b'PyShareResume:'
+# Sent by the server when it will not resume a session; the client proceeds with the full handshake instead
+RESUME_REJECTED = b'PyShareResumeRejected'
+
+
+def _nextSalt(salt):
+    """ Returns the salt the server hashes the password with to prove its identity to the client. """
+
+    salt = bytearray(salt)
+    salt[-1] = (salt[-1] + 1) % 256
+    return bytes(salt)
+
+
+def verifyCredentials(password, creds):
+    """
+    Verifies the credentials sent by a client, computes the proof of our own identity to send back, and picks the
+    protocol version to use with the client.
+
+    Inputs: password - The password of the server.
+            creds    - The client's kimchi dumped salt, salted password hash, and supported protocol versions.
+
+    Outputs: A tuple of the reply to send to the client and the protocol version to use, or None if the client's
+             credentials are invalid.
+    """
+
+    creds = kimchi.loads(creds)
+    salt, hashed = creds[:2]
+    if hashPassword(password, salt) != hashed:
+        return None
+
+    proof = hashPassword(password, _nextSalt(salt))
+
+    # Clients which predate protocol negotiation expect the bare hash
+    if len(creds) < 3:
+        return proof, frame.PROTOCOL_KIMCHI
+
+    protocol = frame.negotiate(creds[2])
+    return kimchi.dumps((proof, protocol)), protocol
+
+
+class _Handshake(object):
+    """
+    State machine carrying out one side of the handshake between a PyShare Client and Server.
+
+    The machine performs no IO of its own: it is started, then fed each message received from the remote, and hands
+    back the messages to send in return.  It therefore only advances when input arrives, and the same machine can be
+    driven by a threaded Stocking or from an event loop.
+
+    The costly cryptography a message calls for is described by offload, so a driver which must not block can have it
+    computed elsewhere and pass the result to receive.
+    """
+
+    # Crypto module used to partake in encrypted communication with the remote
+    encryptor = None
+    # Password of the server
+    password = None
+    # The phase of the handshake we're waiting on the remote to complete
+    phase = 1
+    # Whether the handshake has finished, and if so whether it succeeded
+    finished = False
+    complete = False
+
+    def __init__(self, encryptor, password):
+        self.encryptor = encryptor
+        self.password = password
+
+    def start(self):
+        """
+        Begins the handshake.
+
+        Outputs: A list of messages to send to the remote.
+        """
+
+        return []
+
+    def offload(self, message):
+        """
+        Describes the cryptography receive will perform on a message.
+
+        Inputs: message - The raw message received.
+
+        Outputs: A tuple of a module level function and its arguments, whose result can be passed to receive, or None
+                 if the message calls for no costly work.
+        """
+
+        return None
+
+    def receive(self, message, result=NOT_COMPUTED):
+        """
+        Advances the handshake with a message received from the remote.
+
+        Inputs: message - The raw message received.
+                result  - The result of the work described by offload(message), if it has already been computed.
+
+        Outputs: A list of messages to send to the remote.
+        """
+
+        if self.finished:
+            return []
+
+        if not message:
+            return self._finish(False)
+
+        if result is NOT_COMPUTED:
+            result = None
+            work = self.offload(message)
+            if work is not None:
+                function, args = work
+                result = function(*args)
+
+        return getattr(self, '_phase%d' % self.phase)(message, result)
+
+    def _finish(self, complete):
+        """ Finishes the handshake, successfully or not. """
+
+        self.finished = True
+        self.complete = complete
+
+        return []
+
+
+class ServerHandshake(_Handshake):
+    """ Server side of the handshake, authenticating a client and receiving its credentials. """
+
+    # utils.crypto.resumption.TicketIssuer to redeem resumption tickets with, or None if resumption is disabled
+    tickets = None
+
+    def __init__(self, encryptor, password, tickets=None):
+        self.tickets = tickets
+
+        super(ServerHandshake, self).__init__(encryptor, password)
+
+    def offload(self, message):
+        if self.phase == 1 and not message.startswith(RESUME_PREFIX):
+            return exchangeKeys, (message,)
+
+        if self.phase == 3:
+            return verifyCredentials, (self.password, message)
+
+    def _phase1(self, pubKey, exchanged):
+        if pubKey.startswith(RESUME_PREFIX):
+            return self._resume(pubKey[len(RESUME_PREFIX):])
+
+        # Phase 1: Receive the clients public key, then Phase 2: Send the client our encrypted symmetric key
+        symm, encryptedSymmKey = exchanged
+        self.encryptor.registerSymmetricKey(symm)
+
+        self.phase = 3
+        return [encryptedSymmKey]
+
+    def _resume(self, request):
+        # Phase 0: Receive a returning client's resumption ticket, and derive a new symmetric key from its secret
+        try:
+            request = kimchi.loads(request)
+            ticket, clientNonce, clientProof = request[:3]
+
+        except (ValueError, TypeError, OverflowError):
+            return [RESUME_REJECTED]
+
+        secret = self.tickets.redeem(ticket) if self.tickets is not None else None
+        if secret is None or not hmac.compare_digest(clientProof, resumption.prove(secret, b'client', clientNonce)):
+            # Remain in phase 1; the client will follow up with its public key
+            return [RESUME_REJECTED]
+
+        serverNonce = self.encryptor.randomBytes(16)
+        self.encryptor.registerSymmetricKey(resumption.deriveKey(secret, clientNonce, serverNonce))
+        self.encryptor.protocol = frame.negotiate(request[3] if len(request) > 3 else None)
+
+        self._finish(True)
+        return [kimchi.dumps((serverNonce, resumption.prove(secret, b'server', clientNonce), self.encryptor.protocol))]
+
+    def _phase3(self, creds, verified):
+        # Phase 3: Receive and verify the clients salt and hashed password
+        if verified is None:
+            return self._finish(False)
+
+        # Phase 4: Send the user the hashed password salted with salt + 1, and the protocol version to use
+        reply, self.encryptor.protocol = verified
+        self._finish(True)
+        return [reply]
+
+
+class ClientHandshake(_Handshake):
+    """ Client side of the handshake, setting up encryption with the server and giving it our credentials. """
+
+    # Human readable string of the status of the handshake, used to keep the user informed of its status
+    authStr = "Setting up connection"
+    # Salt we hashed the password with
+    salt = None
+    # Tuple of the resumption ticket and secret given to us by the server on our last connection, if any
+    ticket = None
+    # Random bytes chosen by us for the resumption of our session
+    clientNonce = None
+
+    def __init__(self, encryptor, password, ticket=None):
+        self.ticket = ticket
+
+        super(ClientHandshake, self).__init__(encryptor, password)
+
+    def start(self):
+        if self.ticket is None:
+            return self._exchangeKeys()
+
+        # Phase 0: Present our resumption ticket, proving we hold its secret, rather than exchanging keys again
+        self.authStr = "Resuming session"
+        ticket, secret = self.ticket
+        self.clientNonce = self.encryptor.randomBytes(16)
+        request = kimchi.dumps((
+            ticket, self.clientNonce, resumption.prove(secret, b'client', self.clientNonce), frame.SUPPORTED_PROTOCOLS
+        ))
+
+        self.phase = 0
+        return [RESUME_PREFIX + request]
+
+    def _phase0(self, reply, result):
+        # If the server won't resume our session, perform the full handshake
+        if reply == RESUME_REJECTED:
+            return self._exchangeKeys()
+
+        secret = self.ticket[1]
+        try:
+            serverNonce, serverProof, protocol = kimchi.loads(reply)
+
+        except (ValueError, TypeError, OverflowError):
+            return self._finish(False)
+
+        if not hmac.compare_digest(serverProof, resumption.prove(secret, b'server', self.clientNonce)):
+            return self._finish(False)
+
+        self.encryptor.registerSymmetricKey(resumption.deriveKey(secret, self.clientNonce, serverNonce), server=False)
+        self.encryptor.protocol = protocol
+        return self._finish(True)
+
+    def _exchangeKeys(self):
+        # Phase 1: Create a public key to send to the server
+        self.authStr = "Generating Private/Public Key"
+        publicKey = self.encryptor.generateClientPublicKey()
+
+        self.authStr = "Decrypting Server Key"
+        self.phase = 2
+        return [publicKey]
+
+    def _phase2(self, symmKey, result):
+        # Phase 2: Decrypt the server's symmetric key
+        self.encryptor.registerEncryptedSymmKey(symmKey)
+
+        # Phase 3: Send the server a salt and the hash of the password salted with the salt
+        self.authStr = "Authenticating with the server"
+        self.salt = self.encryptor.randomBytes(64)
+        creds = kimchi.dumps((self.salt, self.encryptor.hash(self.password, self.salt), frame.SUPPORTED_PROTOCOLS))
+
+        self.authStr = "Verifying the server's identity"
+        self.phase = 4
+        return [creds]
+
+    def _phase4(self, reply, result):
+        # Phase 4: Receive and verify the hash of the password salted with the salt + 1, and the protocol version to use
+        try:
+            hashed, protocol = kimchi.loads(reply)
+
+        except (ValueError, TypeError):
+            return self._finish(False)
+
+        if hashed != self.encryptor.hash(self.password, _nextSalt(self.salt)):
+            return self._finish(False)
+
+        self.encryptor.protocol = protocol
+        return self._finish(True)
@@ -20,10 +20,10 @@
 
 # Standard imports
 import time
-import kimchi
 
 # Project imports
 from . import _Stocking
+from .handshake import ServerHandshake
 from .. import config
 
 
@@ -42,8 +42,25 @@ class ServerStocking(_Stocking):
     sockFileno = None
     # Time the connection was established
     connectionTime = None
-
-    def __init__(self, conn, userID, encryptor):
+    # utils.timer_wheel.Timer objects armed by the server for this session's handshake, idle and cache resumption
+    # deadlines
+    handshakeTimer = None
+    idleTimer = None
+    resumeTimer = None
+    # Function called from our handshake thread with this session and whether it succeeded, once the handshake ends
+    onHandshake = None
+    # utils.crypto.resumption.TicketIssuer to redeem resumption tickets with, if resumption is enabled
+    tickets = None
+    # Version of the server's cache this session's client was last sent, or None if it needs a full snapshot
+    cacheVersion = None
+    # Whether the client has told us which version of the server's cache it has.  It isn't sent the cache until then, or
+    # until the server's CACHE_RESUME_GRACE has passed.
+    cacheResumed = False
+    # Whether the client has fallen behind in receiving what we send it.  Our Stocking's thread does our sending, so
+    # this is never set; see utils.stockings.aio for the transport which tracks it.
+    congested = False
+
+    def __init__(self, conn, userID, encryptor, onHandshake=None, tickets=None):
         conf = config.server()
 
         self.connectionTime = int(time.time())
@@ -52,47 +69,19 @@ class ServerStocking(_Stocking):
         self.addr = conn.getpeername()
         self.username = "%s:%s" % self.addr # Updated later, when we receive the actual username
         self.password = conf.server_password
+        self.onHandshake = onHandshake
+        self.tickets = tickets
 
         super(self.__class__, self).__init__(conn, encryptor)
 
-    def handshake(self): # TODO cmdline args with _, break
+    def handshake(self):
         """ Authenticates a CryptoConnection, setting up encryption and receiving its credentials. """
 
-        phase = 1
-
-        while self.active:
-            # Phase 1: Receive the clients public key
-            if phase == 1:
-                pubKey = self._read()
-                if pubKey:
-                    encryptedSymmKey = self.encryptor.registerClientPublicKey(pubKey)
-                    phase += 1
-
-            # Phase 2: Send the client our encrypted symmetric key
-            elif phase == 2:
-                self._write(encryptedSymmKey)
-                phase += 1
-
-            # Phase 3: Receive and verify the clients salt and hashed password
-            elif phase == 3:
-                creds = self._read()
-                if creds:
-                    salt, hashed = kimchi.loads(creds)
-                    if self.encryptor.hash(self.password, salt) != hashed:
-                        return False
-                    phase += 1
-
-            # Phase 4: Send the user the hashed password salted with salt + 1
-            elif phase == 4:
-                salt = salt[:-1] + chr((ord(salt[-1]) + 1) % 256)
-                hashed = self.encryptor.hash(self.password, salt)
-                self._write(hashed)
-                phase += 1
-
-            else:
-                return True
-
-            time.sleep(self.HANDSHAKE_SLEEP_TIME)
+        complete = self.runHandshake(ServerHandshake(self.encryptor, self.password, self.tickets))
 
-        return False
+        # Let the server know straight away, rather than leaving it to notice
+        if self.onHandshake is not None:
+            self.handshakeComplete = complete
+            self.onHandshake(self, complete)
 
+        return complete
@@ -0,0 +1,261 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import traceback
+import logging
+
+
+class Timer(object):
+    """ Class representing a callback armed on a TimerWheel.  Returned from TimerWheel.schedule. """
+
+    # The TimerWheel this timer is armed on
+    wheel = None
+    # Tick of the wheel at which this timer expires
+    expiry = None
+    # Function to call when this timer expires, and the arguments to call it with
+    callback = None
+    args = None
+    # The wheel slot this timer is currently stored in, or None if the timer is not armed
+    _slot = None
+
+    def __init__(self, wheel, expiry, callback, args):
+        self.wheel = wheel
+        self.expiry = expiry
+        self.callback = callback
+        self.args = args
+
+    def __repr__(self):
+        return "<Timer %s @ %s>" % (getattr(self.callback, '__name__', self.callback), self.expiry)
+
+    @property
+    def armed(self):
+        """ Whether or not this timer is still waiting to expire. """
+
+        return self._slot is not None
+
+    def cancel(self):
+        """ Disarms this timer.  Cancelling a timer which has already expired or been cancelled does nothing. """
+
+        self.wheel.cancel(self)
+
+
+class TimerWheel(object):
+    """
+    Hierarchical timing wheel used to track a large number of deadlines.
+
+    Time is divided into ticks of `resolution` seconds.  The wheel is made up of LEVELS levels of SLOTS slots each;
+    a slot on level 0 holds the timers expiring on a single tick, and a slot on each higher level holds the timers
+    expiring within a span SLOTS times wider than a slot on the level below.  As time advances, the slot of a higher
+    level covering the upcoming span is cascaded down into the lower levels.
+
+    Arming and cancelling a timer are O(1), and advancing the wheel costs O(expired) plus a small constant, no matter
+    how many timers are armed.
+    """
+
+    # Number of bits of the tick covered by each level of the wheel, and the resulting number of slots per level
+    SLOT_BITS = 6
+    SLOTS = 1 << SLOT_BITS
+    SLOT_MASK = SLOTS - 1
+    # Number of levels in the wheel.  Timers further out than SLOTS ** LEVELS ticks are parked in an overflow slot.
+    LEVELS = 4
+
+    # Number of seconds each tick of the wheel represents
+    resolution = None
+    # The last tick which has been processed
+    tick = None
+    # List of LEVELS lists of SLOTS sets of Timers
+    levels = None
+    # Set of Timers expiring beyond the range of our highest level
+    overflow = None
+    # Number of armed timers
+    count = 0
+
+    def __init__(self, resolution=.1, now=None):
+        self.resolution = resolution
+        self.tick = int((time.time() if now is None else now) / resolution)
+        self.levels = [[set() for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]
+        self.overflow = set()
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _place(self, timer):
+        """ Stores an armed timer in the slot corresponding to its expiry, relative to our current tick. """
+
+        # A timer belongs to the lowest level on which it lies within the same span as our current tick
+        for level in range(self.LEVELS):
+            span = self.SLOT_BITS * (level + 1)
+            if timer.expiry >> span == self.tick >> span:
+                slot = self.levels[level][(timer.expiry >> (self.SLOT_BITS * level)) & self.SLOT_MASK]
+                break
+
+        else:
+            slot = self.overflow
+
+        slot.add(timer)
+        timer._slot = slot
+
+    def _nextTick(self):
+        """ Returns the next tick at which a timer expires or a slot must be cascaded, or None if there are no timers. """
+
+        if not self.count:
+            return None
+
+        for level in range(self.LEVELS):
+            shift = self.SLOT_BITS * level
+            slots = self.levels[level]
+
+            # Slots at or before our position on this level have already been processed or cascaded
+            for index in range(((self.tick >> shift) & self.SLOT_MASK) + 1, self.SLOTS):
+                if slots[index]:
+                    span = shift + self.SLOT_BITS
+                    return ((self.tick >> span) << span) + (index << shift)
+
+        # Everything remaining is in the overflow slot, which is revisited when our highest level wraps around
+        span = self.SLOT_BITS * self.LEVELS
+        return ((self.tick >> span) + 1) << span
+
+    def _processTick(self, tick):
+        """ Cascades any higher level slots which begin on the given tick, then expires the timers due on it. """
+
+        self.tick = tick
+
+        if self.overflow and not tick & ((1 << (self.SLOT_BITS * self.LEVELS)) - 1):
+            timers, self.overflow = self.overflow, set()
+            for timer in timers:
+                self._place(timer)
+
+        # Cascade from the highest level down, so timers cascaded out of one level can be cascaded again below it
+        for level in range(self.LEVELS - 1, 0, -1):
+            shift = self.SLOT_BITS * level
+            if tick & ((1 << shift) - 1):
+                continue
+
+            index = (tick >> shift) & self.SLOT_MASK
+            timers = self.levels[level][index]
+            if timers:
+                self.levels[level][index] = set()
+                for timer in timers:
+                    self._place(timer)
+
+        index = tick & self.SLOT_MASK
+        expired = self.levels[0][index]
+        if not expired:
+            return 0
+
+        self.levels[0][index] = set()
+        for timer in expired:
+            timer._slot = None
+            self.count -= 1
+
+        for timer in expired:
+            try:
+                timer.callback(*timer.args)
+
+            except:
+                logging.error(traceback.format_exc())
+
+        return len(expired)
+
+    def schedule(self, delay, callback, *args):
+        """
+        Arms a timer.
+
+        Inputs: delay    - The number of seconds from now after which the timer should expire.
+                callback - The function to call when the timer expires.
+                args     - Any arguments to pass to callback.
+
+        Outputs: A Timer object which can be used to cancel or reschedule the timer.
+        """
+
+        timer = Timer(self, 0, callback, args)
+        self.reschedule(timer, delay)
+        return timer
+
+    def reschedule(self, timer, delay):
+        """
+        Re-arms a timer, whether or not it is currently armed, to expire delay seconds from now.
+
+        Inputs: timer - The Timer object to re-arm.
+                delay - The number of seconds from now after which the timer should expire.
+        """
+
+        self.cancel(timer)
+
+        # Never let a timer expire before its deadline, nor on a tick which has already been processed
+        deadline = time.time() + delay
+        timer.expiry = max(-int(-deadline // self.resolution), self.tick + 1)
+
+        self._place(timer)
+        self.count += 1
+
+    def cancel(self, timer):
+        """
+        Disarms a timer.
+
+        Inputs: timer - The Timer object to disarm.
+        """
+
+        if timer._slot is not None:
+            timer._slot.discard(timer)
+            timer._slot = None
+            self.count -= 1
+
+    def advance(self, now=None):
+        """
+        Moves the wheel forward to the current time, calling the callbacks of any timers which have expired.
+
+        Inputs: now - The current unix timestamp.  Defaults to time.time().
+
+        Outputs: The number of timers which expired.
+        """
+
+        target = int((time.time() if now is None else now) / self.resolution)
+        expired = 0
+
+        # Skip directly over any ticks on which there is nothing to do
+        while True:
+            nextTick = self._nextTick()
+            if nextTick is None or nextTick > target:
+                break
+
+            expired += self._processTick(nextTick)
+
+        self.tick = max(self.tick, target)
+
+        return expired
+
+    def nextTimeout(self, now=None):
+        """
+        Computes how long it will be until the wheel next needs to be advanced.
+
+        Inputs: now - The current unix timestamp.  Defaults to time.time().
+
+        Outputs: The number of seconds until the wheel next needs advancing, or None if there are no timers armed.
+        """
+
+        nextTick = self._nextTick()
+        if nextTick is None:
+            return None
+
+        return max(0, nextTick * self.resolution - (time.time() if now is None else now))
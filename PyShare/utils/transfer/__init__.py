@@ -0,0 +1,63 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Default number of bytes of a file sent in each chunk
+CHUNK_SIZE = 256 * 1024
+# Largest chunk size a receiver may ask to resume a download with
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# Default number of chunks which may be sent ahead of the receiver's acknowledgements
+WINDOW = 8
+# Suffix given to a file while it is being received, and to the sidecar recording which of its chunks we have
+PART_SUFFIX = '.part'
+SIDECAR_SUFFIX = '.chunks'
+
+
+def chunkCount(size, chunkSize):
+    """ Returns the number of chunks of chunkSize bytes a file of the given size is split into. """
+
+    return -(-size // chunkSize)
+
+
+def missingRanges(present, chunks):
+    """
+    Computes the ranges of chunks which have not yet been received.
+
+    Inputs: present - A function taking the index of a chunk, and returning whether or not it has been received.
+            chunks  - The number of chunks in the file.
+
+    Outputs: A list of (start, end) tuples, each describing the chunks from start up to but not including end.
+    """
+
+    ranges = []
+    start = None
+
+    for index in range(chunks):
+        if present(index):
+            if start is not None:
+                ranges.append((start, index))
+                start = None
+
+        elif start is None:
+            start = index
+
+    if start is not None:
+        ranges.append((start, chunks))
+
+    return ranges
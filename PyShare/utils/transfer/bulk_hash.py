@@ -0,0 +1,296 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import io
+import os
+import sys
+import time
+import fcntl
+import struct
+import logging
+import multiprocessing
+
+# Project imports
+from .chunk_store import chunkHash
+
+# Number of bytes read from a file at once.  Reads span many chunks, so that disks see long sequential requests.
+READ_SIZE = 4 * 1024 * 1024
+# Minimum number of seconds between progress reports
+REPORT_INTERVAL = 1
+
+# ioctl mapping the extents of a file to their physical location on disk, and the structs it takes: a struct fiemap
+# (start, length, flags, mapped extents, extent count, reserved), followed by struct fiemap_extents (logical,
+# physical, length, reserved, reserved, flags, reserved x3)
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP = struct.Struct('=QQIIII')
+FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+
+
+def physicalOffset(path):
+    """
+    Finds where on disk a file begins.
+
+    Inputs: path - The path to the file.
+
+    Outputs: The physical offset of the file's first extent, or None if the filesystem can't tell us.
+    """
+
+    request = bytearray(FIEMAP.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + b'\0' * FIEMAP_EXTENT.size)
+
+    try:
+        with io.open(path, 'rb', buffering=0) as hashedFile:
+            fcntl.ioctl(hashedFile.fileno(), FS_IOC_FIEMAP, request)
+
+    except (IOError, OSError):
+        return None
+
+    if not FIEMAP.unpack_from(request)[3]:
+        return None
+
+    return FIEMAP_EXTENT.unpack_from(request, FIEMAP.size)[1]
+
+
+def order(files):
+    """
+    Orders files so they can be read with as little seeking as possible: by where they lie on disk where the
+    filesystem can tell us, and otherwise largest first, so that no one large file is left to be read on its own at the
+    end.
+
+    Inputs: files - A list of (path, size) tuples.
+
+    Outputs: The list, reordered.
+    """
+
+    offsets = dict((path, physicalOffset(path)) for path, _ in files)
+
+    located = sorted((item for item in files if offsets[item[0]] is not None), key=lambda item: offsets[item[0]])
+    unlocated = sorted((item for item in files if offsets[item[0]] is None), key=lambda item: -item[1])
+
+    return located + unlocated
+
+
+def _advise(fd, offset, length, advice):
+    """ Tells the kernel how we intend to read part of a file, if the platform supports it. """
+
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, offset, length, getattr(os, advice))
+
+
+def hashPath(job):
+    """
+    Computes the digests of the chunks of a file.  Run in the processes of a BulkHasher's pool.
+
+    Inputs: job - A (path, chunkSize) tuple.
+
+    Outputs: A (path, size, version, leaves, error) tuple.  If the file couldn't be read, size, version and leaves are
+             None, and error describes why.
+    """
+
+    path, chunkSize = job
+
+    # Each read is a whole number of chunks
+    readSize = max(chunkSize, READ_SIZE // chunkSize * chunkSize)
+    buffer = bytearray(readSize)
+    view = memoryview(buffer)
+    leaves = []
+    offset = 0
+
+    try:
+        with io.open(path, 'rb', buffering=0) as hashedFile:
+            fd = hashedFile.fileno()
+            stat = os.fstat(fd)
+
+            _advise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+
+            while True:
+                length = hashedFile.readinto(buffer)
+                if not length:
+                    break
+
+                for start in range(0, length, chunkSize):
+                    leaves.append(chunkHash(view[start:min(start + chunkSize, length)]))
+
+                # Read once and done with; don't push what others are reading out of the page cache
+                _advise(fd, offset, length, 'POSIX_FADV_DONTNEED')
+                offset += length
+
+    except (IOError, OSError) as e:
+        return path, None, None, None, str(e)
+
+    # A file modified while it was read is recorded as its earlier version, and hashed again when next checked
+    return path, offset, int(stat.st_mtime * 1000000), leaves, None
+
+
+class BulkHasher(object):
+    """
+    Class which computes the digests of the chunks of many files at once, in a pool of processes.
+
+    Files are handed out in the order they lie on disk, and each is read sequentially in large reads, so that disks
+    keep streaming rather than seeking between files.
+    """
+
+    # Number of bytes in each chunk
+    chunkSize = None
+    # Number of processes to hash with
+    processes = None
+    # Function called with a BulkHasher periodically while hashing, and once hashing is done
+    report = None
+
+    # Number of files and bytes to hash, and hashed so far, and the time hashing began
+    totalFiles = 0
+    totalBytes = 0
+    files = 0
+    bytes = 0
+    started = None
+
+    def __init__(self, chunkSize, processes=None, report=None):
+        self.chunkSize = chunkSize
+        self.processes = processes or multiprocessing.cpu_count()
+        self.report = report
+
+    @property
+    def elapsed(self):
+        """ Number of seconds spent hashing. """
+
+        return max(time.time() - self.started, 1e-6)
+
+    @property
+    def megabytesPerSecond(self):
+        return self.bytes / self.elapsed / (1024 * 1024)
+
+    @property
+    def filesPerSecond(self):
+        return self.files / self.elapsed
+
+    def hash(self, files):
+        """
+        Hashes the chunks of files.
+
+        Inputs: files - A list of (path, size) tuples describing the files.
+
+        Outputs: A generator yielding a (path, size, version, leaves, error) tuple for each file, as described by
+                 hashPath, in no particular order.
+        """
+
+        files = order(files)
+
+        self.totalFiles = len(files)
+        self.totalBytes = sum(size for _, size in files)
+        self.files = self.bytes = 0
+        self.started = time.time()
+        reported = self.started
+
+        jobs = [(path, self.chunkSize) for path, _ in files]
+
+        # A pool isn't worth starting to hash a single file
+        if self.processes == 1 or len(jobs) < 2:
+            results = (hashPath(job) for job in jobs)
+            pool = None
+
+        else:
+            pool = multiprocessing.Pool(min(self.processes, len(jobs)))
+            results = pool.imap_unordered(hashPath, jobs)
+
+        try:
+            for result in results:
+                self.files += 1
+                self.bytes += result[1] or 0
+
+                if self.report is not None and time.time() - reported >= REPORT_INTERVAL:
+                    reported = time.time()
+                    self.report(self)
+
+                yield result
+
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        if self.report is not None:
+            self.report(self)
+
+
+def consoleReport(hasher):
+    """ Reports the progress of a BulkHasher to the console. """
+
+    sys.stdout.write("\r%d/%d files, %.1f/%.1f MB, %.1f MB/s, %.1f files/s" % (
+        hasher.files, hasher.totalFiles, hasher.bytes / 1e6, hasher.totalBytes / 1e6,
+        hasher.megabytesPerSecond, hasher.filesPerSecond
+    ))
+
+    if hasher.files == hasher.totalFiles:
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
+
+def hashLedger(ledger, trees, chunkSize, processes=None, report=None):
+    """
+    Computes the Merkle trees of every file in a ledger which we don't already have, all at once.
+
+    Inputs: ledger    - The utils.ledger.Ledger listing the files.
+            trees     - The utils.transfer.merkle.TreeCache the trees are stored in.
+            chunkSize - The number of bytes in each chunk the files will be sent in.
+            processes - The number of processes to hash with.  Defaults to the number of CPUs.
+            report    - A function called with the BulkHasher periodically, to report on its progress.
+
+    Outputs: The BulkHasher used.
+    """
+
+    # Map the paths of the files to hash to their names in the ledger
+    names = dict()
+    files = []
+
+    for metadata in ledger:
+        if metadata.path is None or metadata.password:
+            continue
+
+        try:
+            stat = os.stat(metadata.path)
+
+        except (IOError, OSError):
+            continue
+
+        if trees.stale(metadata.name, stat.st_size, chunkSize, int(stat.st_mtime * 1000000)):
+            names.setdefault(metadata.path, []).append(metadata.name)
+            files.append((metadata.path, stat.st_size))
+
+    # The same file may be listed under more than one name, but need only be read once
+    files = list(dict(files).items())
+
+    hasher = BulkHasher(chunkSize, processes, report)
+
+    for path, size, version, leaves, error in hasher.hash(files):
+        if error is not None:
+            logging.error("Could not hash %s: %s" % (path, error))
+            continue
+
+        for name in names[path]:
+            tree = trees.put(name, size, chunkSize, version, leaves)
+
+            metadata = ledger.record(name)
+            if metadata is not None and metadata.digest != tree.root:
+                metadata.digest = tree.root
+                ledger.add(metadata)
+
+    ledger.save()
+
+    return hasher
@@ -0,0 +1,306 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import struct
+import time
+import hashlib
+import binascii
+import tempfile
+
+# Project imports
+from . import chunkCount
+
+# Suffix of the manifests describing the files in a ChunkStore
+MANIFEST_SUFFIX = '.manifest'
+
+
+def chunkHash(chunk):
+    """ Returns the digest a chunk is addressed by in a ChunkStore. """
+
+    return hashlib.sha256(chunk).digest()
+
+
+class Manifest(object):
+    """ Class describing a file in a ChunkStore as the digests of the chunks it is made up of. """
+
+    # Struct holding the size of the file and the number of bytes in each of its chunks
+    HEADER = struct.Struct('!QI')
+    # Number of bytes in each digest
+    DIGEST_SIZE = hashlib.sha256().digest_size
+
+    # Size of the file, the number of bytes in each chunk, and a list of the digests of its chunks
+    size = None
+    chunkSize = None
+    hashes = None
+
+    def __init__(self, size, chunkSize, hashes):
+        self.size = size
+        self.chunkSize = chunkSize
+        self.hashes = list(hashes)
+
+    @property
+    def digest(self):
+        """ The digest identifying the file, derived from its contents. """
+
+        return hashlib.sha256(self.toString()).digest()
+
+    def toString(self):
+        return self.HEADER.pack(self.size, self.chunkSize) + b''.join(self.hashes)
+
+    @classmethod
+    def fromString(cls, s):
+        size, chunkSize = cls.HEADER.unpack_from(s)
+        hashes = [s[offset:offset + cls.DIGEST_SIZE] for offset in range(cls.HEADER.size, len(s), cls.DIGEST_SIZE)]
+
+        if len(hashes) != chunkCount(size, chunkSize):
+            raise ValueError("Manifest of a %s byte file lists %s chunks." % (size, len(hashes)))
+
+        return cls(size, chunkSize, hashes)
+
+
+class ManifestReader(object):
+    """ Class which reads a file stored in a ChunkStore, for a utils.transfer.sender.FileSender to send. """
+
+    # ChunkStore the file is stored in, its path to the file's manifest, and the manifest itself
+    store = None
+    path = None
+    manifest = None
+    # Size of the file, and its version, which is derived from its contents
+    size = None
+    version = None
+
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+
+        with open(path, 'rb') as manifestFile:
+            self.manifest = Manifest.fromString(manifestFile.read())
+
+        self.size = self.manifest.size
+        self.version = struct.unpack('!Q', self.manifest.digest[:8])[0]
+
+        # Keep the chunks we read from being collected while we're open
+        store.readers.add(self)
+
+    def readinto(self, offset, buffer):
+        """
+        Reads part of the file.
+
+        Inputs: offset - The offset in the file to read from.
+                buffer - A bytearray to read into, which is filled unless the end of the file is reached first.
+
+        Outputs: The number of bytes read.
+        """
+
+        view = memoryview(buffer)
+        length = 0
+        chunkSize = self.manifest.chunkSize
+
+        while length < len(view) and offset < self.size:
+            index, within = divmod(offset, chunkSize)
+
+            with open(self.store.chunkPath(self.manifest.hashes[index]), 'rb') as chunkFile:
+                chunkFile.seek(within)
+                read = chunkFile.readinto(view[length:length + chunkSize - within])
+
+            if not read:
+                raise IOError("Chunk %s of %s is truncated." % (index, self.path))
+
+            length += read
+            offset += read
+
+        return length
+
+    def advise(self, offset, length, advice):
+        # Our chunks are separate files, which are only opened as they're read
+        pass
+
+    def close(self):
+        self.store.readers.discard(self)
+
+
+class ChunkStore(object):
+    """
+    Class which stores uploaded files as content-addressed chunks, so that a chunk shared by several files, or uploaded
+    several times, is only stored once.
+
+    Each chunk is stored in a file named by the hex digest of its contents, and each file is stored as a Manifest of
+    the digests of its chunks, named by the digest of the manifest.
+    """
+
+    # Directory the store is kept in, and its subdirectories holding chunks and manifests
+    root = None
+    chunkDir = None
+    manifestDir = None
+    # Set of the ManifestReaders currently open on the store
+    readers = None
+
+    def __init__(self, root):
+        self.root = root
+        self.chunkDir = os.path.join(root, 'chunks')
+        self.manifestDir = os.path.join(root, 'manifests')
+        self.readers = set()
+
+        for directory in (self.chunkDir, self.manifestDir):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def chunkPath(self, digest):
+        """ Returns the path a chunk with the given digest is stored at. """
+
+        name = binascii.hexlify(digest).decode('ascii')
+        return os.path.join(self.chunkDir, name[:2], name)
+
+    def has(self, digest):
+        """ Returns whether or not we have a chunk with the given digest. """
+
+        return os.path.exists(self.chunkPath(digest))
+
+    def missing(self, hashes):
+        """
+        Finds the chunks of a file which we don't have.
+
+        Inputs: hashes - A list of the digests of the file's chunks.
+
+        Outputs: A list of the indices of the chunks we don't have.  A chunk repeated within the file is only listed
+                 the first time it appears.
+        """
+
+        missing = []
+        seen = set()
+
+        for index, digest in enumerate(hashes):
+            if digest not in seen:
+                seen.add(digest)
+
+                # Chunks we have are touched, so that they aren't collected before the file's manifest refers to them
+                try:
+                    os.utime(self.chunkPath(digest), None)
+
+                except OSError:
+                    missing.append(index)
+
+        return missing
+
+    def _writeAtomically(self, path, data):
+        """ Writes a file under a temporary name, then moves it into place. """
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+        fd, tempPath = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as tempFile:
+            tempFile.write(data)
+
+        os.rename(tempPath, path)
+
+    def put(self, digest, chunk):
+        """
+        Stores a chunk.
+
+        Inputs: digest - The digest the chunk is claimed to have.
+                chunk  - A string containing the chunk.
+        """
+
+        if chunkHash(chunk) != digest:
+            raise ValueError("Chunk does not match its digest.")
+
+        if not self.has(digest):
+            self._writeAtomically(self.chunkPath(digest), chunk)
+
+    def putManifest(self, manifest):
+        """
+        Stores a manifest, once all of its chunks have been stored.
+
+        Inputs: manifest - The Manifest object to store.
+
+        Outputs: The path the manifest was stored at.
+        """
+
+        path = os.path.join(self.manifestDir, binascii.hexlify(manifest.digest).decode('ascii') + MANIFEST_SUFFIX)
+        if not os.path.exists(path):
+            self._writeAtomically(path, manifest.toString())
+
+        return path
+
+    def isManifest(self, path):
+        """ Returns whether or not a path is that of a manifest in this store. """
+
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.manifestDir)
+
+    def open(self, path):
+        """ Returns a ManifestReader reading the file described by the manifest at the given path. """
+
+        return ManifestReader(self, path)
+
+    def collectGarbage(self, live, pinned=(), grace=0):
+        """
+        Removes the manifests which are no longer used, and the chunks which no remaining manifest refers to.
+
+        Inputs: live   - An iterable of the paths of the manifests which are still in use.
+                pinned - An iterable of the digests of chunks to keep regardless, such as those of uploads in progress.
+                grace  - Number of seconds since it was last stored or asked about that a chunk is kept regardless.
+                         Protects the chunks of uploads in progress in other processes.
+
+        Outputs: A tuple of the numbers of manifests and chunks removed, and the number of bytes freed.
+        """
+
+        live = set(os.path.abspath(path) for path in live)
+        live.update(os.path.abspath(reader.path) for reader in self.readers)
+        referenced = set(pinned)
+        manifests = chunks = freed = 0
+        cutoff = time.time() - grace
+
+        for name in os.listdir(self.manifestDir):
+            path = os.path.abspath(os.path.join(self.manifestDir, name))
+            if path in live:
+                with open(path, 'rb') as manifestFile:
+                    referenced.update(Manifest.fromString(manifestFile.read()).hashes)
+
+            elif name.endswith(MANIFEST_SUFFIX):
+                os.remove(path)
+                manifests += 1
+
+        for prefix in os.listdir(self.chunkDir):
+            directory = os.path.join(self.chunkDir, prefix)
+            for name in os.listdir(directory):
+                try:
+                    digest = binascii.unhexlify(name)
+
+                # Leave alone anything which isn't a chunk, such as a chunk which is still being written
+                except (TypeError, ValueError):
+                    continue
+
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                if digest not in referenced and stat.st_mtime < cutoff:
+                    freed += stat.st_size
+                    os.remove(path)
+                    chunks += 1
+
+        return manifests, chunks, freed
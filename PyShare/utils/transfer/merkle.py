@@ -0,0 +1,258 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import struct
+import hashlib
+import binascii
+
+# Project imports
+from . import chunkCount
+from .chunk_store import chunkHash
+
+
+def _parent(left, right):
+    """ Returns the digest of an interior node of a MerkleTree, which is kept distinct from the digests of chunks. """
+
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+class MerkleTree(object):
+    """
+    Class holding a Merkle tree over the chunks of a file.
+
+    The leaves of the tree are the digests of the file's chunks, and each interior node is the digest of its two
+    children; a node without a sibling is carried up to the next level unchanged.  Given the root, any one chunk can
+    be verified using only the digests of the siblings along its path to the root, so chunks can be verified
+    independently of each other, as they arrive.
+    """
+
+    # Root of the tree of an empty file
+    EMPTY_ROOT = hashlib.sha256(b'').digest()
+
+    # List of the levels of the tree, from its leaves to its root, each being a list of digests
+    levels = None
+
+    def __init__(self, leaves):
+        self.levels = [list(leaves)]
+
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            self.levels.append([
+                _parent(level[index], level[index + 1]) if index + 1 < len(level) else level[index]
+                for index in range(0, len(level), 2)
+            ])
+
+    @property
+    def leaves(self):
+        """ The digests of the file's chunks. """
+
+        return self.levels[0]
+
+    @property
+    def root(self):
+        """ The digest identifying the whole file. """
+
+        return self.levels[-1][0] if self.leaves else self.EMPTY_ROOT
+
+    def proof(self, index):
+        """
+        Computes the proof that a chunk belongs to the file.
+
+        Inputs: index - The index of the chunk.
+
+        Outputs: A list of the digests of the chunk's siblings along its path to the root, from the bottom up.
+        """
+
+        proof = []
+
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                proof.append(level[sibling])
+            index >>= 1
+
+        return proof
+
+    @staticmethod
+    def verify(root, index, count, chunk, proof):
+        """
+        Verifies that a chunk belongs to a file.
+
+        Inputs: root  - The root of the file's MerkleTree.
+                index - The index the chunk is claimed to have.
+                count - The number of chunks in the file.
+                chunk - A string containing the chunk.
+                proof - The proof of the chunk, as returned by MerkleTree.proof.
+
+        Outputs: A boolean indicating whether or not the chunk belongs to the file at the given index.
+        """
+
+        if not 0 <= index < count:
+            return False
+
+        node = chunkHash(chunk)
+        proof = iter(proof)
+
+        while count > 1:
+            # Nodes without a sibling are carried up unchanged
+            if index ^ 1 < count:
+                sibling = next(proof, None)
+                if sibling is None:
+                    return False
+
+                node = _parent(sibling, node) if index & 1 else _parent(node, sibling)
+
+            index >>= 1
+            count = (count + 1) >> 1
+
+        return node == root and next(proof, None) is None
+
+
+def hashSource(source, chunkSize):
+    """
+    Computes the digests of the chunks of a file.
+
+    Inputs: source    - The source of the file, such as a utils.transfer.sender.LocalFile.
+            chunkSize - The number of bytes in each chunk.
+
+    Outputs: A list of the digests of the file's chunks.
+    """
+
+    # Files in a chunk store already know the digests of their chunks
+    manifest = getattr(source, 'manifest', None)
+    if manifest is not None and manifest.chunkSize == chunkSize:
+        return list(manifest.hashes)
+
+    buffer = bytearray(chunkSize)
+    view = memoryview(buffer)
+    hashes = []
+
+    source.advise(0, 0, 'POSIX_FADV_SEQUENTIAL')
+    for index in range(chunkCount(source.size, chunkSize)):
+        length = source.readinto(index * chunkSize, buffer)
+        hashes.append(chunkHash(view[:length]))
+
+    return hashes
+
+
+class TreeCache(object):
+    """
+    Class which stores the MerkleTrees of the files in a ledger, so that each file is only hashed once.
+
+    Each tree is stored as the size, chunk size and version of the file it was computed from, followed by its leaves.
+    A tree is computed again if the file, or the chunk size it is sent in, changes.
+    """
+
+    # Struct holding the size, chunk size and version of the file a tree was computed from
+    HEADER = struct.Struct('!QIQ')
+    # Number of bytes in each digest
+    DIGEST_SIZE = hashlib.sha256().digest_size
+
+    # Directory the trees are stored in
+    directory = None
+
+    def __init__(self, directory):
+        self.directory = directory
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, name):
+        """ Returns the path the tree of the file shared under the given name is stored at. """
+
+        digest = hashlib.sha256(name.encode('utf8')).digest()
+        return os.path.join(self.directory, binascii.hexlify(digest).decode('ascii') + '.tree')
+
+    def _read(self, name, header, chunkSize, size):
+        """ Returns the leaves of the stored tree of a file, if it was computed under the given header. """
+
+        try:
+            with open(self.path(name), 'rb') as treeFile:
+                contents = treeFile.read()
+
+        except (IOError, OSError):
+            return None
+
+        if contents[:self.HEADER.size] != header:
+            return None
+
+        leaves = contents[self.HEADER.size:]
+        if len(leaves) != chunkCount(size, chunkSize) * self.DIGEST_SIZE:
+            return None
+
+        return [leaves[offset:offset + self.DIGEST_SIZE] for offset in range(0, len(leaves), self.DIGEST_SIZE)]
+
+    def stale(self, name, size, chunkSize, version):
+        """
+        Returns whether or not the tree of a file must be computed, as we don't have it for the file as it is now.
+
+        Inputs: name      - The name the file is shared under.
+                size      - The size of the file.
+                chunkSize - The number of bytes in each chunk the file will be sent in.
+                version   - The version of the file.
+        """
+
+        return self._read(name, self.HEADER.pack(size, chunkSize, version), chunkSize, size) is None
+
+    def get(self, name, source, chunkSize):
+        """
+        Returns the MerkleTree of a file, computing and storing it if we don't have it.
+
+        Inputs: name      - The name the file is shared under.
+                source    - The source of the file, such as a utils.transfer.sender.LocalFile.
+                chunkSize - The number of bytes in each chunk the file will be sent in.
+        """
+
+        leaves = self._read(name, self.HEADER.pack(source.size, chunkSize, source.version), chunkSize, source.size)
+        if leaves is not None:
+            return MerkleTree(leaves)
+
+        return self.put(name, source.size, chunkSize, source.version, hashSource(source, chunkSize))
+
+    def put(self, name, size, chunkSize, version, leaves):
+        """
+        Stores the tree of a file whose chunks have been hashed elsewhere.
+
+        Inputs: name      - The name the file is shared under.
+                size      - The size of the file.
+                chunkSize - The number of bytes in each chunk the file will be sent in.
+                version   - The version of the file the chunks were read from.
+                leaves    - A list of the digests of the file's chunks.
+
+        Outputs: The file's MerkleTree.
+        """
+
+        tree = MerkleTree(leaves)
+        path = self.path(name)
+
+        with open(path + '.tmp', 'wb') as treeFile:
+            treeFile.write(self.HEADER.pack(size, chunkSize, version))
+            treeFile.write(b''.join(tree.leaves))
+        os.rename(path + '.tmp', path)
+
+        return tree
+
+    def remove(self, name):
+        """ Removes the tree of the file shared under the given name, if we have it. """
+
+        if os.path.exists(self.path(name)):
+            os.remove(self.path(name))
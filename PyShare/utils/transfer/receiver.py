@@ -0,0 +1,176 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import io
+import os
+
+# Project imports
+from . import PART_SUFFIX, SIDECAR_SUFFIX
+from .sidecar import Sidecar
+from .merkle import MerkleTree
+
+
+class FileReceiver(object):
+    """
+    Class which writes a file streamed to us in chunks.
+
+    Each chunk is written at its offset into a file named with PART_SUFFIX as it arrives, which is moved to its
+    destination once every chunk has been received.  The chunks which have been written are recorded in a Sidecar, so
+    that an interrupted download can be resumed from the chunks it is missing.
+    """
+
+    # Number of chunks to write between saving our sidecar; at most this many chunks are fetched again after a crash
+    CHECKPOINT_INTERVAL = 32
+
+    # Identifier we gave the transfer
+    transferID = None
+    # Path the file is being received to, and the path it's written to until it has been received entirely
+    path = None
+    partPath = None
+    # Password we gave for the file, if any
+    password = None
+    # Root of the file's Merkle tree, which its chunks are verified against
+    root = None
+    # utils.transfer.sidecar.Sidecar recording the chunks we've written
+    sidecar = None
+    # Number of chunks written since our sidecar was last saved
+    unsaved = 0
+
+    # Unbuffered file object of the partially received file
+    _file = None
+
+    def __init__(self, transferID, path, name, size, chunkSize, version, password=None, root=None):
+        self.transferID = transferID
+        self.path = path
+        self.partPath = path + PART_SUFFIX
+        self.password = password
+        self.root = root
+
+        # Pick up where a previous download of this version of the file left off
+        sidecarPath = self.partPath + SIDECAR_SUFFIX
+        sidecar = Sidecar.load(sidecarPath)
+        if sidecar is not None and sidecar.matches(size, chunkSize, version) and os.path.exists(self.partPath):
+            self.sidecar = sidecar
+            self._file = io.open(self.partPath, 'r+b', buffering=0)
+
+        else:
+            self.sidecar = Sidecar(sidecarPath, name, size, chunkSize, version)
+            self._file = io.open(self.partPath, 'wb', buffering=0)
+            self._file.truncate(size)
+            self.sidecar.save()
+
+    @property
+    def name(self):
+        """ The name the file is shared under. """
+
+        return self.sidecar.name
+
+    @property
+    def size(self):
+        """ The size of the file. """
+
+        return self.sidecar.size
+
+    @property
+    def chunkSize(self):
+        """ The number of bytes in each chunk of the file. """
+
+        return self.sidecar.chunkSize
+
+    @property
+    def chunks(self):
+        """ The number of chunks the file is split into. """
+
+        return self.sidecar.chunks
+
+    @property
+    def complete(self):
+        """ Whether or not every chunk of the file has been received. """
+
+        return self.sidecar.count == self.sidecar.chunks
+
+    def verify(self, index, chunk, proof):
+        """
+        Verifies that a chunk we've received belongs to the file.  May be called from several threads at once.
+
+        Inputs: index - The index of the chunk.
+                chunk - A string containing the chunk.
+                proof - The chunk's proof, as returned by utils.transfer.merkle.MerkleTree.proof.
+
+        Outputs: A boolean indicating whether or not the chunk is intact.
+        """
+
+        return self.root is None or MerkleTree.verify(self.root, index, self.chunks, chunk, proof)
+
+    def write(self, index, chunk):
+        """
+        Writes a chunk of the file.
+
+        Inputs: index - The index of the chunk.
+                chunk - A string containing the chunk.
+        """
+
+        if not 0 <= index < self.chunks:
+            raise ValueError("Chunk %s is out of range for a file of %s chunks." % (index, self.chunks))
+
+        expected = min(self.chunkSize, self.size - index * self.chunkSize)
+        if len(chunk) != expected:
+            raise ValueError("Chunk %s is %s bytes long; expected %s." % (index, len(chunk), expected))
+
+        if self.sidecar.has(index):
+            return
+
+        self._file.seek(index * self.chunkSize)
+        self._file.write(chunk)
+        self.sidecar.set(index)
+
+        self.unsaved += 1
+        if self.unsaved >= self.CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """ Saves our sidecar, once the chunks it records have reached the disk. """
+
+        os.fsync(self._file.fileno())
+        self.sidecar.save()
+        self.unsaved = 0
+
+    def finish(self):
+        """ Moves the received file to its destination. """
+
+        self._file.close()
+        os.rename(self.partPath, self.path)
+        self.sidecar.remove()
+
+    def suspend(self):
+        """ Stops receiving the file, keeping what we've received of it so that the download can be resumed. """
+
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+
+    def cancel(self):
+        """ Abandons the transfer, removing the partially received file. """
+
+        self._file.close()
+        if os.path.exists(self.partPath):
+            os.remove(self.partPath)
+        self.sidecar.remove()
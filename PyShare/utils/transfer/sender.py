@@ -0,0 +1,246 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import io
+import os
+import collections
+
+# Project imports
+from . import CHUNK_SIZE, MAX_CHUNK_SIZE, WINDOW, chunkCount
+
+
+class LocalFile(object):
+    """ Class which reads a file on disk, for a FileSender to send. """
+
+    # Path to the file
+    path = None
+    # Size of the file, and its version, which changes whenever the file is modified
+    size = None
+    version = None
+
+    # Unbuffered file object of the file
+    _file = None
+
+    def __init__(self, path):
+        self.path = path
+        self._file = io.open(path, 'rb', buffering=0)
+
+        stat = os.fstat(self._file.fileno())
+        self.size = stat.st_size
+        self.version = int(stat.st_mtime * 1000000)
+
+    def readinto(self, offset, buffer):
+        """
+        Reads part of the file.
+
+        Inputs: offset - The offset in the file to read from.
+                buffer - A bytearray to read into, which is filled unless the end of the file is reached first.
+
+        Outputs: The number of bytes read.
+        """
+
+        self._file.seek(offset)
+        return self._file.readinto(buffer)
+
+    def advise(self, offset, length, advice):
+        """ Tells the kernel how we intend to read part of the file, if the platform supports it. """
+
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self._file.fileno(), offset, length, getattr(os, advice))
+
+    def close(self):
+        self._file.close()
+
+
+class FileSender(object):
+    """
+    Class which streams a file to a peer in chunks.
+
+    Chunks are read on demand into a single reusable buffer, and no more than `window` chunks are ever awaiting the
+    peer's acknowledgement, so the memory a transfer uses is bounded by the window rather than by the size of the file.
+    A peer resuming a download may ask for only the ranges of chunks it is missing.
+    """
+
+    # Identifier the receiver gave the transfer
+    transferID = None
+    # Size of the file, the number of bytes in each chunk, and the number of chunks the file is split into
+    size = None
+    chunkSize = None
+    chunks = None
+    # Version of the file, which changes whenever the file is modified, so receivers can tell if it has changed
+    version = None
+    # Number of chunks which may be awaiting acknowledgement at once
+    window = None
+    # Set of the indices of the chunks which have been sent, but not yet acknowledged
+    inFlight = None
+    # utils.transfer.merkle.MerkleTree of the file, whose proofs are sent along with its chunks, if it has one
+    tree = None
+    # Deque of the indices of chunks the receiver has asked to be sent again, and a dictionary mapping the indices of
+    # those chunks to the number of times they have been
+    retries = None
+    retryCounts = None
+
+    # Source of the file being sent, such as a LocalFile, and the buffer its chunks are read into
+    source = None
+    _buffer = None
+    _view = None
+    # Iterator over the indices of the chunks still to be sent, and whether or not it has been exhausted
+    _schedule = None
+    _exhausted = False
+    # Index of the chunk last read
+    _lastIndex = None
+
+    def __init__(self, transferID, source, chunkSize=CHUNK_SIZE, window=WINDOW):
+        self.transferID = transferID
+        self.source = source
+        self.size = source.size
+        self.version = source.version
+        self.window = window
+        self.inFlight = set()
+        self.retries = collections.deque()
+        self.retryCounts = dict()
+
+        self._setChunkSize(chunkSize)
+        self._schedule = iter(range(self.chunks))
+
+        # Let the kernel read ahead of us
+        source.advise(0, 0, 'POSIX_FADV_SEQUENTIAL')
+
+    def _setChunkSize(self, chunkSize):
+        """ Splits the file into chunks of the given size. """
+
+        self.chunkSize = chunkSize
+        self.chunks = chunkCount(self.size, chunkSize)
+        self._buffer = bytearray(chunkSize)
+        self._view = memoryview(self._buffer)
+
+    def _ranged(self, ranges):
+        """ Yields the indices of the chunks within a list of (start, end) ranges. """
+
+        for start, end in ranges:
+            for index in range(max(start, 0), min(end, self.chunks)):
+                yield index
+
+    def resume(self, chunkSize, version, ranges):
+        """
+        Restricts the transfer to the chunks a receiver resuming a download is missing.  Must be called before any
+        chunks are sent.
+
+        Inputs: chunkSize - The chunk size the receiver's partial download was split into.
+                version   - The version of the file the receiver's partial download is of.
+                ranges    - A list of (start, end) tuples describing the ranges of chunks the receiver is missing.
+
+        Outputs: A boolean indicating whether or not the download can be resumed.  If it cannot, the whole file will be
+                 sent instead.
+        """
+
+        if version != self.version or not 0 < chunkSize <= MAX_CHUNK_SIZE:
+            return False
+
+        if chunkSize != self.chunkSize:
+            self._setChunkSize(chunkSize)
+        self.select(ranges)
+
+        return True
+
+    def select(self, ranges):
+        """
+        Restricts the transfer to the given chunks.  Must be called before any chunks are sent.
+
+        Inputs: ranges - A list of (start, end) tuples describing the ranges of chunks to send.
+        """
+
+        self._schedule = self._ranged(ranges)
+
+    @property
+    def done(self):
+        """ Whether or not every chunk of the file has been sent and acknowledged. """
+
+        return self._exhausted and not self.inFlight and not self.retries
+
+    def read(self, index):
+        """
+        Reads a chunk of the file.
+
+        Inputs: index - The index of the chunk to read.
+
+        Outputs: A string containing the chunk.
+        """
+
+        offset = index * self.chunkSize
+
+        # We're skipping to a new range; have the kernel begin reading the chunks we'll send from it next
+        if index - 1 != self._lastIndex:
+            self.source.advise(offset, self.window * self.chunkSize, 'POSIX_FADV_WILLNEED')
+        self._lastIndex = index
+
+        length = self.source.readinto(offset, self._buffer)
+        return self._view[:length].tobytes()
+
+    def pending(self):
+        """ Yields (index, chunk) tuples of the chunks which may be sent now, marking each as in flight. """
+
+        while len(self.inFlight) < self.window:
+            # Chunks which must be sent again go ahead of those not yet sent
+            if self.retries:
+                index = self.retries.popleft()
+
+            elif self._exhausted:
+                break
+
+            else:
+                index = next(self._schedule, None)
+                if index is None:
+                    self._exhausted = True
+                    break
+
+            self.inFlight.add(index)
+            yield index, self.read(index)
+
+    def ack(self, index):
+        """
+        Records the receiver's acknowledgement of a chunk, opening the window for another.
+
+        Inputs: index - The index of the chunk acknowledged.
+        """
+
+        self.inFlight.discard(index)
+
+    def retry(self, index):
+        """
+        Queues a chunk the receiver could not verify to be sent again.
+
+        Inputs: index - The index of the chunk.
+
+        Outputs: The number of times the chunk has now been asked for again.
+        """
+
+        if index in self.inFlight:
+            self.inFlight.discard(index)
+            self.retries.append(index)
+            self.retryCounts[index] = self.retryCounts.get(index, 0) + 1
+
+        return self.retryCounts.get(index, 0)
+
+    def close(self):
+        """ Closes the file being sent. """
+
+        self.source.close()
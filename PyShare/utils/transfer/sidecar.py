@@ -0,0 +1,142 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import struct
+
+# Project imports
+from . import chunkCount, missingRanges
+
+
+class Sidecar(object):
+    """
+    Class which records which chunks of a partially received file have been written, in a file alongside it.
+
+    The sidecar holds the size and chunk size of the file, the version the sender gave it, and the name it is shared
+    under, followed by a bitmap with a bit set for each chunk which has been written.  It is rewritten atomically each
+    time it is saved, so it never claims a chunk which a crash could have lost.
+    """
+
+    # Struct holding the size, chunk size and version of the file, and the length of its name
+    HEADER = struct.Struct('!QIQH')
+
+    # Path the sidecar is stored at
+    path = None
+    # Name the file is shared under
+    name = None
+    # Size of the file, the number of bytes in each chunk, and the number of chunks the file is split into
+    size = None
+    chunkSize = None
+    chunks = None
+    # Version the sender gave the file, which changes whenever the file does
+    version = None
+    # Bytearray holding a bit for each chunk, and the number of bits set in it
+    bitmap = None
+    count = 0
+
+    def __init__(self, path, name, size, chunkSize, version, bitmap=None):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.chunkSize = chunkSize
+        self.chunks = chunkCount(size, chunkSize)
+        self.version = version
+
+        if bitmap is None:
+            bitmap = bytearray(-(-self.chunks // 8))
+
+        self.bitmap = bitmap
+        self.count = sum(1 for index in range(self.chunks) if self.has(index))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a sidecar from disk.
+
+        Inputs: path - The path the sidecar is stored at.
+
+        Outputs: A Sidecar object, or None if there is no sidecar at the path, or it could not be read.
+        """
+
+        try:
+            with open(path, 'rb') as sidecarFile:
+                contents = sidecarFile.read()
+
+        except (IOError, OSError):
+            return None
+
+        if len(contents) < cls.HEADER.size:
+            return None
+
+        size, chunkSize, version, nameLength = cls.HEADER.unpack_from(contents)
+        if not chunkSize:
+            return None
+
+        bitmapStart = cls.HEADER.size + nameLength
+        bitmap = bytearray(contents[bitmapStart:])
+        if len(bitmap) != -(-chunkCount(size, chunkSize) // 8):
+            return None
+
+        name = contents[cls.HEADER.size:bitmapStart].decode('utf8')
+        return cls(path, name, size, chunkSize, version, bitmap)
+
+    def matches(self, size, chunkSize, version):
+        """ Returns whether or not this sidecar describes the given version of a file, split into the same chunks. """
+
+        return (self.size, self.chunkSize, self.version) == (size, chunkSize, version)
+
+    def has(self, index):
+        """ Returns whether or not the chunk at the given index has been written. """
+
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def set(self, index):
+        """ Records that the chunk at the given index has been written. """
+
+        if not self.has(index):
+            self.bitmap[index >> 3] |= 1 << (index & 7)
+            self.count += 1
+
+    def missing(self):
+        """ Returns a list of (start, end) tuples describing the ranges of chunks which have not been written. """
+
+        return missingRanges(self.has, self.chunks)
+
+    def save(self):
+        """ Writes the sidecar to disk, replacing the previous sidecar atomically. """
+
+        name = self.name.encode('utf8')
+
+        tempPath = self.path + '.tmp'
+        with open(tempPath, 'wb') as sidecarFile:
+            sidecarFile.write(self.HEADER.pack(self.size, self.chunkSize, self.version, len(name)))
+            sidecarFile.write(name)
+            sidecarFile.write(self.bitmap)
+            sidecarFile.flush()
+            os.fsync(sidecarFile.fileno())
+
+        os.rename(tempPath, self.path)
+
+    def remove(self):
+        """ Removes the sidecar from disk. """
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
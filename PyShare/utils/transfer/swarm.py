@@ -0,0 +1,286 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import itertools
+
+# Project imports
+from . import WINDOW
+
+
+class Peer(object):
+    """ Class tracking a peer a SwarmScheduler is downloading chunks from. """
+
+    # Weight given to each new throughput sample
+    SMOOTHING = .25
+
+    # userID of the peer
+    userID = None
+    # Set of the indices of the chunks the peer has, or None if it has all of them
+    have = None
+    # Dictionary mapping the indices of the chunks requested from the peer to the time they were requested
+    inFlight = None
+    # Smoothed number of bytes per second the peer has been sending us chunks at, or None before its first chunk
+    throughput = None
+    # Time the peer last sent us a chunk, or we first requested one from it
+    lastActive = None
+    # Total number of bytes received from the peer, and the number of chunks it sent which failed verification
+    received = 0
+    failures = 0
+
+    def __init__(self, userID, have=None):
+        self.userID = userID
+        self.have = have
+        self.inFlight = dict()
+
+    def __repr__(self):
+        return "<Peer %s: %s B/s, %s in flight>" % (self.userID, self.throughput, len(self.inFlight))
+
+    def has(self, index):
+        """ Returns whether or not the peer has the chunk at the given index. """
+
+        return self.have is None or index in self.have
+
+    def record(self, size, now):
+        """ Updates the peer's throughput with a chunk of the given size which arrived at the given time. """
+
+        elapsed = max(now - self.lastActive, 1e-6)
+        sample = size / elapsed
+
+        if self.throughput is None:
+            self.throughput = sample
+        else:
+            self.throughput += self.SMOOTHING * (sample - self.throughput)
+
+        self.received += size
+        self.lastActive = now
+
+
+class SwarmScheduler(object):
+    """
+    Class which decides which chunks of a file to request from each of the peers it's being downloaded from.
+
+    Each peer may have up to `window` chunks requested from it at once.  Free slots are filled fastest peer first, each
+    with the missing chunk held by the fewest peers, so that chunks only a few peers have are fetched while those peers
+    are still around.  Once every missing chunk has been requested, idle peers are also asked for the chunks held by
+    the slowest peers, so that the end of the download isn't held up by them; whichever copy arrives first is kept.
+    """
+
+    # Number of chunks a peer may fail to send intact before we stop downloading from it
+    MAX_FAILURES = 3
+
+    # Number of chunks in the file
+    chunks = None
+    # Number of chunks which may be requested from each peer at once
+    window = None
+    # Number of seconds a peer may go without sending us a chunk it owes us before we give up on it
+    timeout = None
+    # Dictionary mapping userIDs to the Peers we're downloading from
+    peers = None
+    # Set of the indices of the chunks we've yet to receive
+    missing = None
+    # Dictionary mapping the indices of requested chunks to the set of userIDs of the peers they were requested from
+    requested = None
+
+    def __init__(self, chunks, missing=None, window=WINDOW, timeout=30):
+        self.chunks = chunks
+        self.window = window
+        self.timeout = timeout
+        self.peers = dict()
+        self.missing = set(range(chunks) if missing is None else missing)
+        self.requested = dict()
+
+    @property
+    def done(self):
+        """ Whether or not every chunk has been received. """
+
+        return not self.missing
+
+    def addPeer(self, userID, have=None, now=None):
+        """
+        Begins downloading from a peer.
+
+        Inputs: userID - The userID of the peer.
+                have   - A set of the indices of the chunks the peer has, or None if it has all of them.
+                now    - The current time.
+        """
+
+        if userID not in self.peers:
+            self.peers[userID] = Peer(userID, have)
+            self.peers[userID].lastActive = now
+
+    def removePeer(self, userID):
+        """ Stops downloading from a peer, freeing the chunks requested from it to be requested from others. """
+
+        peer = self.peers.pop(userID, None)
+        if peer is not None:
+            for index in peer.inFlight:
+                self._unrequest(index, userID)
+
+    def _unrequest(self, index, userID):
+        """ Records that a chunk is no longer expected from a peer. """
+
+        holders = self.requested.get(index, None)
+        if holders is not None:
+            holders.discard(userID)
+            if not holders:
+                del self.requested[index]
+
+    def _request(self, peer, index, now):
+        """ Records that a chunk has been requested from a peer. """
+
+        if not peer.inFlight:
+            peer.lastActive = now
+
+        peer.inFlight[index] = now
+        self.requested.setdefault(index, set()).add(peer.userID)
+
+    def schedule(self, now):
+        """
+        Assigns missing chunks to the peers with room for them.
+
+        Inputs: now - The current time.
+
+        Outputs: A dictionary mapping userIDs to lists of the indices of the chunks to request from each peer.
+        """
+
+        assignments = dict()
+
+        # Peers we've yet to hear from are tried before being ranked by their throughput
+        peers = sorted(self.peers.values(), key=lambda peer: -(peer.throughput or float('inf')))
+        if not peers:
+            return assignments
+
+        unrequested = [index for index in self.missing if index not in self.requested]
+
+        # Only rank chunks by their rarity if some peers are missing some chunks
+        if any(peer.have is not None for peer in peers):
+            unrequested.sort(key=lambda index: (sum(1 for peer in peers if peer.has(index)), index))
+        else:
+            unrequested.sort()
+
+        for peer in peers:
+            free = self.window - len(peer.inFlight)
+            if free <= 0:
+                continue
+
+            chosen = list(itertools.islice((index for index in unrequested if peer.has(index)), free))
+            if not chosen:
+                continue
+
+            for index in chosen:
+                self._request(peer, index, now)
+
+            assignments[peer.userID] = chosen
+            taken = set(chosen)
+            unrequested = [index for index in unrequested if index not in taken]
+
+        # Endgame: idle peers duplicate the requests made of slower peers
+        if not unrequested:
+            for peer in peers:
+                free = self.window - len(peer.inFlight)
+                if free <= 0:
+                    continue
+
+                slower = [other for other in reversed(peers) if other is not peer and other.inFlight and
+                          (other.throughput or 0) < (peer.throughput or 0)]
+
+                chosen = []
+                for other in slower:
+                    for index in sorted(other.inFlight, key=other.inFlight.get):
+                        if len(chosen) < free and index not in peer.inFlight and peer.has(index):
+                            chosen.append(index)
+
+                for index in chosen:
+                    self._request(peer, index, now)
+
+                if chosen:
+                    assignments.setdefault(peer.userID, []).extend(chosen)
+
+        return assignments
+
+    def requestedFrom(self, userID, index):
+        """ Whether or not we're waiting on a peer to send us a chunk, so a chunk from anyone else can be ignored. """
+
+        return userID in self.requested.get(index, ())
+
+    def received(self, userID, index, size, now):
+        """
+        Records the arrival of an intact chunk.
+
+        Inputs: userID - The userID of the peer which sent the chunk.
+                index  - The index of the chunk.
+                size   - The number of bytes in the chunk.
+                now    - The current time.
+
+        Outputs: A boolean indicating whether or not this is the first copy of the chunk to arrive.
+        """
+
+        peer = self.peers.get(userID, None)
+        if peer is not None and peer.inFlight.pop(index, None) is not None:
+            peer.record(size, now)
+
+        if index not in self.missing:
+            return False
+
+        # Any other peers this chunk was requested from will send it to us anyway, but no longer owe it to us
+        self.missing.discard(index)
+        for holder in self.requested.pop(index, ()):
+            other = self.peers.get(holder, None)
+            if other is not None:
+                other.inFlight.pop(index, None)
+
+        return True
+
+    def failed(self, userID, index):
+        """
+        Records a chunk which a peer sent us which failed verification, freeing it to be requested again.
+
+        Inputs: userID - The userID of the peer which sent the chunk.
+                index  - The index of the chunk.
+        """
+
+        peer = self.peers.get(userID, None)
+        if peer is None:
+            return
+
+        peer.inFlight.pop(index, None)
+        self._unrequest(index, userID)
+
+        peer.failures += 1
+        if peer.failures >= self.MAX_FAILURES:
+            self.removePeer(userID)
+
+    def expire(self, now):
+        """
+        Gives up on the peers which have gone too long without sending us chunks they owe us.
+
+        Inputs: now - The current time.
+
+        Outputs: A list of the userIDs of the peers given up on.
+        """
+
+        expired = [peer.userID for peer in self.peers.values()
+                   if peer.inFlight and now - peer.lastActive > self.timeout]
+
+        for userID in expired:
+            self.removePeer(userID)
+
+        return expired
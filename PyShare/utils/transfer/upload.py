@@ -0,0 +1,125 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Project imports
+from . import chunkCount, missingRanges
+from .chunk_store import Manifest, chunkHash
+
+
+class ChunkUpload(object):
+    """
+    Class which receives a file uploaded into a utils.transfer.chunk_store.ChunkStore.
+
+    The uploader first lists the digests of the file's chunks, and is asked only for the chunks the store does not
+    already have.  Each chunk is checked against its digest as it arrives, and the file's manifest is stored once every
+    chunk is.
+    """
+
+    # Identifier the uploader gave the transfer
+    transferID = None
+    # ChunkStore the file is uploaded into
+    store = None
+    # utils.file_metadata.FileMetadata the file is to be shared with, once uploaded.  Its path and digest are filled in at
+    # the end.
+    metadata = None
+    # Manifest of the file being uploaded
+    manifest = None
+    # Set of the indices of the chunks which have yet to be received
+    missing = None
+
+    def __init__(self, transferID, store, metadata, chunkSize, hashes):
+        if len(hashes) != chunkCount(metadata.size, chunkSize):
+            raise ValueError("A %s byte file cannot be made up of %s chunks." % (metadata.size, len(hashes)))
+
+        if any(len(digest) != Manifest.DIGEST_SIZE for digest in hashes):
+            raise ValueError("Malformed chunk digest.")
+
+        self.transferID = transferID
+        self.store = store
+        self.metadata = metadata
+        self.manifest = Manifest(metadata.size, chunkSize, hashes)
+        self.missing = set(store.missing(hashes))
+
+    @property
+    def complete(self):
+        """ Whether or not every chunk of the file is in the store. """
+
+        return not self.missing
+
+    def missingRanges(self):
+        """ Returns a list of (start, end) tuples describing the ranges of chunks the uploader must send. """
+
+        return missingRanges(lambda index: index not in self.missing, len(self.manifest.hashes))
+
+    def write(self, index, chunk):
+        """
+        Stores a chunk of the file.
+
+        Inputs: index - The index of the chunk.
+                chunk - A string containing the chunk.
+        """
+
+        if index not in self.missing:
+            raise ValueError("Chunk %s was not asked for." % index)
+
+        expected = min(self.manifest.chunkSize, self.manifest.size - index * self.manifest.chunkSize)
+        if len(chunk) != expected:
+            raise ValueError("Chunk %s is %s bytes long; expected %s." % (index, len(chunk), expected))
+
+        self.store.put(self.manifest.hashes[index], chunk)
+        self.missing.discard(index)
+
+    def finish(self):
+        """
+        Stores the file's manifest.
+
+        Outputs: The utils.file_metadata.FileMetadata of the file, with its path and digest set to those of its manifest.
+        """
+
+        self.metadata.path = self.store.putManifest(self.manifest)
+        self.metadata.digest = self.manifest.digest
+        return self.metadata
+
+
+def hashFile(path, chunkSize):
+    """
+    Computes the digests of the chunks of a file, for uploading it into a ChunkStore.
+
+    Inputs: path      - The path to the file.
+            chunkSize - The number of bytes in each chunk.
+
+    Outputs: A tuple of the size of the file, and a list of the digests of its chunks.
+    """
+
+    hashes = []
+    size = 0
+    buffer = bytearray(chunkSize)
+    view = memoryview(buffer)
+
+    with open(path, 'rb', buffering=0) as fileToHash:
+        while True:
+            length = fileToHash.readinto(buffer)
+            if not length:
+                break
+
+            hashes.append(chunkHash(view[:length]))
+            size += length
+
+    return size, hashes
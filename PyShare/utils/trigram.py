@@ -0,0 +1,152 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+
+class TrigramIndex(object):
+    """
+    Index answering substring and prefix searches over a changing set of names.
+
+    Each name is broken into the overlapping three character sequences (trigrams) it contains, and each trigram maps to
+    the set of entries whose names contain it.  A search intersects the sets of the trigrams of the text searched for,
+    smallest first, then confirms that each remaining entry actually contains the text.  Names are indexed with a
+    marker before their first character, so that a prefix search has trigrams of its own.  Searches for text too short
+    to have any trigrams look through every entry, which also finds the names too short to have any.
+
+    Names are indexed and searched case insensitively.
+    """
+
+    # Marker placed before the first character of every name
+    START = '\x02'
+
+    # Dictionary mapping trigrams to the sets of the ids of the entries whose names contain them
+    postings = None
+    # Dictionary mapping the ids of entries to their (key, name) tuples, where name is lowercase
+    entries = None
+    # Dictionary mapping the keys of entries to their ids
+    ids = None
+    # Counter used to assign ids to entries
+    nextID = 0
+
+    def __init__(self):
+        self.postings = dict()
+        self.entries = dict()
+        self.ids = dict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def trigrams(text):
+        """ Returns the set of trigrams in a string. """
+
+        return set(text[index:index + 3] for index in range(len(text) - 2))
+
+    def add(self, key, name):
+        """
+        Indexes a name, replacing the name previously indexed under the same key.
+
+        Inputs: key  - A hashable identifying the entry, returned from searches which match it.
+                name - The name to index.
+        """
+
+        self.remove(key)
+
+        entryID = self.nextID
+        self.nextID += 1
+
+        name = name.lower()
+        self.ids[key] = entryID
+        self.entries[entryID] = (key, name)
+
+        for trigram in self.trigrams(self.START + name):
+            self.postings.setdefault(trigram, set()).add(entryID)
+
+    def remove(self, key):
+        """ Removes the entry with the given key from the index, if it's in it. """
+
+        entryID = self.ids.pop(key, None)
+        if entryID is None:
+            return
+
+        _, name = self.entries.pop(entryID)
+
+        for trigram in self.trigrams(self.START + name):
+            posting = self.postings[trigram]
+            posting.discard(entryID)
+            if not posting:
+                del self.postings[trigram]
+
+    def search(self, text, prefix=False):
+        """
+        Finds the entries whose names contain some text.
+
+        Inputs: text   - The text to search for.
+                prefix - Whether the names must begin with the text, rather than merely contain it.
+
+        Outputs: A generator yielding a (key, name, position) tuple for each entry found, where position is the index in
+                 the entry's lowercase name at which the text was found.  Entries whose names begin with the text are
+                 yielded first.
+        """
+
+        text = text.lower()
+        if not text:
+            return
+
+        trigrams = self.trigrams(self.START + text if prefix else text)
+
+        # Text too short to have trigrams of its own is looked for in every entry, and names beginning with it go first
+        if not trigrams:
+            found = []
+            for key, name in self.entries.values():
+                position = name.find(text)
+                if position == 0 or (position > 0 and not prefix):
+                    found.append((key, name, position))
+
+            for result in sorted(found, key=lambda result: result[2] != 0):
+                yield result
+            return
+
+        postings = sorted((self.postings.get(trigram, set()) for trigram in trigrams), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+
+        # Names beginning with the text are among those which also have the trigram of its start.  Having it only means
+        # a name begins with the text's first two characters, so the others having it are held back until after them.
+        starts = candidates & self.postings.get(self.START + text[:2], set())
+        entries = self.entries
+        later = []
+
+        for entryID in starts:
+            key, name = entries[entryID]
+
+            position = name.find(text)
+            if position == 0:
+                yield key, name, position
+            elif position > 0 and not prefix:
+                later.append((key, name, position))
+
+        for result in later:
+            yield result
+
+        for entryID in candidates - starts:
+            key, name = entries[entryID]
+
+            position = name.find(text)
+            if position > 0 and not prefix:
+                yield key, name, position
@@ -0,0 +1,114 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PyShare'))
+
+# Project imports
+from utils.transfer import CHUNK_SIZE
+from utils.transfer.sender import LocalFile
+from utils.transfer.merkle import hashSource
+from utils.transfer.bulk_hash import BulkHasher
+
+# Number of files in the share, and the largest of them
+FILE_COUNT = 400
+MAX_FILE_SIZE = 4 * 1024 * 1024
+
+
+def makeShare(directory):
+    """ Fills a directory with files of random sizes, returning a list of (path, size) tuples describing them. """
+
+    files = []
+    for index in range(FILE_COUNT):
+        path = os.path.join(directory, 'file%d' % index)
+        size = random.randint(0, MAX_FILE_SIZE)
+        with open(path, 'wb') as shareFile:
+            shareFile.write(os.urandom(size))
+        files.append((path, size))
+
+    return files
+
+
+def evict(files):
+    """ Drops the files from the page cache, so that each way of hashing them reads them from disk. """
+
+    for path, _ in files:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def hashSequentially(files):
+    """ Hashes the files one at a time, in the order given, as a client sharing its ledger once did. """
+
+    for path, _ in files:
+        source = LocalFile(path)
+        hashSource(source, CHUNK_SIZE)
+        source.close()
+
+
+def hashInBulk(files, processes):
+    """ Hashes the files with a BulkHasher. """
+
+    for _ in BulkHasher(CHUNK_SIZE, processes).hash(files):
+        pass
+
+
+def timeHash(func, *args):
+    """ Returns the MB/s and files/s achieved by func. """
+
+    evict(args[0])
+
+    start = time.time()
+    func(*args)
+    elapsed = time.time() - start
+
+    return sum(size for _, size in args[0]) / elapsed / (1024 * 1024), len(args[0]) / elapsed
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        files = makeShare(directory)
+
+        print("%24s %10s %10s" % ("", "MB/s", "files/s"))
+        print("%24s %10.1f %10.1f" % (("sequential",) + timeHash(hashSequentially, files)))
+
+        for processes in sorted(set((1, 2, multiprocessing.cpu_count()))):
+            label = "bulk, %d processes" % processes
+            print("%24s %10.1f %10.1f" % ((label,) + timeHash(hashInBulk, files, processes)))
+
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
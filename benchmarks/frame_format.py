@@ -0,0 +1,75 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PyShare'))
+
+# Project imports
+from utils.crypto import frame
+from utils.crypto.rsa_aes import RSA_AES
+
+MESSAGE_SIZES = (16, 256, 4096, 65536)
+# Number of messages to time for each message size
+ITERATIONS = 20000
+
+
+def pair(protocol):
+    """ Returns a client and server RSA_AES sharing a symmetric key, and speaking the given protocol version. """
+
+    client = RSA_AES()
+    server = RSA_AES()
+    client.registerEncryptedSymmKey(server.registerClientPublicKey(client.generateClientPublicKey()))
+    client.protocol = server.protocol = protocol
+
+    return client, server
+
+
+def timeMessages(protocol, size):
+    """
+    Returns the mean number of microseconds taken to encrypt and decrypt a message of the given size, and the number of
+    bytes the encrypted message occupies beyond the plaintext.
+    """
+
+    client, server = pair(protocol)
+    plaintext = os.urandom(size)
+
+    start = time.time()
+    for _ in range(ITERATIONS):
+        server.decrypt(client.encrypt(plaintext))
+    elapsed = time.time() - start
+
+    return elapsed / ITERATIONS * 1e6, len(client.encrypt(plaintext)) - size
+
+
+def main():
+    print("%8s %16s %16s %16s %16s" % ("size", "kimchi (us)", "binary (us)", "kimchi (bytes)", "binary (bytes)"))
+
+    for size in MESSAGE_SIZES:
+        kimchiTime, kimchiBytes = timeMessages(frame.PROTOCOL_KIMCHI, size)
+        binaryTime, binaryBytes = timeMessages(frame.PROTOCOL_BINARY, size)
+        print("%8d %16.2f %16.2f %16d %16d" % (size, kimchiTime, binaryTime, kimchiBytes, binaryBytes))
+
+
+if __name__ == '__main__':
+    main()
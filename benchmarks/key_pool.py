@@ -0,0 +1,78 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PyShare'))
+
+# Project imports
+from utils.crypto.rsa_aes import RSA_AES
+
+# Number of logins in each burst
+BURST_SIZES = (1, 4, 16)
+# Number of keys the pool keeps in reserve
+RESERVE = 16
+# Seconds between bursts, giving the pool time to refill
+REFILL_WAIT = 10
+
+
+def handshake():
+    """ Performs the key exchange of a login, as done by a ClientStocking and ServerStocking. """
+
+    client = RSA_AES()
+    server = RSA_AES()
+    client.registerEncryptedSymmKey(server.registerClientPublicKey(client.generateClientPublicKey()))
+
+
+def timeBurst(count):
+    """ Returns the number of handshakes per second achieved over a burst of count back to back handshakes. """
+
+    start = time.time()
+    for _ in range(count):
+        handshake()
+
+    return count / (time.time() - start)
+
+
+def main():
+    print("%8s %22s %22s" % ("burst", "no pool (hs/sec)", "pool (hs/sec)"))
+
+    results = [[count, timeBurst(count)] for count in BURST_SIZES]
+
+    RSA_AES.startKeyPool(RESERVE)
+    try:
+        for result in results:
+            time.sleep(REFILL_WAIT)
+            result.append(timeBurst(result[0]))
+
+        for count, withoutPool, withPool in results:
+            print("%8d %22.2f %22.2f" % (count, withoutPool, withPool))
+
+        print("pool stats: %s" % RSA_AES.keyPool.stats())
+
+    finally:
+        RSA_AES.stopKeyPool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PyShare'))
+
+# Project imports
+from utils.ledger import Ledger
+from utils.file_metadata import FileMetadata
+
+FILE_COUNTS = (10000, 100000, 1000000)
+# Number of searches to time for each ledger
+SEARCHES = 200
+# Words file names are made up of
+WORDS = ('holiday', 'report', 'invoice', 'backup', 'photo', 'draft', 'final', 'music', 'album', 'video', 'notes',
+         'budget', 'thesis', 'scan', 'archive', 'release', 'build', 'sample', 'export', 'summary')
+EXTENSIONS = ('.txt', '.pdf', '.jpg', '.mp3', '.tar.gz', '.doc')
+
+
+def fileName(index):
+    """ Makes up a file name of a few words, unique to the given index. """
+
+    return '_'.join(random.sample(WORDS, 3)) + '_%d' % index + random.choice(EXTENSIONS)
+
+
+def buildLedger(path, count):
+    """ Fills a ledger with count files, returning the number of seconds it took. """
+
+    start = time.time()
+
+    ledger = Ledger(path)
+    for index in range(count):
+        name = fileName(index)
+        ledger.add(FileMetadata(name, random.randint(1, 1 << 30), None, '/srv/share/' + name, True))
+    ledger.save()
+    ledger.close()
+
+    return time.time() - start
+
+
+def timeSearches(ledger, queries):
+    """ Returns the mean number of milliseconds a search of the ledger takes. """
+
+    start = time.time()
+    for query in queries:
+        ledger.search(query)
+
+    return (time.time() - start) / len(queries) * 1000
+
+
+def timeScan(ledger, query):
+    """ Returns the number of milliseconds a search takes by reading every file in the ledger, as was once required. """
+
+    start = time.time()
+    [metadata for metadata in ledger if query in metadata.name]
+
+    return (time.time() - start) * 1000
+
+
+def main():
+    print("%10s %10s %10s %16s %14s %16s" % ("files", "build (s)", "open (ms)", "selective (ms)", "broad (ms)",
+                                               "full scan (ms)"))
+
+    for count in FILE_COUNTS:
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'ledger')
+            build = buildLedger(path, count)
+
+            start = time.time()
+            ledger = Ledger(path)
+            opened = (time.time() - start) * 1000
+
+            # Selective searches name a file more or less exactly, while broad ones match a large share of the ledger,
+            # every match of which must be ranked
+            selective = [random.choice(WORDS)[:4] + ' %d' % random.randrange(count) for _ in range(SEARCHES)]
+            broad = [' '.join(random.sample(WORDS, 2)) for _ in range(SEARCHES)]
+
+            print("%10d %10.1f %10.2f %16.3f %14.1f %16.1f" % (count, build, opened, timeSearches(ledger, selective),
+                                                               timeSearches(ledger, broad),
+                                                               timeScan(ledger, 'holiday')))
+            ledger.close()
+
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
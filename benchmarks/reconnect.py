@@ -0,0 +1,160 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import sys
+import time
+import random
+import shutil
+import hashlib
+import tempfile
+import kimchi
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PyShare'))
+
+# Project imports
+from utils.cache import ServerCache, ClientCache
+from utils.ledger import Ledger
+from utils.file_metadata import FileMetadata
+
+USER_COUNTS = (1000, 10000, 50000)
+ROOM_COUNT = 100
+# Number of presence changes made while the client is away
+MISSED_CHANGES = 50
+FILE_COUNT = 100000
+# Number of files on each page of the ledger's listing, as in the server's listing_page_size
+PAGE_SIZE = 500
+
+
+def buildCache(users):
+    """ Returns a ServerCache with the given number of users spread across our rooms. """
+
+    cache = ServerCache()
+    for roomID in range(ROOM_COUNT):
+        cache.newRoom(roomID, 'room %d' % roomID)
+
+    for userID in range(ROOM_COUNT, ROOM_COUNT + users):
+        cache.addRemoteUser(userID, 'user%d' % userID)
+        cache.joinRoom(userID, random.randrange(ROOM_COUNT))
+
+    return cache
+
+
+def page(ledger, after):
+    """ Builds a page of the ledger's listing as the server does, returning (etag, entries, next, bytes). """
+
+    entries = [(metadata.name, metadata.size, bool(metadata.password))
+               for metadata in ledger.page(after, '', PAGE_SIZE + 1)]
+    following = entries[PAGE_SIZE - 1][0] if len(entries) > PAGE_SIZE else None
+    data = kimchi.dumps((entries[:PAGE_SIZE], following))
+
+    return hashlib.sha256(data).digest()[:16], entries[:PAGE_SIZE], following, len(data)
+
+
+def timePresence():
+    """ Compares the snapshot of the server's cache a client is sent with the changes it missed. """
+
+    print("%10s %16s %16s %14s %14s" % ("users", "snapshot (KiB)", "snapshot (ms)", "delta (KiB)", "delta (ms)"))
+
+    for users in USER_COUNTS:
+        cache = buildCache(users)
+        client = ClientCache()
+        client.fromString(cache.toString())
+
+        for _ in range(MISSED_CHANGES // 2):
+            userID = random.choice(list(cache.remoteUsers))
+            cache.removeUser(userID)
+            cache.addRemoteUser(userID + users, 'user%d' % (userID + users))
+
+        start = time.time()
+        snapshot = cache.toString()
+        ClientCache().fromString(snapshot)
+        snapshotTime = (time.time() - start) * 1000
+
+        start = time.time()
+        delta = cache.deltaString(client.version)
+        client.applyDelta(delta)
+        deltaTime = (time.time() - start) * 1000
+
+        print("%10d %16.1f %16.2f %14.2f %14.3f" % (users, len(snapshot) / 1024.0, snapshotTime, len(delta) / 1024.0,
+                                                      deltaTime))
+
+
+def timeListing():
+    """ Compares relisting the server's ledger with revalidating the pages of it a reconnecting client has. """
+
+    directory = tempfile.mkdtemp()
+    try:
+        ledger = Ledger(os.path.join(directory, 'ledger'))
+        for index in range(FILE_COUNT):
+            ledger.add(FileMetadata('file_%07d' % index, random.randint(1, 1 << 30), None, '/srv/%d' % index, True))
+        ledger.save()
+
+        # The client has listed the whole ledger before
+        pages = []
+        after = None
+        start = time.time()
+        sent = 0
+        while True:
+            etag, entries, following, size = page(ledger, after)
+            pages.append((after, etag))
+            sent += size
+            if following is None:
+                break
+            after = following
+        relist = (time.time() - start) * 1000
+
+        stamp = ledger.stamp()
+        ledger.add(FileMetadata('file_%07d' % random.randrange(FILE_COUNT), 1, None, '/srv/changed', True))
+        ledger.save()
+
+        # With the ledger changed, each page is rebuilt, and only those whose ETags differ are sent
+        start = time.time()
+        changed = 0
+        for after, etag in pages:
+            pageETag, entries, following, size = page(ledger, after)
+            if pageETag != etag:
+                changed += size
+        revalidate = (time.time() - start) * 1000
+
+        # With the ledger unchanged, comparing its stamp is all there is to do
+        start = time.time()
+        unchanged = ledger.stamp() == stamp
+        stampTime = (time.time() - start) * 1000
+
+        print("")
+        print("%10s %8s %20s %22s %20s" % ("files", "pages", "relist (ms / KiB)", "revalidate (ms / KiB)",
+                                           "unchanged (ms / KiB)"))
+        print("%10d %8d %11.1f / %6.1f %13.1f / %6.1f %11.3f / %6.1f" % (FILE_COUNT, len(pages), relist, sent / 1024.0,
+                                                                       revalidate, changed / 1024.0, stampTime, 0))
+        ledger.close()
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    timePresence()
+    timeListing()
+
+
+if __name__ == '__main__':
+    main()
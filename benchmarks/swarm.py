@@ -0,0 +1,88 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import sys
+import heapq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PyShare'))
+
+# Project imports
+from utils.transfer.swarm import SwarmScheduler
+
+CHUNK_SIZE = 256 * 1024
+# Number of chunks in the simulated file (256 MiB)
+CHUNKS = 1024
+# Seconds between a chunk being requested and the peer beginning to send it
+LATENCY = .02
+# Upload bandwidths of the simulated peers, in bytes per second
+PEERS = {
+    1: 4 * 1024 * 1024,
+    2: 2 * 1024 * 1024,
+    3: 1 * 1024 * 1024,
+    4: 256 * 1024,
+}
+
+
+def simulate(peers):
+    """
+    Simulates downloading a file from the given peers, each of which sends the chunks requested of it one at a time.
+
+    Inputs: peers - A dictionary mapping the userIDs of the peers to their upload bandwidths.
+
+    Outputs: A tuple of the number of seconds the download took, and the number of chunks received more than once.
+    """
+
+    scheduler = SwarmScheduler(CHUNKS)
+    for userID in peers:
+        scheduler.addPeer(userID, now=0)
+
+    # Heap of (arrival time, userID, index) tuples of the chunks on their way to us, and the time each peer is next free
+    arrivals = []
+    busyUntil = dict((userID, 0) for userID in peers)
+    duplicates = 0
+    now = 0
+
+    while not scheduler.done:
+        for userID, indices in scheduler.schedule(now).items():
+            for index in indices:
+                start = max(now + LATENCY, busyUntil[userID])
+                busyUntil[userID] = start + CHUNK_SIZE / float(peers[userID])
+                heapq.heappush(arrivals, (busyUntil[userID], userID, index))
+
+        now, userID, index = heapq.heappop(arrivals)
+        if not scheduler.received(userID, index, CHUNK_SIZE, now):
+            duplicates += 1
+
+    return now, duplicates
+
+
+def main():
+    print("%-24s %12s %12s %12s" % ("peers", "seconds", "MiB/s", "duplicates"))
+
+    fastest = max(PEERS, key=PEERS.get)
+    for name, peers in (("fastest peer alone", {fastest: PEERS[fastest]}), ("all peers", PEERS)):
+        elapsed, duplicates = simulate(peers)
+        print("%-24s %12.2f %12.2f %12d" % (name, elapsed, CHUNKS * CHUNK_SIZE / elapsed / 1024 / 1024, duplicates))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PyShare'))
+
+# Project imports
+from utils.timer_wheel import TimerWheel
+
+SESSION_COUNTS = (100, 1000, 10000, 50000)
+# Number of loop iterations to time for each session count
+ITERATIONS = 2000
+# Idle deadline given to each session, in seconds
+IDLE_PERIOD = 3600
+
+
+class IdleSession(object):
+    """ Stand-in for a ServerStocking which never sends anything. """
+
+    active = True
+    connectionTime = None
+    idleTimer = None
+
+    def __init__(self):
+        self.connectionTime = int(time.time())
+
+
+def scanLoop(sessions, now):
+    """ One pass of the server loop as it was before the timer wheel: every session is inspected. """
+
+    for session in sessions:
+        if now - session.connectionTime > IDLE_PERIOD or not session.active:
+            pass
+
+
+def wheelLoop(wheel, now):
+    """ One pass of the server loop using the timer wheel: only expired deadlines are touched. """
+
+    wheel.advance(now)
+    wheel.nextTimeout(now)
+
+
+def timeLoop(func, *args):
+    """ Returns the mean number of microseconds a single call to func takes. """
+
+    now = time.time()
+    start = time.time()
+    for i in range(ITERATIONS):
+        func(*(args + (now + i * .05,)))
+
+    return (time.time() - start) / ITERATIONS * 1e6
+
+
+def main():
+    print("%10s %18s %18s" % ("sessions", "scan (us/loop)", "wheel (us/loop)"))
+
+    for count in SESSION_COUNTS:
+        wheel = TimerWheel()
+        sessions = [IdleSession() for _ in range(count)]
+        for session in sessions:
+            session.idleTimer = wheel.schedule(IDLE_PERIOD * random.uniform(.5, 1), lambda: None)
+
+        print("%10d %18.2f %18.2f" % (count, timeLoop(scanLoop, sessions), timeLoop(wheelLoop, wheel)))
+
+
+if __name__ == '__main__':
+    main()
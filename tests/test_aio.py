@@ -0,0 +1,250 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import types
+import socket
+import asyncio
+import pytest
+
+pytest.importorskip('kimchi')
+pytest.importorskip('hconf')
+pytest.importorskip('Stockings')
+pytest.importorskip('Cryptodome')
+
+# Project imports
+from utils import config
+from utils import shard as sharding
+from utils.cache import ClientCache
+from utils.message import CryptoMessage
+from utils.crypto.rsa_aes import RSA_AES
+from utils.stockings.aio import AsyncClientStocking
+
+PASSWORD = 'correct horse'
+
+
+def options(declared, **overrides):
+    """ Returns a configuration holding the defaults of the declared options, with the given overrides. """
+
+    values = dict((option['name'], option.get('default')) for option in declared)
+    values.update(overrides)
+
+    return types.SimpleNamespace(**values)
+
+
+def runUntil(loop, predicate, timeout=10):
+    """ Runs an event loop until predicate returns something truthy, returning it. """
+
+    async def wait():
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            result = predicate()
+            if result:
+                return result
+            await asyncio.sleep(.01)
+
+    return loop.run_until_complete(wait())
+
+
+def receive(loop, stocking, action):
+    """ Runs an event loop until a stocking receives a message with the given action, returning the message. """
+
+    def poll():
+        message = stocking.read()
+        while message is not None and message.action != action:
+            message = stocking.read()
+        return message
+
+    return runUntil(loop, poll)
+
+
+def login(server, password=PASSWORD, ticket=None):
+    """ Connects a client to the server, returning its stocking once its handshake has finished. """
+
+    client = AsyncClientStocking.connect(server.eventLoop, password, RSA_AES(), ticket)
+    runUntil(server.eventLoop, lambda: client.handshakeComplete or not client.active)
+
+    return client
+
+
+@pytest.fixture(params=[0, 1], ids=['inline', 'crypto-pool'])
+def server(request, tmp_path, monkeypatch):
+    # The server logs to a file in the working directory
+    monkeypatch.chdir(tmp_path)
+
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    monkeypatch.setattr(config, '_SERVER_CONFIG', options(
+        config._SERVER, server_ip='127.0.0.1', server_port=port, server_password=PASSWORD,
+        file_ledger_path=str(tmp_path / 'ledger'), handshake_workers=request.param, resumption_ticket_lifetime=60
+    ))
+    monkeypatch.setattr(config, '_CLIENT_CONFIG', options(config._CLIENT, server_ip='127.0.0.1', server_port=port))
+
+    from async_server import AsyncCryptoServer
+
+    server = AsyncCryptoServer()
+    yield server
+    server.close()
+
+
+def test_login(server):
+    client = login(server)
+
+    assert client.handshakeComplete
+    assert runUntil(server.eventLoop, lambda: len(server.cache.authenticated) == 1)
+
+    # Once logged in, messages flow both ways: the client asks for the cache and is sent a snapshot including itself
+    assert receive(server.eventLoop, client, CryptoMessage.RESUMPTION_TICKET) is not None
+    client.write(action=CryptoMessage.CACHE_RESUME, data=(None, None, None, []), flags=0)
+    snapshot = receive(server.eventLoop, client, CryptoMessage.CACHE_REFRESH)
+
+    cache = ClientCache()
+    cache.fromString(snapshot.data)
+    assert list(cache.userDict) == list(server.cache.authenticated)
+
+    client.close()
+
+
+def test_cacheWithoutResume(server):
+    # Clients predating CACHE_RESUME are sent a snapshot of the cache once they've had their chance to send one
+    server.CACHE_RESUME_GRACE = .2
+    client = login(server)
+
+    snapshot = receive(server.eventLoop, client, CryptoMessage.CACHE_REFRESH)
+    assert snapshot is not None
+
+    cache = ClientCache()
+    cache.fromString(snapshot.data)
+    assert list(cache.userDict) == list(server.cache.authenticated)
+
+    client.close()
+
+
+def test_logout(server):
+    first = login(server)
+    assert runUntil(server.eventLoop, lambda: len(server.cache.authenticated) == 1)
+    firstID = list(server.cache.authenticated)[0]
+
+    second = login(server)
+    second.write(action=CryptoMessage.CACHE_RESUME, data=(None, None, None, []), flags=0)
+    cache = ClientCache()
+    deltas = []
+
+    def sync():
+        """ Applies the cache updates the second client has received, returning the users it knows of. """
+
+        message = second.read()
+        while message is not None:
+            if message.action == CryptoMessage.CACHE_REFRESH:
+                cache.fromString(message.data)
+            elif message.action == CryptoMessage.CACHE_DELTA:
+                assert cache.applyDelta(message.data) is not None
+                deltas.append(message)
+            message = second.read()
+        return cache.userDict
+
+    assert runUntil(server.eventLoop, lambda: firstID in sync())
+
+    # Logging out cleanly is passed on to the other clients in a delta of the cache
+    del deltas[:]
+    first.write(action=CryptoMessage.ERROR, data=None, flags=0)
+    assert runUntil(server.eventLoop, lambda: firstID not in sync())
+    assert deltas
+
+    first.close()
+    second.close()
+
+
+class FakeShard(sharding.ShardLink):
+    """ Stands in for the link of the first of two workers, recording what it sends and handing back its inbox. """
+
+    def __init__(self):
+        super(FakeShard, self).__init__(0, 2, None)
+        self.sent = []
+        self.inbox = []
+
+    def send(self, op, destination, *args):
+        self.sent.append((op, destination, args))
+
+    def receive(self):
+        inbox, self.inbox = self.inbox, []
+        return inbox
+
+
+def test_ticketsRedeemedAcrossWorkers(server):
+    server.shard = FakeShard()
+
+    # A ticket redeemed by a client resuming with this worker is passed on to the others
+    client = login(server)
+    ticket = tuple(receive(server.eventLoop, client, CryptoMessage.RESUMPTION_TICKET).data)
+    client.close()
+
+    resumed = login(server, ticket=ticket)
+    assert resumed.authStr == "Resuming session"
+    shared = lambda: [sent for sent in server.shard.sent if sent[0] == sharding.TICKETS_REDEEMED]
+    assert runUntil(server.eventLoop, shared)
+    resumed.close()
+
+    # A ticket redeemed with another worker can't be redeemed with this one
+    client = login(server)
+    ticket = tuple(receive(server.eventLoop, client, CryptoMessage.RESUMPTION_TICKET).data)
+    client.close()
+
+    elsewhere = type(server.tickets)(60)
+    elsewhere.redeem(ticket[0])
+    server.shard.inbox.append((sharding.TICKETS_REDEEMED, 1, (elsewhere.takeRedeemed(),)))
+    server.handleShardMessages()
+
+    again = login(server, ticket=ticket)
+    assert again.handshakeComplete
+    assert again.authStr != "Resuming session"
+    again.close()
+
+
+def test_wrongPassword(server):
+    client = login(server, password='wrong')
+
+    assert not client.handshakeComplete
+    assert runUntil(server.eventLoop, lambda: not server.cache.authenticated and not server.cache.unauthenticated)
+
+
+def test_resume(server):
+    client = login(server)
+    ticket = tuple(receive(server.eventLoop, client, CryptoMessage.RESUMPTION_TICKET).data)
+    client.close()
+
+    resumed = login(server, ticket=ticket)
+    assert resumed.handshakeComplete
+    assert resumed.authStr == "Resuming session"
+
+    # The resumed session can talk to the server
+    resumed.write(action=CryptoMessage.CACHE_RESUME, data=(None, None, None, []), flags=0)
+    assert receive(server.eventLoop, resumed, CryptoMessage.CACHE_REFRESH) is not None
+    resumed.close()
+
+    # A ticket can only be redeemed once; presenting it again falls back to the full handshake
+    again = login(server, ticket=ticket)
+    assert again.handshakeComplete
+    assert again.authStr != "Resuming session"
+    again.close()
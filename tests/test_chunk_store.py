@@ -0,0 +1,156 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import pytest
+
+pytest.importorskip('kimchi')
+
+# Project imports
+from utils.file_metadata import FileMetadata
+from utils.transfer.chunk_store import ChunkStore, Manifest, chunkHash
+from utils.transfer.upload import ChunkUpload
+
+CHUNK_SIZE = 4
+CONTENTS = b'abcdabcdefghij'
+
+
+def chunks(contents):
+    return [contents[offset:offset + CHUNK_SIZE] for offset in range(0, len(contents), CHUNK_SIZE)]
+
+
+def upload(store, contents, transferID=1):
+    """ Uploads a file into a store, returning the ChunkUpload and the indices of the chunks it asked for. """
+
+    metadata = FileMetadata('name', len(contents), None, None, True)
+    transfer = ChunkUpload(transferID, store, metadata, CHUNK_SIZE, [chunkHash(chunk) for chunk in chunks(contents)])
+    asked = sorted(transfer.missing)
+
+    for index in asked:
+        transfer.write(index, chunks(contents)[index])
+
+    assert transfer.complete
+    return transfer, asked
+
+
+def read(store, path):
+    reader = store.open(path)
+    buffer = bytearray(reader.size)
+    try:
+        assert reader.readinto(0, buffer) == reader.size
+
+    finally:
+        reader.close()
+
+    return bytes(buffer)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkStore(str(tmp_path / 'store'))
+
+
+def test_put(store):
+    digest = chunkHash(b'abcd')
+    assert not store.has(digest)
+
+    store.put(digest, b'abcd')
+    store.put(digest, b'abcd')
+    assert store.has(digest)
+
+    with pytest.raises(ValueError):
+        store.put(digest, b'abce')
+
+
+def test_upload(store):
+    transfer, asked = upload(store, CONTENTS)
+
+    # The repeated first chunk is only asked for once
+    assert asked == [0, 2, 3]
+
+    metadata = transfer.finish()
+    assert store.isManifest(metadata.path)
+    assert metadata.digest == transfer.manifest.digest
+    assert read(store, metadata.path) == CONTENTS
+
+
+def test_uploadOnlyWhatsMissing(store):
+    upload(store, CONTENTS)[0].finish()
+
+    # Only the chunks the store doesn't already have are asked for
+    transfer, asked = upload(store, b'efghabcdxy', 2)
+    assert asked == [2]
+    assert read(store, transfer.finish().path) == b'efghabcdxy'
+
+
+def test_rejectMalformedUploads(store):
+    metadata = FileMetadata('name', len(CONTENTS), None, None, True)
+    hashes = [chunkHash(chunk) for chunk in chunks(CONTENTS)]
+
+    with pytest.raises(ValueError):
+        ChunkUpload(1, store, metadata, CHUNK_SIZE, hashes[:-1])
+    with pytest.raises(ValueError):
+        ChunkUpload(1, store, metadata, CHUNK_SIZE, hashes[:-1] + [b'short'])
+
+    transfer = ChunkUpload(1, store, metadata, CHUNK_SIZE, hashes)
+    with pytest.raises(ValueError):
+        transfer.write(1, b'abcd')
+    with pytest.raises(ValueError):
+        transfer.write(3, b'ijk')
+    with pytest.raises(ValueError):
+        transfer.write(3, b'xy')
+    assert not transfer.complete
+
+
+def test_manifest():
+    manifest = Manifest(len(CONTENTS), CHUNK_SIZE, [chunkHash(chunk) for chunk in chunks(CONTENTS)])
+    parsed = Manifest.fromString(manifest.toString())
+
+    assert (parsed.size, parsed.chunkSize, parsed.hashes) == (manifest.size, manifest.chunkSize, manifest.hashes)
+    assert parsed.digest == manifest.digest
+
+    with pytest.raises(ValueError):
+        Manifest.fromString(manifest.toString()[:-Manifest.DIGEST_SIZE])
+
+
+def test_collectGarbage(store):
+    kept = upload(store, CONTENTS)[0].finish()
+    dropped = upload(store, b'abcdwxyz', 2)[0].finish()
+    store.put(chunkHash(b'pinned'), b'pinned')
+
+    manifests, removed, freed = store.collectGarbage([kept.path], pinned=[chunkHash(b'pinned')])
+
+    # Only the chunk of the dropped file which the kept file doesn't share is removed
+    assert (manifests, removed, freed) == (1, 1, 4)
+    assert not os.path.exists(dropped.path)
+    assert not store.has(chunkHash(b'wxyz'))
+    assert store.has(chunkHash(b'pinned'))
+    assert read(store, kept.path) == CONTENTS
+
+
+def test_collectGarbageSparesOpenFiles(store):
+    metadata = upload(store, CONTENTS)[0].finish()
+    reader = store.open(metadata.path)
+
+    assert store.collectGarbage([]) == (0, 0, 0)
+
+    reader.close()
+    assert store.collectGarbage([])[:2] == (1, 3)
@@ -0,0 +1,68 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import os
+import time
+import select
+import pytest
+
+# Project imports
+from utils import engines
+
+ENGINES = [name for name in ('epoll', 'poll') if hasattr(select, name)]
+
+
+@pytest.fixture(params=ENGINES)
+def engine(request):
+    engine = engines.getEngine(request.param)
+    yield engine
+    engine.close()
+
+
+@pytest.fixture
+def pipe():
+    readEnd, writeEnd = os.pipe()
+    yield readEnd, writeEnd
+    os.close(readEnd)
+    os.close(writeEnd)
+
+
+def test_readiness(engine, pipe):
+    readEnd, writeEnd = pipe
+    engine.register(readEnd, engines.EVENT_READ)
+
+    assert engine.poll(0) == []
+
+    os.write(writeEnd, b'x')
+    assert engine.poll(1) == [(readEnd, engines.EVENT_READ)]
+
+    engine.unregister(readEnd)
+    assert engine.poll(0) == []
+
+
+def test_shortTimeoutsWait(engine, pipe):
+    readEnd, writeEnd = pipe
+    engine.register(readEnd, engines.EVENT_READ)
+
+    # A deadline less than a millisecond away is waited for, rather than polled for until it passes
+    start = time.time()
+    assert engine.poll(.0002) == []
+    assert time.time() - start >= .0002
@@ -0,0 +1,67 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import pytest
+
+# Project imports
+from utils.crypto import frame
+
+NONCE = frame.nonce(7)
+TAG = b't' * 16
+
+
+def test_sessionFrame():
+    kind, nonce, tag, ciphertext, groupID, epoch = frame.unpack(frame.pack(NONCE, TAG, b'ciphertext'))
+
+    assert (kind, nonce, tag, bytes(ciphertext)) == (frame.KIND_SESSION, NONCE, TAG, b'ciphertext')
+    assert groupID is None and epoch is None
+
+
+def test_groupFrame():
+    kind, nonce, tag, ciphertext, groupID, epoch = frame.unpack(frame.pack(NONCE, TAG, b'ciphertext', 12, 3))
+
+    assert (kind, nonce, tag, bytes(ciphertext)) == (frame.KIND_GROUP, NONCE, TAG, b'ciphertext')
+    assert (groupID, epoch) == (12, 3)
+
+
+def test_emptyCiphertext():
+    assert bytes(frame.unpack(frame.pack(NONCE, TAG, b''))[3]) == b''
+
+
+@pytest.mark.parametrize('malformed', [
+    b'',
+    frame.pack(NONCE, TAG, b'')[:-1],
+    # Header lengths longer than the frame, and shorter than a header
+    bytes(bytearray([255])) + frame.pack(NONCE, TAG, b'ciphertext')[1:],
+    bytes(bytearray([0])) + frame.pack(NONCE, TAG, b'ciphertext')[1:],
+    # Group frames too short to hold a group ID and epoch, though there's ciphertext enough to read them from
+    frame.pack(NONCE, TAG, b'ciphertext')[:1] + frame.pack(NONCE, TAG, b'ciphertext', 12, 3)[1:30] + b'c' * 20,
+], ids=['empty', 'truncated', 'longHeader', 'shortHeader', 'shortGroupHeader'])
+def test_rejectMalformedFrames(malformed):
+    with pytest.raises(ValueError):
+        frame.unpack(malformed)
+
+
+def test_negotiate():
+    assert frame.negotiate(None) == frame.PROTOCOL_KIMCHI
+    assert frame.negotiate([frame.PROTOCOL_KIMCHI]) == frame.PROTOCOL_KIMCHI
+    assert frame.negotiate(frame.SUPPORTED_PROTOCOLS) == max(frame.SUPPORTED_PROTOCOLS)
+    assert frame.negotiate([99]) == frame.PROTOCOL_KIMCHI
@@ -0,0 +1,64 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import pytest
+
+pytest.importorskip('kimchi')
+pytest.importorskip('Cryptodome')
+
+# Project imports
+from utils.message import CryptoMessage
+from utils.crypto import frame
+from utils.crypto.group_key import GroupKey
+from utils.crypto.rsa_aes import RSA_AES
+
+
+def member(roomKey, protocol):
+    """ Returns the RSA_AES of a member of a room speaking the given protocol, holding the room's key. """
+
+    encryptor = RSA_AES()
+    encryptor.protocol = protocol
+    encryptor.registerGroupKey(*roomKey.export())
+    return encryptor
+
+
+@pytest.mark.parametrize('protocol', frame.SUPPORTED_PROTOCOLS, ids=['kimchi', 'binary'])
+def test_roomMessage(protocol):
+    roomKey = GroupKey(7, 1)
+    plaintext = CryptoMessage(sender_id=1, recipient_id=7, action=CryptoMessage.MESSAGE, data='hello').toString()
+
+    # Every message to the room is encrypted with a fresh nonce, and every member can read it
+    first, second = roomKey.encrypt(plaintext, protocol), roomKey.encrypt(plaintext, protocol)
+    assert first != second
+
+    for encrypted in (first, second):
+        message = CryptoMessage(member(roomKey, protocol).decrypt(encrypted))
+        assert (message.sender_id, message.recipient_id, message.data) == (1, 7, 'hello')
+
+
+@pytest.mark.parametrize('protocol', frame.SUPPORTED_PROTOCOLS, ids=['kimchi', 'binary'])
+def test_otherEpochsCannotDecrypt(protocol):
+    roomKey = GroupKey(7, 1)
+    stale = member(roomKey, protocol)
+    rekeyed = GroupKey(7, 2)
+
+    with pytest.raises(ValueError):
+        stale.decrypt(rekeyed.encrypt(b'secret', protocol))
@@ -0,0 +1,68 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import sys
+import time
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip("The crypto pool requires asyncio", allow_module_level=True)
+
+import asyncio
+
+# Project imports
+from utils.crypto.offload import CryptoPool
+
+
+@pytest.fixture
+def loop():
+    # The pool's semaphore belongs to the event loop current when it's created, as with the server's
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def test_run(loop):
+    pool = CryptoPool(1, 1)
+    try:
+        assert loop.run_until_complete(pool.run(pow, 2, 10)) == 1024
+        assert pool.stats()['jobs'] == 1 and pool.stats()['depth'] == 0
+
+    finally:
+        pool.close()
+
+
+def test_waitAndRunTimesAreSeparate(loop):
+    pool = CryptoPool(1, 1)
+    try:
+        # With a single slot, the second and third jobs wait for one and two jobs' worth of running respectively
+        jobs = [pool.run(time.sleep, .1) for _ in range(3)]
+        loop.run_until_complete(asyncio.gather(*jobs))
+        stats = pool.stats()
+
+        assert stats['jobs'] == 3 and stats['maxDepth'] == 3
+        assert stats['runTime'] >= .3
+        assert stats['waitTime'] >= .25
+
+    finally:
+        pool.close()
@@ -0,0 +1,108 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import pytest
+
+pytest.importorskip('kimchi')
+pytest.importorskip('Cryptodome')
+
+# Project imports
+from utils.crypto import resumption
+
+
+def test_redeem():
+    issuer = resumption.TicketIssuer(60)
+    ticket, secret = issuer.issue()
+
+    assert issuer.redeem(ticket) == secret
+
+
+def test_redeemOnlyOnce():
+    issuer = resumption.TicketIssuer(60)
+    ticket, secret = issuer.issue()
+
+    assert issuer.redeem(ticket) == secret
+    assert issuer.redeem(ticket) is None
+
+
+def test_redeemWithAnyWorker():
+    # Workers share a key, so a ticket issued by one can be redeemed with another
+    first = resumption.TicketIssuer(60)
+    second = resumption.TicketIssuer(60)
+    ticket, secret = first.issue()
+
+    assert second.redeem(ticket) == secret
+
+
+def test_redemptionsArePassedOn():
+    first = resumption.TicketIssuer(60)
+    second = resumption.TicketIssuer(60)
+    ticket, secret = first.issue()
+    other, otherSecret = first.issue()
+
+    assert second.redeem(ticket) == secret
+    redeemed = second.takeRedeemed()
+    assert second.takeRedeemed() == []
+
+    # Once told of the redemption, the other worker refuses the ticket, but not the others it issued
+    first.markRedeemed(redeemed)
+    assert first.redeem(ticket) is None
+    assert first.redeem(other) == otherSecret
+
+    # A worker which starts later learns of every redemption still in force
+    restarted = resumption.TicketIssuer(60)
+    restarted.markRedeemed(first.allRedeemed())
+    assert restarted.redeem(ticket) is None
+    assert restarted.redeem(other) is None
+
+
+def test_refuseExpiredTickets(monkeypatch):
+    issuer = resumption.TicketIssuer(60)
+    ticket, secret = issuer.issue()
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert issuer.redeem(ticket) is None
+
+
+def test_refuseForgedTickets():
+    issuer = resumption.TicketIssuer(60)
+    ticket, secret = issuer.issue()
+
+    assert issuer.redeem(b'nonsense') is None
+    assert issuer.redeem(ticket[:-1] + bytes(bytearray([ticket[-1] ^ 1]))) is None
+    assert issuer.redeem(ticket) == secret
+
+
+def test_forgetExpiredRedemptions(monkeypatch):
+    issuer = resumption.TicketIssuer(60)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+
+    for _ in range(10):
+        ticket, secret = issuer.issue()
+        issuer.redeem(ticket)
+    assert len(issuer.redeemed) == len(issuer.expiries) == 10
+
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    issuer.redeem(issuer.issue()[0])
+    assert len(issuer.redeemed) == len(issuer.expiries) == 1
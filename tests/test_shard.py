@@ -0,0 +1,86 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import multiprocessing
+import pytest
+
+pytest.importorskip('kimchi')
+pytest.importorskip('Cryptodome')
+
+# Project imports
+from utils import shard
+
+
+class FakeProcess(object):
+    """ Stands in for a worker process, recording the ShardLink it would have run with. """
+
+    pid = 0
+
+    def __init__(self, target, args):
+        self.link = args[1]
+
+    def start(self):
+        pass
+
+
+def test_uniqueIDsIdentifyTheirWorker():
+    links = [shard.ShardLink(index, 3, None) for index in range(3)]
+
+    for link in links:
+        for count in range(1, 50):
+            assert link.workerOf(link.uniqueID(count)) == link.workerIndex
+
+
+def test_restartedWorkersNeverReissueIDs():
+    allocated = set()
+
+    # Every generation of every worker starts counting from 1 again
+    for generation in range(4):
+        for index in range(3):
+            link = shard.ShardLink(index, 3, None, generation)
+            ids = set(link.uniqueID(count) for count in range(1, 200))
+            assert not ids & allocated
+            allocated |= ids
+
+
+def test_supervisorAdvancesGenerations(monkeypatch):
+    monkeypatch.setattr(multiprocessing, 'Process', FakeProcess)
+
+    supervisor = shard.Supervisor(object, 2)
+    try:
+        supervisor.spawn(0)
+        supervisor.spawn(1)
+        first = supervisor.processes[0].link
+
+        # Restart the first worker, as workerLost does
+        supervisor.engine.unregister(supervisor.conns[0].fileno())
+        supervisor.conns[0].close()
+        supervisor.spawn(0)
+        second = supervisor.processes[0].link
+
+        assert (first.generation, second.generation) == (0, 1)
+        assert supervisor.processes[1].link.generation == 0
+        assert first.uniqueID(1) != second.uniqueID(1)
+
+    finally:
+        for conn in supervisor.conns:
+            conn.close()
+        supervisor.engine.close()
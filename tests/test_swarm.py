@@ -0,0 +1,55 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Project imports
+from utils.transfer.swarm import SwarmScheduler
+
+
+def test_chunksAreOnlyExpectedFromTheirPeer():
+    scheduler = SwarmScheduler(4, window=2)
+    scheduler.addPeer('a', now=0)
+    scheduler.addPeer('b', now=0)
+    assignments = scheduler.schedule(0)
+
+    for userID, indices in assignments.items():
+        other = 'b' if userID == 'a' else 'a'
+        for index in indices:
+            assert scheduler.requestedFrom(userID, index)
+            assert not scheduler.requestedFrom(other, index)
+            assert not scheduler.requestedFrom(None, index)
+
+
+def test_chunksAreNoLongerExpectedOnceReceived():
+    scheduler = SwarmScheduler(1)
+    scheduler.addPeer('a', now=0)
+    scheduler.schedule(0)
+
+    assert scheduler.requestedFrom('a', 0)
+    assert scheduler.received('a', 0, 10, 1)
+    assert not scheduler.requestedFrom('a', 0)
+
+
+def test_chunksAreNoLongerExpectedFromRemovedPeers():
+    scheduler = SwarmScheduler(1)
+    scheduler.addPeer('a', now=0)
+    scheduler.schedule(0)
+    scheduler.removePeer('a')
+
+    assert not scheduler.requestedFrom('a', 0)
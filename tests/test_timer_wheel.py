@@ -0,0 +1,135 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Standard imports
+import time
+import random
+import pytest
+
+# Project imports
+from utils.timer_wheel import TimerWheel
+
+
+class Clock(object):
+    """ Stands in for time.time, so that the wheel can be advanced through time without waiting. """
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+
+def test_expireAfterDeadline(clock):
+    wheel = TimerWheel(resolution=.1)
+    fired = []
+    wheel.schedule(1, fired.append, 'a')
+
+    clock.now += .95
+    assert wheel.advance() == 0 and fired == []
+
+    clock.now += .1
+    assert wheel.advance() == 1 and fired == ['a']
+    assert len(wheel) == 0
+
+
+def test_cancel(clock):
+    wheel = TimerWheel()
+    fired = []
+    timer = wheel.schedule(1, fired.append, 'a')
+    wheel.schedule(1, fired.append, 'b')
+
+    timer.cancel()
+    timer.cancel()
+    assert not timer.armed and len(wheel) == 1
+
+    clock.now += 2
+    wheel.advance()
+    assert fired == ['b']
+
+
+def test_reschedule(clock):
+    wheel = TimerWheel()
+    fired = []
+    timer = wheel.schedule(1, fired.append, 'a')
+
+    clock.now += .5
+    wheel.reschedule(timer, 1)
+    clock.now += .6
+    wheel.advance()
+    assert fired == [] and timer.armed
+
+    clock.now += .5
+    wheel.advance()
+    assert fired == ['a'] and not timer.armed
+
+
+def test_expireInOrderAcrossLevels(clock):
+    wheel = TimerWheel(resolution=1)
+    fired = []
+    start = clock.now
+
+    # Spread deadlines over every level of the wheel, and beyond it into the overflow slot
+    rng = random.Random(4)
+    delays = [rng.randint(1, wheel.SLOTS ** (level + 1)) for level in range(wheel.LEVELS + 1) for _ in range(50)]
+    for delay in delays:
+        wheel.schedule(delay, fired.append, delay)
+    assert len(wheel) == len(delays)
+
+    # Every timer expires on the tick of its deadline, however far the wheel is advanced at once
+    for now in sorted(set(delays + [rng.randint(1, max(delays)) for _ in range(100)])):
+        clock.now = start + now
+        wheel.advance()
+        assert sorted(fired) == sorted(delay for delay in delays if delay <= now)
+
+    assert len(wheel) == 0
+
+
+def test_failingCallbacks(clock):
+    wheel = TimerWheel()
+    fired = []
+
+    def fail():
+        raise ValueError()
+
+    wheel.schedule(1, fail)
+    wheel.schedule(1, fired.append, 'a')
+
+    clock.now += 2
+    assert wheel.advance() == 2
+    assert fired == ['a']
+
+
+def test_nextTimeout(clock):
+    wheel = TimerWheel(resolution=.1)
+    assert wheel.nextTimeout() is None
+
+    wheel.schedule(5, lambda: None)
+    assert 0 < wheel.nextTimeout() < 5.1
+
+    clock.now += 10
+    assert wheel.nextTimeout() == 0
@@ -0,0 +1,110 @@
+"""
+    Copyright (C) 2016 Warren Spencer warrenspencer27@gmail.com
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Warren Spencer
+    Email:  warrenspencer27@gmail.com
+"""
+
+# Project imports
+from utils.trigram import TrigramIndex
+
+
+def index(*names):
+    trigrams = TrigramIndex()
+    for name in names:
+        trigrams.add(name, name)
+    return trigrams
+
+
+def keys(results):
+    return [key for key, name, position in results]
+
+
+def test_substring():
+    trigrams = index('Holiday Photos', 'photograph', 'notes')
+
+    assert sorted(keys(trigrams.search('PHOTO'))) == ['Holiday Photos', 'photograph']
+    assert keys(trigrams.search('tes')) == ['notes']
+    assert keys(trigrams.search('missing')) == []
+
+
+def test_prefix():
+    trigrams = index('Holiday Photos', 'photograph')
+
+    assert keys(trigrams.search('photo', prefix=True)) == ['photograph']
+    assert keys(trigrams.search('hol', prefix=True)) == ['Holiday Photos']
+
+
+def test_prefixMatchesFirst():
+    trigrams = index('a photo', 'photo', 'my photo')
+
+    assert keys(trigrams.search('photo'))[0] == 'photo'
+
+
+def test_prefixMatchesAreWholePrefixes():
+    # Beginning with the first two characters of the text doesn't make a name a prefix match
+    trigrams = index('abxabc', 'abyabc', 'abzabc', 'xabc', 'abcd')
+
+    results = keys(trigrams.search('abc'))
+    assert results[0] == 'abcd'
+    assert sorted(results[1:]) == ['abxabc', 'abyabc', 'abzabc', 'xabc']
+
+    assert keys(trigrams.search('abc', prefix=True)) == ['abcd']
+
+
+def test_positions():
+    trigrams = index('Holiday Photos')
+
+    assert list(trigrams.search('photos')) == [('Holiday Photos', 'holiday photos', 8)]
+
+
+def test_shortText():
+    trigrams = index('xa', 'ab', 'ba', 'bab', 'c')
+
+    results = list(trigrams.search('a'))
+    assert sorted(keys(results)) == ['ab', 'ba', 'bab', 'xa']
+    assert keys(results)[0] == 'ab'
+
+    assert keys(trigrams.search('a', prefix=True)) == ['ab']
+    assert sorted(keys(trigrams.search('ba', prefix=True))) == ['ba', 'bab']
+
+
+def test_shortNames():
+    trigrams = index('a', 'b', 'abc')
+
+    assert sorted(keys(trigrams.search('a'))) == ['a', 'abc']
+    assert sorted(keys(trigrams.search('a', prefix=True))) == ['a', 'abc']
+    assert keys(trigrams.search('b', prefix=True)) == ['b']
+
+
+def test_remove():
+    trigrams = index('photo', 'a')
+    trigrams.remove('photo')
+    trigrams.remove('a')
+    trigrams.remove('missing')
+
+    assert len(trigrams) == 0
+    assert keys(trigrams.search('photo')) == []
+    assert keys(trigrams.search('a')) == []
+    assert not trigrams.postings
+
+
+def test_replace():
+    trigrams = index('photo')
+    trigrams.add('photo', 'renamed')
+
+    assert keys(trigrams.search('photo')) == []
+    assert keys(trigrams.search('renamed')) == ['photo']